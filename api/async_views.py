@@ -0,0 +1,336 @@
+"""
+Async versions of the image and login views for ASGI deployments.
+
+Under ASGI the synchronous DRF views run through Django's thread-sensitive
+sync bridge, so a slow upload holds up every other request of the worker.
+These views run on the event loop instead: they query with the async ORM,
+stream lists with async iteration and push the blocking work (multipart
+parsing, file writes, cache round trips, password hashing) into worker
+threads and pools.
+
+They are routed by multi_user_app.asgi_urls, which multi_user_app.asgi
+selects; the WSGI deployment keeps using api.views.
+"""
+import asyncio
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, PermissionDenied
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from api.authentication import aget_user, atoken_user, unknown_usernames
+from api.hashing import password_needs_upgrade, submit_password_check
+from api.models import Image, RolePermission, User
+from api.fastpath import json_response
+from api.permissions import RoleBasedPermission, ahas_permission
+from api.processing import hash_file
+from api.serializers import ImageSerializer
+from api.similarity import check_duplicate
+from api.tasks import enqueue_image_processing
+from api.throttling import check_login_rate
+from api.utils import access_claims, check_access, encode_refresh_token, encode_token
+from api.versioning import aconditional_get
+from api.views import fieldset_key, image_list_page, image_list_query
+
+
+async def aget_request_user(request) -> User:
+    """
+    Authenticates the request and attaches the resolved user to it.
+
+    Token verification is CPU only and cached by api.utils.decode_token, so it
+    runs inline; the user is only looked up when the token's user claims are
+    missing or stale.
+
+    Args:
+        request: The HTTP request.
+
+    Returns:
+        User: The authenticated user, with role and subscription plan loaded.
+    """
+    claims = access_claims(request.headers)
+    user = await atoken_user(claims) or await aget_user(claims['username'])
+    request.user = user
+    return user
+
+
+async def aauthorize(request, resource: str, action: str) -> User:
+    """
+    Authenticates the request and checks the user's role may perform an action, like RoleBasedPermission.
+
+    Args:
+        request: The HTTP request.
+        resource (str): A RolePermission.Resource value.
+        action (str): A RolePermission.Action value.
+
+    Returns:
+        User: The authenticated user.
+
+    Raises:
+        PermissionDenied: If the user's role is not granted the action.
+    """
+    user = await aget_request_user(request)
+    if not await ahas_permission(user, resource, action):
+        raise PermissionDenied(RoleBasedPermission.message)
+    return user
+
+
+def parse_body(request) -> dict:
+    """
+    Parses a request body with the parsers the DRF views use, so both deployments accept the same content types.
+
+    Multipart and form bodies are read from the request here, so call it off the event loop.
+
+    Args:
+        request: The HTTP request.
+
+    Returns:
+        dict: The parsed body, with any uploaded files.
+
+    Raises:
+        ParseError: If the body is malformed.
+        UnsupportedMediaType: If no parser accepts its content type.
+    """
+    return Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES]).data
+
+
+class AsyncAPIView(View):
+    """
+    Base class for async views.
+
+    API errors raised by a handler, such as AuthenticationFailed, are returned
+    as JSON with their status code the way DRF would, and the view is exempt
+    from CSRF checks like DRF's APIView.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            response = JsonResponse({'detail': exc.detail}, status=exc.status_code)
+            if isinstance(exc, AuthenticationFailed):
+                response['WWW-Authenticate'] = 'Bearer'
+            if getattr(exc, 'wait', None):
+                response['Retry-After'] = str(math.ceil(exc.wait))
+            return response
+
+
+class AsyncLoginView(AsyncAPIView):
+    async def post(self, request):
+        """
+        Handles user login.
+
+        Rate limits and the unknown username cache apply as in api.views, and
+        the password is verified in the login pool of api.hashing, so hashing
+        never blocks the event loop.
+
+        Args:
+            request: The HTTP request.
+
+        Returns:
+            JsonResponse: A JsonResponse with JWT access and refresh tokens.
+        """
+        data = await sync_to_async(parse_body, thread_sensitive=False)(request)
+        username = data.get('username')
+        password = data.get('password')
+
+        # Cache round trips; kept off the event loop like the password check.
+        await sync_to_async(check_login_rate, thread_sensitive=False)(request, username)
+
+        if await unknown_usernames.aget(username):
+            raise AuthenticationFailed('User not found!')
+
+        user = await User.objects.filter(username=username).afirst()
+
+        if user is None:
+            await unknown_usernames.aset(username)
+            raise AuthenticationFailed('User not found!')
+
+        if not await asyncio.wrap_future(submit_password_check(password, user.password)):
+            raise AuthenticationFailed('Incorrect password!')
+
+        if password_needs_upgrade(user.password):
+            await sync_to_async(user.set_password, thread_sensitive=False)(password)
+            await user.asave(update_fields=['password'])
+
+        token = await sync_to_async(encode_token, thread_sensitive=False)(user)
+
+        response = JsonResponse({'jwt': token, 'refresh': encode_refresh_token(user)})
+        response.set_cookie(key='jwt', value=token, httponly=True)
+        return response
+
+
+class AsyncImageListView(AsyncAPIView):
+    async def get(self, request):
+        """
+        Retrieves a page of images ordered by id.
+
+        The page is built by api.views.image_list_page, on the thread Django's
+        sync code shares, so filters, fieldsets, cursors,
+        FAST_LIST_SERIALIZATION and the body are those of
+        api.views.ImageListView.
+        ``?stream=1`` streams every image as one JSON array instead.
+
+        Args:
+            request: The HTTP request.
+
+        Returns:
+            HttpResponse: A page of image data, or a StreamingHttpResponse when streaming.
+        """
+        if request.GET.get('mine') in ('1', 'true'):
+            user = await aget_request_user(request)
+        else:
+            user = None
+            check_access(request.headers)
+        images, fields = image_list_query(request.GET, user)
+        if request.GET.get('stream') in ('1', 'true'):
+            return StreamingHttpResponse(self.stream(images, fields), content_type='application/json')
+
+        fast = getattr(settings, 'FAST_LIST_SERIALIZATION', False)
+        data = await sync_to_async(image_list_page)(Request(request), images, fields, fast)
+        # Rendered as JSONRenderer renders the sync view's page.
+        return json_response(data)
+
+    async def stream(self, images, fields):
+        yield '['
+        separator = ''
+        async for image in images.aiterator(chunk_size=getattr(settings, 'IMAGE_STREAM_CHUNK_SIZE', 500)):
+            yield separator + json.dumps(ImageSerializer(image, fields=fields).data, cls=DjangoJSONEncoder)
+            separator = ','
+        yield ']'
+
+    async def post(self, request):
+        """
+        Handles the upload of a new image.
+
+        Parsing the multipart body, hashing and writing the file happen in
+        threads of their own; only the queries run on the thread shared by
+        Django's sync code. Thumbnails are generated in the background as
+        for api.views.
+
+        Args:
+            request: The HTTP request.
+
+        Returns:
+            JsonResponse: The image id and processing status, or an error message.
+        """
+        await aauthorize(request, RolePermission.Resource.IMAGE, RolePermission.Action.CREATE)
+        data, value = await sync_to_async(self.receive, thread_sensitive=False)(request)
+        serializer = ImageSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        image_file = serializer.validated_data.get('image_file')
+        phash = None
+        if image_file:
+            phash = await sync_to_async(check_duplicate)(image_file, value)
+            await sync_to_async(self.stage, thread_sensitive=False)(image_file)
+        image = await sync_to_async(self.save)(serializer, phash)
+        return JsonResponse({'id': image.id, 'status': image.status}, status=status.HTTP_202_ACCEPTED)
+
+    def receive(self, request) -> tuple:
+        # Parses the body and hashes the upload for check_duplicate, which only searches the index then.
+        data = parse_body(request)
+        image_file = data.get('image_file')
+        value = None
+        if image_file and getattr(settings, 'IMAGE_DUPLICATE_DISTANCE', None) is not None:
+            try:
+                value = hash_file(image_file)
+            except OSError:
+                pass  # Rejected by the serializer.
+            image_file.seek(0)
+        return data, value
+
+    def stage(self, image_file):
+        # Writes the blob so that saving the image only records it.
+        field = Image._meta.get_field('image_file')
+        if hasattr(field.storage, 'stage'):
+            field.storage.stage(field.generate_filename(None, image_file.name), image_file)
+
+    def save(self, serializer, phash) -> Image:
+        image = serializer.save(phash=phash)
+        enqueue_image_processing(image)
+        return image
+
+
+class AsyncImageDetailsView(AsyncAPIView):
+    async def get(self, request, id: int):
+        """
+        Retrieves details of a specific image.
+
+        Args:
+            request: The HTTP request.
+            id: The ID of the image.
+
+        Returns:
+            HttpResponse: Image data, 304 if the client's copy is current, or error message.
+        """
+        check_access(request.headers)
+        fields = ImageSerializer.requested_fields(request.GET)
+
+        async def retrieve():
+            images = Image.objects.all()
+            if fields is not None:
+                images = images.only(*ImageSerializer.model_fields(fields))
+            try:
+                image = await images.aget(id=id)
+            except Image.DoesNotExist:
+                return JsonResponse("Image does not exist", status=status.HTTP_404_NOT_FOUND, safe=False)
+            return JsonResponse(ImageSerializer(image, fields=fields).data)
+
+        return await aconditional_get(request, Image, retrieve, key=fieldset_key(id, fields))
+
+    async def put(self, request, id: int):
+        """
+        Updates details of a specific image.
+
+        The body is parsed as by api.views.ImageDetailsView, off the event loop.
+
+        Args:
+            request: The HTTP request.
+            id: The ID of the image.
+
+        Returns:
+            JsonResponse: Updated image data or error message.
+        """
+        await aauthorize(request, RolePermission.Resource.IMAGE, RolePermission.Action.UPDATE)
+        try:
+            image = await Image.objects.aget(id=id)
+        except Image.DoesNotExist:
+            return JsonResponse("Image does not exist", status=status.HTTP_404_NOT_FOUND, safe=False)
+
+        data = await sync_to_async(parse_body, thread_sensitive=False)(request)
+        serializer = ImageSerializer(image, data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        await sync_to_async(serializer.save)()
+        return JsonResponse(serializer.data)
+
+    async def delete(self, request, id: int):
+        """
+        Deletes a specific image.
+
+        Args:
+            request: The HTTP request.
+            id: The ID of the image.
+
+        Returns:
+            JsonResponse: A JsonResponse indicating success or failure.
+        """
+        await aauthorize(request, RolePermission.Resource.IMAGE, RolePermission.Action.DELETE)
+        try:
+            image = await Image.objects.aget(id=id)
+        except Image.DoesNotExist:
+            return JsonResponse("Image does not exist", status=status.HTTP_404_NOT_FOUND, safe=False)
+        if await image.adelete():
+            return JsonResponse({'data': 'deleted successfully'})
+        return JsonResponse({'data': 'delete failed'})
@@ -0,0 +1,227 @@
+import hashlib
+
+from django.conf import settings
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from api.cache import LRUCache
+from api.cache_backends import shared_cache
+from api.models import User
+from api.utils import decode_token, get_token
+from api.versioning import aget_version, get_version
+
+# Short-lived cache of resolved users keyed by username. Entries are dropped by
+# the signal handlers in api.signals whenever a user, role or plan changes.
+# Setting USER_CACHE_TTL to 0 disables it.
+user_cache = LRUCache(
+    maxsize=getattr(settings, 'USER_CACHE_SIZE', 1000),
+    ttl=getattr(settings, 'USER_CACHE_TTL', 30),
+)
+
+
+class UnknownUsernames:
+    """
+    Usernames recently found not to exist, so repeated logins for them are answered without a query.
+
+    Entries live in the shared cache, so a username created by one worker is
+    forgotten by all of them at once; api.signals and the bulk registration
+    view drop it. Setting LOGIN_NEGATIVE_CACHE_TTL to 0 disables it.
+    """
+
+    def _key(self, username) -> str:
+        # Usernames may contain characters cache backends warn about.
+        return 'api:unknown-user:' + hashlib.sha256(str(username).encode('utf-8')).hexdigest()
+
+    def _ttl(self) -> int:
+        return getattr(settings, 'LOGIN_NEGATIVE_CACHE_TTL', 60)
+
+    def get(self, username) -> bool:
+        """
+        Tells whether a username was recently found not to exist.
+
+        Args:
+            username: The username.
+
+        Returns:
+            bool: True if it is remembered as unknown.
+        """
+        return bool(self._ttl()) and shared_cache().get(self._key(username), False)
+
+    async def aget(self, username) -> bool:
+        """
+        Async version of get.
+
+        Args:
+            username: The username.
+
+        Returns:
+            bool: True if it is remembered as unknown.
+        """
+        return bool(self._ttl()) and await shared_cache().aget(self._key(username), False)
+
+    def set(self, username):
+        """
+        Remembers a username as unknown for LOGIN_NEGATIVE_CACHE_TTL seconds.
+
+        Args:
+            username: The username.
+        """
+        if self._ttl():
+            shared_cache().set(self._key(username), True, self._ttl())
+
+    async def aset(self, username):
+        """
+        Async version of set.
+
+        Args:
+            username: The username.
+        """
+        if self._ttl():
+            await shared_cache().aset(self._key(username), True, self._ttl())
+
+    def delete(self, username):
+        """
+        Forgets a username, e.g. once it has been created.
+
+        Args:
+            username: The username.
+        """
+        shared_cache().delete(self._key(username))
+
+
+unknown_usernames = UnknownUsernames()
+
+
+def _claims_user(claims: dict) -> User:
+    values = {
+        'id': claims['uid'],
+        'username': claims['username'],
+        'role_id': claims['role'],
+        'subscription_plan_id': claims['plan'],
+        'is_superuser': claims['su'],
+    }
+    # Built like a deferred query result, so other fields load on access and
+    # saving it only writes the fields above.
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(None, names, [values[name] for name in names])
+
+
+def token_user(claims: dict) -> User:
+    """
+    Builds the user from the claims embedded by api.utils.user_claims, without a query.
+
+    Args:
+        claims (dict): Verified access token claims.
+
+    Returns:
+        User: The user with its id, username, role, plan and superuser flag,
+        or None if the token has no user claims or the user changed since it was issued.
+    """
+    if 'ver' not in claims or get_version(User, claims['uid'])[0] != claims['ver']:
+        return None
+    return _claims_user(claims)
+
+
+async def atoken_user(claims: dict) -> User:
+    """
+    Async version of token_user.
+
+    Args:
+        claims (dict): Verified access token claims.
+
+    Returns:
+        User: The user built from the claims, or None if they are missing or stale.
+    """
+    if 'ver' not in claims or (await aget_version(User, claims['uid']))[0] != claims['ver']:
+        return None
+    return _claims_user(claims)
+
+
+def get_user(username: str) -> User:
+    """
+    Resolves a username to a User with its role and subscription plan loaded.
+
+    Args:
+        username (str): The username taken from a verified token.
+
+    Returns:
+        User: The matching user.
+
+    Raises:
+        AuthenticationFailed: If no user has this username.
+    """
+    if user_cache.ttl:
+        user = user_cache.get(username)
+        if user is not None:
+            return user
+
+    try:
+        user = User.objects.select_related('role', 'subscription_plan').get(username=username)
+    except User.DoesNotExist:
+        raise AuthenticationFailed('User not found!')
+
+    if user_cache.ttl:
+        user_cache.set(username, user)
+    return user
+
+
+async def aget_user(username: str) -> User:
+    """
+    Async version of get_user for async views.
+
+    Args:
+        username (str): The username taken from a verified token.
+
+    Returns:
+        User: The matching user.
+
+    Raises:
+        AuthenticationFailed: If no user has this username.
+    """
+    if user_cache.ttl:
+        user = user_cache.get(username)
+        if user is not None:
+            return user
+
+    try:
+        user = await User.objects.select_related('role', 'subscription_plan').aget(username=username)
+    except User.DoesNotExist:
+        raise AuthenticationFailed('User not found!')
+
+    if user_cache.ttl:
+        user_cache.set(username, user)
+    return user
+
+
+class BearerTokenAuthentication(BaseAuthentication):
+    """
+    DRF authentication for the tokens issued by api.utils.encode_token.
+
+    Requests without a valid Bearer token are left anonymous, so public
+    endpoints, login and token refresh keep working when a client still sends
+    an expired token; protected views and RoleBasedPermission reject them.
+    """
+
+    def authenticate(self, request):
+        """
+        Verify the Bearer token and resolve its user.
+
+        Tokens with current user claims are resolved without a query; the
+        others load the user through get_user.
+
+        Args:
+            request: The HTTP request.
+
+        Returns:
+            tuple: (user, decoded claims), or None when no valid Bearer token was sent.
+        """
+        token = get_token(request.headers.get('Authorization', ''))
+        if 'token' not in token.data:
+            return None
+        try:
+            claims = decode_token(token.data['token'])
+            return token_user(claims) or get_user(claims['username']), claims
+        except AuthenticationFailed:
+            return None
+
+    def authenticate_header(self, request):
+        return 'Bearer'
@@ -0,0 +1,408 @@
+"""
+Endpoint benchmarks driven through real Bearer tokens.
+
+``seed`` fills the database with users, roles, plans and images at a given
+scale, ``endpoints`` describes one scenario per route in api/urls.py, and
+``run`` measures them through either the Django test client or a local WSGI
+server, and ``compare_serialization`` times the DRF and api.fastpath list
+serializers against each other. The ``benchmark`` management command wraps all of this in a
+throwaway test database.
+"""
+import hashlib
+import http.client
+import json
+import os
+import statistics
+import threading
+import time
+from io import BytesIO
+from itertools import count
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import Client
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern
+from PIL import Image as PILImage
+from rest_framework.renderers import JSONRenderer
+from api import catalog
+from api.fastpath import render_json, row_serializer
+from api.models import Image, Role, SubscriptionPlan, UploadSession, User
+from api.serializers import ImageSerializer, RoleSerializer
+from api.similarity import to_db
+from api.uploads import part_path
+from api.utils import encode_refresh_token, encode_token
+
+ROLES = ['beta_player', 'company_user', 'growth_plan_subscriber']
+PASSWORD = 'benchmark-password'
+
+
+class Endpoint:
+    """
+    One benchmark scenario.
+
+    Attributes:
+        name (str): Label used in reports, e.g. 'GET images/<int:id>/'.
+        route (str): The api/urls.py route this scenario covers.
+        method (str): HTTP method.
+        build (callable): Returns (path, body, content_type) for the next request.
+        auth (bool): Whether to send the Bearer token.
+    """
+
+    def __init__(self, method, route, build, auth=True):
+        self.name = f'{method} {route}'
+        self.route = route
+        self.method = method
+        self.build = build
+        self.auth = auth
+
+
+def seed(users: int = 100, images: int = 1000, plans: int = 10) -> dict:
+    """
+    Fills the database with benchmark data.
+
+    Args:
+        users (int): Number of users to create.
+        images (int): Number of images to create.
+        plans (int): Number of subscription plans to create.
+
+    Returns:
+        dict: The seeded objects and a Bearer token for a 'beta_player' user.
+    """
+    roles = [Role.objects.get_or_create(role=role)[0] for role in ROLES]
+    subscription_plans = SubscriptionPlan.objects.bulk_create([
+        SubscriptionPlan(subscription_plan=f'plan{i}', features='Feature ' * 20, benefits='Benefit ' * 20)
+        for i in range(plans)
+    ])
+    password = make_password(PASSWORD)
+    seeded_users = User.objects.bulk_create([
+        User(username=f'benchuser{i}', password=password, role=roles[i % len(roles)])
+        for i in range(users)
+    ])
+    owner = User.objects.get(username='benchuser0')
+    Image.objects.bulk_create([
+        Image(uploaded_by=owner, image_file=f'images/bench{i}.png', description=f'Benchmark image {i}',
+              phash=to_db(_bench_hash(i)))
+        for i in range(images)
+    ], batch_size=500)
+    # Only the first image gets real bytes, for the content scenario; the DELETE scenario deletes from the end.
+    first = Image.objects.order_by('id').first()
+    first.image_file.save('bench.png', ContentFile(_png()))
+    return {
+        'owner': owner,
+        'users': seeded_users,
+        'plans': subscription_plans,
+        'image_ids': list(Image.objects.order_by('id').values_list('id', flat=True)),
+        'token': encode_token(owner),
+    }
+
+
+def _bench_hash(i: int) -> int:
+    # Groups of ten images share most bits, so similarity searches have matches.
+    base = (i // 10 * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    return base ^ (1 << (i % 10 * 6))
+
+
+def _png() -> bytes:
+    data = BytesIO()
+    PILImage.new('RGB', (64, 64), color='blue').save(data, format='PNG')
+    return data.getvalue()
+
+
+def endpoints(data: dict) -> list:
+    """
+    Builds one scenario per route, using the seeded data.
+
+    Write scenarios create or consume their own rows so they can be repeated.
+
+    Args:
+        data (dict): The result of seed().
+
+    Returns:
+        list: Endpoint scenarios.
+    """
+    image_ids = data['image_ids']
+    plan = data['plans'][0].subscription_plan
+    owner = data['owner']
+    serial = count()
+    png = _png()
+    deletable = iter(reversed(image_ids))
+
+    def json_body(payload):
+        return json.dumps(payload), 'application/json'
+
+    def register():
+        return ('/register/',) + json_body({'username': f'reg{next(serial)}', 'password': PASSWORD, 'role': 'company_user'})
+
+    def register_bulk():
+        n = next(serial)
+        rows = [{'username': f'bulk{n}x{i}', 'password': PASSWORD, 'role': 'company_user'} for i in range(10)]
+        return ('/register/bulk/',) + json_body(rows)
+
+    def upload():
+        return '/images/', encode_multipart(BOUNDARY, {
+            'uploaded_by': str(owner.id),
+            'description': 'Benchmark upload',
+            'image_file': _NamedBytesIO(png, 'bench.png'),
+        }), MULTIPART_CONTENT
+
+    def open_session(received=False):
+        session = UploadSession.objects.create(user=owner, filename='bench.png', size=len(png),
+                                               offset=len(png) if received else 0)
+        if received:
+            os.makedirs(os.path.dirname(part_path(session)), exist_ok=True)
+            with open(part_path(session), 'wb') as part:
+                part.write(png)
+        return session
+
+    def upload_chunk():
+        session = open_session()
+        return f'/images/uploads/{session.id}/?offset=0', png, 'application/octet-stream'
+
+    def complete_upload():
+        session = open_session(received=True)
+        return (f'/images/uploads/{session.id}/complete/',) + json_body({'sha256': hashlib.sha256(png).hexdigest()})
+
+    return [
+        Endpoint('POST', 'register/', register, auth=False),
+        Endpoint('POST', 'register/bulk/', register_bulk, auth=False),
+        Endpoint('POST', 'login/', lambda: ('/login/',) + json_body({'username': owner.username, 'password': PASSWORD}), auth=False),
+        Endpoint('POST', 'token/refresh/', lambda: ('/token/refresh/',) + json_body({'refresh': encode_refresh_token(owner)}), auth=False),
+        Endpoint('GET', 'images/', lambda: ('/images/', None, None)),
+        Endpoint('POST', 'images/', upload),
+        Endpoint('GET', 'images/<int:id>/', lambda: (f'/images/{image_ids[0]}/', None, None)),
+        Endpoint('POST', 'images/batch/', lambda: ('/images/batch/',) + json_body({
+            'delete': [next(deletable)],
+            'update': [{'id': image_ids[2], 'description': f'Batch {next(serial)}'}],
+        })),
+        Endpoint('POST', 'images/export/', lambda: ('/images/export/',) + json_body({
+            'ids': image_ids[:1], 'width': 32, 'height': 32,
+        })),
+        Endpoint('GET', 'images/<int:id>/similar/', lambda: (f'/images/{image_ids[0]}/similar/', None, None)),
+        Endpoint('GET', 'images/<int:id>/content/', lambda: (f'/images/{image_ids[0]}/content/', None, None)),
+        Endpoint('PUT', 'images/<int:id>/', lambda: (f'/images/{image_ids[1]}/',) + json_body({'description': f'Updated {next(serial)}'})),
+        Endpoint('DELETE', 'images/<int:id>/', lambda: (f'/images/{next(deletable)}/', None, None)),
+        Endpoint('POST', 'images/uploads/', lambda: ('/images/uploads/',) + json_body({'filename': 'bench.png', 'size': len(png)})),
+        Endpoint('PUT', 'images/uploads/<uuid:id>/', upload_chunk),
+        Endpoint('POST', 'images/uploads/<uuid:id>/complete/', complete_upload),
+        Endpoint('GET', 'roles/', lambda: ('/roles/', None, None)),
+        Endpoint('GET', 'roles/<str:id>/', lambda: ('/roles/company_user/', None, None)),
+        Endpoint('GET', 'subscription-plans/', lambda: ('/subscription-plans/', None, None)),
+        Endpoint('GET', 'subscription-plans/<str:subscription_plan>/', lambda: (f'/subscription-plans/{plan}/', None, None)),
+    ]
+
+
+class _NamedBytesIO(BytesIO):
+    def __init__(self, content, name):
+        super().__init__(content)
+        self.name = name
+
+
+def uncovered_routes(scenarios: list) -> list:
+    """
+    Lists api/urls.py routes that no scenario exercises.
+
+    Args:
+        scenarios (list): Endpoint scenarios.
+
+    Returns:
+        list: Route patterns without a scenario.
+    """
+    from api import urls
+
+    covered = {endpoint.route for endpoint in scenarios}
+    return [str(p.pattern) for p in urls.urlpatterns if isinstance(p, URLPattern) and str(p.pattern) not in covered]
+
+
+class InProcessTransport:
+    """
+    Sends requests through the Django test client and counts their queries.
+
+    Attributes:
+        last_queries (list): The queries captured for the latest request, as recorded by CaptureQueriesContext.
+    """
+    counts_queries = True
+
+    def __init__(self):
+        self.client = Client()
+        self.last_queries = []
+
+    def request(self, method, path, body, content_type, headers):
+        kwargs = {'headers': headers}
+        if body is not None:
+            kwargs.update(data=body, content_type=content_type)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.generic(method, path, **kwargs)
+            if response.streaming:
+                # Consume the body so the queries it runs are counted.
+                b''.join(response.streaming_content)
+        self.last_queries = queries.captured_queries
+        return response.status_code, len(queries)
+
+    def close(self):
+        pass
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class WSGIServerTransport:
+    """
+    Serves the project on a local threaded WSGI server and sends real HTTP requests to it.
+    """
+    counts_queries = False
+
+    def __init__(self):
+        self.server = make_server('127.0.0.1', 0, get_wsgi_application(),
+                                  server_class=_ThreadingWSGIServer, handler_class=_QuietHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+
+    def request(self, method, path, body, content_type, headers):
+        headers = dict(headers)
+        if content_type:
+            headers['Content-Type'] = content_type
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        return response.status, None
+
+    def close(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _percentile(values: list, percent: float) -> float:
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def run(scenarios: list, token: str, transport, requests: int = 50, warmup: int = 5) -> dict:
+    """
+    Measures each scenario.
+
+    Args:
+        scenarios (list): Endpoint scenarios.
+        token (str): JWT sent as a Bearer token to authenticated endpoints.
+        transport: InProcessTransport or WSGIServerTransport.
+        requests (int): Measured requests per endpoint.
+        warmup (int): Unmeasured requests sent first to each endpoint.
+
+    Returns:
+        dict: Latency percentiles, throughput, query counts and status codes per endpoint.
+    """
+    report = {}
+    for endpoint in scenarios:
+        headers = {'Authorization': f'Bearer {token}'} if endpoint.auth else {}
+        latencies, queries, statuses = [], [], {}
+        for i in range(warmup + requests):
+            path, body, content_type = endpoint.build()
+            started = time.perf_counter()
+            status_code, query_count = transport.request(endpoint.method, path, body, content_type, headers)
+            elapsed = time.perf_counter() - started
+            if i < warmup:
+                continue
+            latencies.append(elapsed * 1000)
+            statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+            if query_count is not None:
+                queries.append(query_count)
+
+        total = sum(latencies) / 1000
+        latencies.sort()
+        report[endpoint.name] = {
+            'requests': requests,
+            'p50_ms': round(_percentile(latencies, 50), 3),
+            'p95_ms': round(_percentile(latencies, 95), 3),
+            'p99_ms': round(_percentile(latencies, 99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'throughput_rps': round(requests / total, 1) if total else None,
+            'queries_mean': round(statistics.fmean(queries), 2) if queries else None,
+            'queries_max': max(queries) if queries else None,
+            'statuses': statuses,
+        }
+    return report
+
+
+def compare_serialization(page_size: int = 500, repeat: int = 20) -> dict:
+    """
+    Times the image and role list payloads through DRF serializers and through api.fastpath.
+
+    Both paths include the query and the JSON rendering, and must produce the same bytes.
+
+    Args:
+        page_size (int): Number of images per payload.
+        repeat (int): Timed runs per path.
+
+    Returns:
+        dict: Mean milliseconds per path and the speedup, per serializer.
+    """
+    images = Image.objects.order_by('id')
+    image_rows = row_serializer(ImageSerializer)
+    role_rows = row_serializer(RoleSerializer)
+    renderer = JSONRenderer()
+    paths = {
+        'ImageSerializer': (
+            lambda: renderer.render(ImageSerializer(images[:page_size], many=True).data),
+            lambda: render_json(image_rows.serialize(image_rows.values_list(images)[:page_size])),
+        ),
+        'RoleSerializer': (
+            lambda: renderer.render(RoleSerializer(catalog.roles.all().values(), many=True).data),
+            lambda: render_json(role_rows.serialize_objects(catalog.roles.all().values())),
+        ),
+    }
+
+    report = {}
+    for name, (drf, fast) in paths.items():
+        if drf() != fast():
+            raise AssertionError(f'{name}: fast path output differs from the serializer')
+        timings = {}
+        for label, build in (('drf', drf), ('fast', fast)):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                build()
+            timings[label] = (time.perf_counter() - started) * 1000 / repeat
+        report[name] = {
+            'drf_ms': round(timings['drf'], 3),
+            'fast_ms': round(timings['fast'], 3),
+            'speedup': round(timings['drf'] / timings['fast'], 2) if timings['fast'] else None,
+        }
+    return report
+
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.2, min_delta_ms: float = 1.0) -> list:
+    """
+    Finds endpoints that got slower or issue more queries than in a saved baseline.
+
+    Args:
+        current (dict): Endpoint results from run().
+        baseline (dict): Endpoint results from a saved report.
+        tolerance (float): Allowed relative p95 increase.
+        min_delta_ms (float): p95 increases below this many milliseconds are ignored as noise.
+
+    Returns:
+        list: Human readable regression descriptions.
+    """
+    regressions = []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        delta = result['p95_ms'] - before['p95_ms']
+        if delta > min_delta_ms and result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+        if None not in (result.get('queries_max'), before.get('queries_max')) and result['queries_max'] > before['queries_max']:
+            regressions.append(f"{name}: queries {before['queries_max']} -> {result['queries_max']}")
+    return regressions
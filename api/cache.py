@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe in-process LRU cache with per-entry expiry.
+
+    Attributes:
+        maxsize (int): Maximum number of entries kept before the least recently used is evicted.
+        ttl (float): Default lifetime of an entry in seconds, or None for no default expiry.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that found nothing usable.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for a key, or default if it is missing or expired.
+
+        Args:
+            key: The cache key.
+            default: Value returned on a miss.
+
+        Returns:
+            The cached value or default.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float = None, expires_at: float = None):
+        """
+        Stores a value.
+
+        The entry expires at the earliest of ``expires_at`` (a Unix timestamp)
+        and ``ttl`` seconds from now, falling back to the cache's default ttl.
+
+        Args:
+            key: The cache key.
+            value: The value to store.
+            ttl (float): Lifetime of this entry in seconds.
+            expires_at (float): Absolute Unix time after which the entry is never returned.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        deadline = None if ttl is None else time.time() + ttl
+        if expires_at is not None:
+            deadline = expires_at if deadline is None else min(deadline, expires_at)
+
+        with self._lock:
+            self._data[key] = (value, deadline)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Removes a key if present.
+
+        Args:
+            key: The cache key.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry and resets the hit/miss counters.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the cache size and hit/miss counters.
+
+        Returns:
+            dict: Cache statistics.
+        """
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,257 @@
+"""
+Two-tier Django cache backend for multi-worker deployments.
+
+TwoTierCache keeps recently read entries in an in-process LRU (api.cache)
+for LOCAL_TTL seconds in front of another configured cache that every worker
+shares, such as Redis or the file-based cache; see multi_user_app.caches.
+Writes go through to the shared cache and update the local copy, so a worker
+always sees its own writes, and other workers see them within LOCAL_TTL.
+
+get_or_set coalesces cold keys: concurrent callers in one process wait on a
+lock, and callers in other processes wait on a short-lived marker added to
+the shared cache, so the value is computed once and read by everyone else.
+This relies on the shared cache's ``add`` being atomic, as it is for Redis
+and for FileCache, but not for Django's FileBasedCache.
+
+Values read from the local tier are the cached objects themselves, not
+copies; callers must not mutate them.
+"""
+import itertools
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+from django.utils.functional import cached_property
+from api.cache import LRUCache
+
+_MISSING = object()
+
+
+class TwoTierCache(BaseCache):
+    """
+    In-process LRU in front of a shared cache.
+
+    ``LOCATION`` names the shared cache alias in CACHES. OPTIONS:
+
+    - ``LOCAL_TTL``: seconds an entry is served locally before the shared cache is read again.
+    - ``LOCAL_MAX_ENTRIES``: size of the local tier.
+    - ``FLIGHT_TIMEOUT``: seconds other processes wait for a value being computed by get_or_set.
+
+    Attributes:
+        local (LRUCache): The in-process tier.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = location or 'shared'
+        self.local = LRUCache(maxsize=options.get('LOCAL_MAX_ENTRIES', 10000), ttl=options.get('LOCAL_TTL', 1))
+        self.flight_timeout = options.get('FLIGHT_TIMEOUT', 10)
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    @cached_property
+    def shared(self) -> BaseCache:
+        """
+        The shared tier, which applies its own key prefix and timeouts.
+        """
+        return caches[self._shared_alias]
+
+    def _remember(self, key, version, value, timeout=DEFAULT_TIMEOUT):
+        ttl = self.local.ttl
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout) if ttl is not None else timeout
+        self.local.set((key, version), value, ttl=ttl)
+
+    def get(self, key, default=None, version=None):
+        value = self.local.get((key, version), _MISSING)
+        if value is _MISSING:
+            value = self.shared.get(key, _MISSING, version=version)
+            if value is _MISSING:
+                return default
+            self._remember(key, version, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout=timeout, version=version)
+        self._remember(key, version, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self.shared.add(key, value, timeout=timeout, version=version):
+            return False
+        self._remember(key, version, value, timeout)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.delete((key, version))
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete((key, version))
+        return self.shared.delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete((key, version))
+        return self.shared.incr(key, delta, version=version)
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get((key, version), _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            for key, value in self.shared.get_many(missing, version=version).items():
+                self._remember(key, version, value)
+                found[key] = value
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout=timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._remember(key, version, value, timeout)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.local.delete((key, version))
+        self.shared.delete_many(keys, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Returns a key's value, computing it once across workers when it is missing.
+
+        Args:
+            key: The cache key.
+            default: The value, or a callable computing it, stored when the key is missing.
+            timeout: Lifetime of the stored value.
+            version: The key version.
+
+        Returns:
+            The cached or computed value.
+        """
+        value = self.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            return value
+        if not callable(default):
+            return super().get_or_set(key, default, timeout=timeout, version=version)
+
+        with self._flights_lock:
+            lock = self._flights.setdefault((key, version), threading.Lock())
+        try:
+            with lock:
+                value = self.get(key, _MISSING, version=version)
+                if value is _MISSING:
+                    value = self._compute_once(key, default, timeout, version)
+                return value
+        finally:
+            with self._flights_lock:
+                if self._flights.get((key, version)) is lock:
+                    del self._flights[(key, version)]
+
+    def _compute_once(self, key, compute, timeout, version):
+        marker = f'api:flight:{key}'
+        if self.shared.add(marker, True, timeout=self.flight_timeout, version=version):
+            try:
+                value = compute()
+                self.set(key, value, timeout=timeout, version=version)
+                return value
+            finally:
+                self.shared.delete(marker, version=version)
+
+        # Another process is computing it; wait for its result, or compute it
+        # here if it gave up or is taking longer than FLIGHT_TIMEOUT.
+        deadline = time.monotonic() + self.flight_timeout
+        delay = 0.005
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            value = self.shared.get(key, _MISSING, version=version)
+            if value is not _MISSING:
+                self._remember(key, version, value, timeout)
+                return value
+            if not self.shared.has_key(marker, version=version):
+                break
+            delay = min(delay * 2, 0.1)
+        value = compute()
+        self.set(key, value, timeout=timeout, version=version)
+        return value
+
+
+class FileCache(FileBasedCache):
+    """
+    Django's file-based cache with an atomic ``add`` and cheaper culling.
+
+    FileBasedCache.add checks for the key and then writes it, so two
+    processes may both succeed; here the check and write happen under an
+    exclusive lock on one of LOCK_STRIPES files in the cache directory,
+    chosen by the key, so unrelated adds do not wait for each other.
+
+    FileBasedCache also lists the whole directory on every write to decide
+    whether to cull. Here each process only does so every CULL_INTERVAL
+    writes (OPTIONS, default MAX_ENTRIES // 100), so the cache may briefly
+    hold up to that many entries per process over MAX_ENTRIES.
+    """
+    LOCK_STRIPES = 16
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        options = params.get('OPTIONS', {})
+        self._cull_interval = max(1, int(options.get('CULL_INTERVAL', self._max_entries // 100)))
+        self._writes = itertools.count(1)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        stripe = int(os.path.basename(self._key_to_file(key, version))[:8], 16) % self.LOCK_STRIPES
+        with open(os.path.join(self._dir, f'add-{stripe}.lock'), 'ab') as lock:
+            locks.lock(lock, locks.LOCK_EX)
+            try:
+                return super().add(key, value, timeout, version)
+            finally:
+                locks.unlock(lock)
+
+    def _cull(self):
+        if next(self._writes) % self._cull_interval == 0:
+            super()._cull()
+
+
+def shared_cache() -> BaseCache:
+    """
+    Returns the cache every worker shares, bypassing the local tier.
+
+    For state that must not be read stale, such as rate limit counters.
+
+    Returns:
+        BaseCache: The shared tier, or the default cache when it has none.
+    """
+    return getattr(cache, 'shared', cache)
+
+
+def counter_cache() -> BaseCache:
+    """
+    Returns the cache holding rate limit counters.
+
+    Counters are written on every request they limit, so they are kept out
+    of the file backend; see the ``counters`` alias in multi_user_app.caches.
+
+    Returns:
+        BaseCache: The ``counters`` cache, or shared_cache() when it is not configured.
+    """
+    if 'counters' in settings.CACHES:
+        return caches['counters']
+    return shared_cache()
@@ -0,0 +1,76 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from api.models import Role, SubscriptionPlan
+from api.versioning import get_version
+
+
+class Catalog:
+    """
+    Process-local snapshot of a small lookup table.
+
+    The snapshot is tagged with the model's version from api.versioning, which
+    the model signals replace on every change. When the versions live in a
+    shared cache backend, a change made by any worker makes every worker
+    reload on its next read; otherwise reads need no queries at all. Reloads
+    go through the cache too, so the table is read once per change by one
+    worker rather than by each of them.
+
+    Attributes:
+        model: The model class held by the catalog.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._snapshot = (None, {})
+        self._lock = threading.Lock()
+
+    def all(self) -> dict:
+        """
+        Returns every row keyed by primary key, in database order.
+
+        Returns:
+            dict: Model instances keyed by primary key.
+        """
+        token, _ = get_version(self.model)
+        version, rows = self._snapshot
+        if version == token:
+            return rows
+
+        with self._lock:
+            version, rows = self._snapshot
+            if version != token:
+                rows = cache.get_or_set(
+                    f'api:catalog:{self.model._meta.label_lower}:{token}',
+                    lambda: {obj.pk: obj for obj in self.model.objects.all()},
+                    getattr(settings, 'CACHE_SNAPSHOT_TIMEOUT', 3600),
+                )
+                self._snapshot = (token, rows)
+            return rows
+
+    def get(self, pk):
+        """
+        Returns the row with the given primary key.
+
+        Args:
+            pk: The primary key.
+
+        Returns:
+            The model instance, or None if it does not exist.
+        """
+        return self.all().get(pk)
+
+    def __deepcopy__(self, memo):
+        # Serializer fields are deep-copied per serializer instance; keep sharing one catalog.
+        return self
+
+    def invalidate(self):
+        """
+        Drops the snapshot so the next read reloads it.
+        """
+        self._snapshot = (None, {})
+
+
+roles = Catalog(Role)
+subscription_plans = Catalog(SubscriptionPlan)
@@ -0,0 +1,207 @@
+"""
+Bulk image export as NumPy arrays.
+
+images/export/ decodes many stored images at once in a process pool, resizes
+them to one shape and streams them back as a single (n, height, width,
+channels) array, either as a bare .npy file or inside an .npz archive that
+also holds the image ids. Images are stacked and converted in batches of
+IMAGE_EXPORT_BATCH_SIZE, so the response never holds the whole array.
+
+NumPy is optional; without it the endpoint answers 501.
+"""
+import io
+import multiprocessing
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+
+from django.conf import settings
+from api.processing import load_pixels
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CHANNELS = {'L': 1, 'RGB': 3, 'RGBA': 4}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Returns the export decoding pool, starting it on first use.
+
+    Returns:
+        ProcessPoolExecutor: The worker pool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_EXPORT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def shutdown_executor(wait: bool = True):
+    """
+    Stops the export decoding pool if it was started.
+
+    Args:
+        wait (bool): Wait for pending decodes to finish.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+
+
+class ArrayExport:
+    """
+    Streams stored images as one stacked array.
+
+    Attributes:
+        ids (list): Image ids, in array order.
+        shape (tuple): (n, height, width, channels).
+        dtype: uint8, or float32 scaled to [0, 1] when normalized.
+        failed (list): Ids of images that could not be decoded; their slots are zero.
+            Complete once the pixel data has been streamed.
+    """
+
+    def __init__(self, ids: list, paths: list, size: tuple, mode: str, fit: str = 'crop', normalize: bool = False):
+        self.ids = ids
+        self.paths = paths
+        self.size = size
+        self.mode = mode
+        self.fit = fit
+        self.shape = (len(ids), size[1], size[0], CHANNELS[mode])
+        self.dtype = np.dtype(np.float32 if normalize else np.uint8)
+        self.failed = []
+
+    def header(self) -> bytes:
+        """
+        Returns the .npy header describing the array.
+
+        Returns:
+            bytes: Magic string, version and header dict, padded as the format requires.
+        """
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': self.shape,
+        })
+        return header.getvalue()
+
+    def npy_size(self) -> int:
+        """
+        Returns the length of the .npy stream in bytes.
+
+        Returns:
+            int: Header plus array data.
+        """
+        return len(self.header()) + int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def _decoded(self):
+        args = (repeat(self.size), repeat(self.mode), repeat(self.fit))
+        if not getattr(settings, 'IMAGE_EXPORT_WORKERS', 2):
+            yield from map(load_pixels, self.paths, *args)
+            return
+
+        # Executor.map would submit every image up front and hold all decoded
+        # pixels until the client reads them; keep one batch in flight instead.
+        executor = get_executor()
+        pending = deque()
+        tasks = zip(self.paths, *args)
+        try:
+            for task in islice(tasks, getattr(settings, 'IMAGE_EXPORT_BATCH_SIZE', 32)):
+                pending.append(executor.submit(load_pixels, *task))
+            while pending:
+                pixels = pending.popleft().result()
+                for task in islice(tasks, 1):
+                    pending.append(executor.submit(load_pixels, *task))
+                yield pixels
+        finally:
+            # The client went away; drop decodes that have not started.
+            for future in pending:
+                future.cancel()
+
+    def batches(self):
+        """
+        Decodes the images and yields them stacked in batches.
+
+        Yields:
+            ndarray: Up to IMAGE_EXPORT_BATCH_SIZE images of the final shape and dtype.
+        """
+        batch_size = getattr(settings, 'IMAGE_EXPORT_BATCH_SIZE', 32)
+        frame = self.shape[1:]
+        decoded = zip(self.ids, self._decoded())
+        while True:
+            chunk = list(islice(decoded, batch_size))
+            if not chunk:
+                return
+            batch = np.zeros((len(chunk),) + frame, dtype=np.uint8)
+            for row, (image_id, pixels) in enumerate(chunk):
+                if pixels is None:
+                    self.failed.append(image_id)
+                else:
+                    batch[row] = np.frombuffer(pixels, dtype=np.uint8).reshape(frame)
+            if self.dtype != np.uint8:
+                batch = batch.astype(self.dtype) / np.float32(255)
+            yield batch
+
+    def npy(self):
+        """
+        Streams the array as a .npy file.
+
+        Yields:
+            bytes: The header, then the data batch by batch.
+        """
+        yield self.header()
+        for batch in self.batches():
+            yield batch.tobytes()
+
+    def npz(self):
+        """
+        Streams an uncompressed .npz archive holding ``images``, ``ids`` and ``failed``.
+
+        Yields:
+            bytes: Parts of the archive as they are written.
+        """
+        pipe = _Pipe()
+        with zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_STORED) as archive:
+            with archive.open('images.npy', 'w', force_zip64=True) as member:
+                member.write(self.header())
+                yield pipe.drain()
+                for batch in self.batches():
+                    member.write(batch.tobytes())
+                    yield pipe.drain()
+            for name, values in (('ids', self.ids), ('failed', self.failed)):
+                with archive.open(f'{name}.npy', 'w') as member:
+                    np.save(member, np.array(values, dtype=np.int64))
+        yield pipe.drain()
+
+
+class _Pipe(io.RawIOBase):
+    # An unseekable sink, so zipfile writes data descriptors instead of seeking back.
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
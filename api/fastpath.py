@@ -0,0 +1,182 @@
+"""
+Read-only serialization straight from database rows.
+
+A ModelSerializer builds field objects and calls to_representation on every
+field of every row. For the read-heavy list endpoints, row_serializer
+compiles a serializer once into a column list and a row-to-dict function;
+rows are fetched with values_list() and rendered with orjson when it is
+installed. The output is the same as the serializer's, byte for byte, and
+serializers with fields this module cannot reproduce are rejected when
+compiled rather than rendered differently.
+"""
+import json
+from functools import lru_cache
+
+from django.http import HttpResponse
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+from .instrumentation import track_serializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fields whose database values are already what to_representation returns.
+PASSTHROUGH_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+
+class RowSerializer:
+    """
+    A serializer compiled for rows from values_list().
+
+    Attributes:
+        names (list): Output keys, in the serializer's order.
+        columns (list): values_list() arguments producing the values for names.
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        serializer = serializer_class() if fields is None else serializer_class(fields=fields)
+        model = serializer_class.Meta.model
+        self.names, self.columns, converters = [], [], []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            model_field = model._meta.get_field(field.source)
+            convert = _converter(field, model_field)
+            self.names.append(name)
+            self.columns.append(model_field.attname)
+            if convert is not None:
+                converters.append((name, convert))
+        self.to_dict = _compile(self.names, converters)
+
+    def values_list(self, queryset, *extra):
+        """
+        Selects the columns needed for the output as named rows.
+
+        Args:
+            queryset (QuerySet): The rows to serialize.
+            *extra: Further columns to fetch, e.g. the pagination ordering; they are not output.
+
+        Returns:
+            QuerySet: A values_list() queryset of named tuples.
+        """
+        columns = self.columns + [column for column in extra if column not in self.columns]
+        return queryset.values_list(*columns, named=True)
+
+    def serialize(self, rows) -> list:
+        """
+        Converts rows from values_list() to dicts.
+
+        Args:
+            rows: Tuples whose leading values follow columns.
+
+        Returns:
+            list: One dict per row, as the serializer would return it.
+        """
+        with track_serializer():
+            return [self.to_dict(row) for row in rows]
+
+    def serialize_objects(self, objects) -> list:
+        """
+        Converts already loaded model instances, e.g. from api.catalog, to dicts.
+
+        Args:
+            objects: Model instances.
+
+        Returns:
+            list: One dict per instance, as the serializer would return it.
+        """
+        columns = self.columns
+        with track_serializer():
+            return [self.to_dict([getattr(obj, column) for column in columns]) for obj in objects]
+
+
+def _converter(field, model_field):
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        return None
+    if isinstance(field, serializers.FileField):
+        if not getattr(field, 'use_url', True):
+            return lambda value: str(value) or None
+        storage = model_field.storage
+        # Rows hold the stored name, instances a FieldFile; both are falsy when empty.
+        return lambda value: storage.url(str(value)) if value else None
+    if isinstance(field, serializers.ChoiceField):
+        choices = field.choice_strings_to_values
+        return lambda value: value if value == '' else choices.get(str(value), value)
+    if isinstance(field, serializers.JSONField) and not field.binary:
+        return None
+    if isinstance(field, PASSTHROUGH_FIELDS):
+        return None
+    raise TypeError(f'{field.field_name}: {type(field).__name__} is not supported by RowSerializer')
+
+
+def _compile(names, converters):
+    names = tuple(names)
+    if not converters:
+        return lambda row: dict(zip(names, row))
+
+    def to_dict(row):
+        item = dict(zip(names, row))
+        for name, convert in converters:
+            # Like Serializer.to_representation, None is output without conversion.
+            value = item[name]
+            if value is not None:
+                item[name] = convert(value)
+        return item
+    return to_dict
+
+
+@lru_cache(maxsize=None)
+def row_serializer(serializer_class, fields: tuple = None) -> RowSerializer:
+    """
+    Returns the compiled RowSerializer of a serializer class and fieldset.
+
+    Args:
+        serializer_class: A ModelSerializer class.
+        fields (tuple): Selected field names, or None for all fields.
+
+    Returns:
+        RowSerializer: The compiled serializer, shared between requests.
+
+    Raises:
+        TypeError: If the serializer has a field RowSerializer cannot reproduce.
+    """
+    return RowSerializer(serializer_class, fields)
+
+
+_encoder = JSONEncoder()
+
+
+def render_json(data) -> bytes:
+    """
+    Renders data exactly as rest_framework's JSONRenderer does, using orjson when installed.
+
+    Args:
+        data: The data to render.
+
+    Returns:
+        bytes: Compact UTF-8 JSON.
+    """
+    if orjson is not None:
+        content = orjson.dumps(data, default=_encoder.default)
+    else:
+        content = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+    # JSONRenderer escapes these so the output is also valid JavaScript.
+    if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+        content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+def json_response(data, status: int = 200) -> HttpResponse:
+    """
+    Builds a JSON response rendered with render_json.
+
+    Args:
+        data: The response data.
+        status (int): The HTTP status code.
+
+    Returns:
+        HttpResponse: The response.
+    """
+    return HttpResponse(render_json(data), status=status, content_type='application/json')
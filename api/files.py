@@ -0,0 +1,125 @@
+"""
+Serving stored files with range and conditional request support.
+
+Full responses use FileResponse, which hands the open file to the server's
+wsgi.file_wrapper so servers that support it copy the bytes with sendfile.
+Single byte ranges are streamed in blocks, so no response holds a whole
+file in memory. With IMAGE_SENDFILE_BACKEND set, the copy is left to the
+front proxy through X-Accel-Redirect (nginx) or X-Sendfile (Apache, lighttpd).
+"""
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header: str, size: int):
+    """
+    Parses a Range header holding a single byte range.
+
+    Args:
+        header (str): The Range header value.
+        size (int): The size of the file.
+
+    Returns:
+        tuple: (start, end) inclusive, None to serve the whole file, or False if the range is unsatisfiable.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        # Malformed or multiple ranges; answering with the full file is allowed.
+        return None
+    start, end = match.groups()
+    if start == '':
+        length = int(end)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path: str, start: int, length: int, block_size: int):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(block_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, storage, name: str):
+    """
+    Serves a stored file with ETag, caching and Range support.
+
+    Args:
+        request: The HTTP request.
+        storage (FileSystemStorage): The storage holding the file.
+        name (str): The stored file name.
+
+    Returns:
+        HttpResponse: 200, 206, 304 or 416 response, or a proxy handoff response.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    path = storage.path(name)
+    stat = os.stat(path)
+    etag = '"%s"' % hashlib.md5(f'{name}:{stat.st_size}:{stat.st_mtime_ns}'.encode('utf-8')).hexdigest()
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = _file_response(request, path, name, stat.st_size, etag, content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    patch_cache_control(response, private=True, max_age=getattr(settings, 'IMAGE_CONTENT_MAX_AGE', 86400))
+    return response
+
+
+def _file_response(request, path, name, size, etag, content_type):
+    backend = getattr(settings, 'IMAGE_SENDFILE_BACKEND', None)
+    if backend == 'x-accel-redirect':
+        # nginx serves the internal location itself, including Range requests.
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = getattr(settings, 'IMAGE_SENDFILE_PREFIX', '/protected/') + name
+        return response
+    if backend == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and request.META.get('HTTP_IF_RANGE', etag) == etag:
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        return FileResponse(open(path, 'rb'), content_type=content_type)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        _read_range(path, start, length, FileResponse.block_size),
+        status=206,
+        content_type=content_type,
+    )
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
@@ -0,0 +1,176 @@
+"""
+Password hashing and verification in process pools.
+
+PBKDF2 is CPU-bound and holds the GIL, so hashing many passwords on the
+request thread serializes them. The worker functions below only need the
+hasher class, which lets spawned workers run them without setting up Django.
+
+Login verification has its own small pool with a bounded number of pending
+checks, so a burst of logins queues there instead of pinning every request
+thread, and bulk registrations cannot delay logins.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, identify_hasher
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import Throttled
+
+_executor = None
+_executor_lock = threading.Lock()
+_verify_executor = None
+_verify_slots = None
+
+
+def encode_password(hasher_path: str, password: str) -> str:
+    """
+    Hashes a password with a freshly generated salt.
+
+    Args:
+        hasher_path (str): Dotted path of the password hasher class.
+        password (str): The raw password.
+
+    Returns:
+        str: The encoded password, as stored in User.password.
+    """
+    hasher = import_string(hasher_path)()
+    return hasher.encode(password, hasher.salt())
+
+
+def verify_password(hasher_path: str, password: str, encoded: str) -> bool:
+    """
+    Checks a raw password against an encoded one.
+
+    Args:
+        hasher_path (str): Dotted path of the hasher that encoded the password.
+        password (str): The raw password.
+        encoded (str): The encoded password, as stored in User.password.
+
+    Returns:
+        bool: True if the password matches.
+    """
+    return import_string(hasher_path)().verify(password, encoded)
+
+
+def _hasher_path(hasher) -> str:
+    return f'{type(hasher).__module__}.{type(hasher).__qualname__}'
+
+
+def _worker_count() -> int:
+    return getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Returns the shared password hashing pool, starting it on first use.
+
+    Returns:
+        ProcessPoolExecutor: The worker pool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=_worker_count(),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def hash_passwords(passwords: list) -> list:
+    """
+    Hashes passwords in parallel with the default password hasher.
+
+    Args:
+        passwords (list): Raw passwords.
+
+    Returns:
+        list: Encoded passwords, in the same order.
+    """
+    hasher = get_hasher('default')
+    hasher_path = _hasher_path(hasher)
+    if len(passwords) < getattr(settings, 'PASSWORD_HASHING_POOL_THRESHOLD', 4):
+        return [encode_password(hasher_path, password) for password in passwords]
+
+    executor = get_executor()
+    chunksize = max(1, len(passwords) // (_worker_count() * 4))
+    return list(executor.map(encode_password, [hasher_path] * len(passwords), passwords, chunksize=chunksize))
+
+
+def get_verify_executor() -> tuple:
+    """
+    Returns the login verification pool and the semaphore bounding its pending checks.
+
+    A sync view still waits on its thread for the result, so the pool does not
+    free that thread. What it buys is a cap: at most LOGIN_VERIFY_WORKERS
+    hashes run at once, however many threads or event loops are logging in,
+    and logins beyond LOGIN_VERIFY_QUEUE_LIMIT are turned away with 429
+    instead of slowing down every other request on the host's CPUs. The async
+    login awaits the result without blocking its event loop. Deployments that
+    do not need the cap set LOGIN_VERIFY_WORKERS to 0 to check inline.
+
+    Returns:
+        tuple: (ProcessPoolExecutor, BoundedSemaphore).
+    """
+    global _verify_executor, _verify_slots
+    with _executor_lock:
+        if _verify_executor is None:
+            _verify_executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'LOGIN_VERIFY_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            _verify_slots = threading.BoundedSemaphore(getattr(settings, 'LOGIN_VERIFY_QUEUE_LIMIT', 32))
+        return _verify_executor, _verify_slots
+
+
+def submit_password_check(password: str, encoded: str) -> Future:
+    """
+    Starts verifying a login password in the verification pool.
+
+    With LOGIN_VERIFY_WORKERS set to 0 the password is checked inline.
+
+    Args:
+        password (str): The raw password.
+        encoded (str): The user's encoded password.
+
+    Returns:
+        Future: Resolves to True if the password matches.
+
+    Raises:
+        Throttled: If LOGIN_VERIFY_QUEUE_LIMIT checks are already pending.
+    """
+    try:
+        hasher_path = _hasher_path(identify_hasher(encoded))
+    except ValueError:
+        # Unusable or unknown password format.
+        hasher_path = None
+
+    if hasher_path is None or not getattr(settings, 'LOGIN_VERIFY_WORKERS', 2):
+        future = Future()
+        future.set_result(hasher_path is not None and verify_password(hasher_path, password, encoded))
+        return future
+
+    executor, slots = get_verify_executor()
+    if not slots.acquire(blocking=False):
+        raise Throttled(wait=1, detail='Too many logins in progress, try again shortly.')
+    future = executor.submit(verify_password, hasher_path, password, encoded)
+    future.add_done_callback(lambda done: slots.release())
+    return future
+
+
+def password_needs_upgrade(encoded: str) -> bool:
+    """
+    Tells whether a verified password should be re-encoded with the current default hasher.
+
+    Args:
+        encoded (str): The user's encoded password.
+
+    Returns:
+        bool: True if the hasher or its parameters changed since the password was set.
+    """
+    preferred = get_hasher('default')
+    hasher = identify_hasher(encoded)
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
@@ -0,0 +1,126 @@
+import contextvars
+import re
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('api_request_metrics', default=None)
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LIST_RE = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+
+
+def fingerprint(sql: str) -> str:
+    """
+    Reduces a statement to its shape, without the values it was run with.
+
+    String and number literals become ``?`` and placeholder lists of any
+    length become ``(...)``, so statements differing only in their values
+    share a fingerprint and no data ends up in the logs.
+
+    Args:
+        sql (str): The statement.
+
+    Returns:
+        str: The fingerprint.
+    """
+    return _LIST_RE.sub('(...)', _LITERAL_RE.sub('?', sql))
+
+
+class RequestMetrics:
+    """
+    Database and serializer timings collected while a request is handled.
+
+    Attributes:
+        queries (list): (sql, duration in ms) for every statement executed.
+        sql_ms (float): Total time spent executing SQL.
+        serializer_ms (float): Total time spent producing serializer data.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.sql_ms = 0.0
+        self.serializer_ms = 0.0
+
+    @property
+    def slowest(self) -> tuple:
+        """
+        Returns the slowest statement as (sql, duration in ms), or (None, 0.0).
+        """
+        return max(self.queries, key=lambda query: query[1], default=(None, 0.0))
+
+    def fingerprints(self) -> list:
+        """
+        Groups the executed statements by fingerprint.
+
+        Returns:
+            list: {'fingerprint', 'count', 'ms'} dicts, slowest total first.
+        """
+        groups = {}
+        for sql, duration in self.queries:
+            group = groups.setdefault(fingerprint(sql), {'fingerprint': fingerprint(sql), 'count': 0, 'ms': 0.0})
+            group['count'] += 1
+            group['ms'] += duration
+        for group in groups.values():
+            group['ms'] = round(group['ms'], 2)
+        return sorted(groups.values(), key=lambda group: group['ms'], reverse=True)
+
+    def record(self, sql: str, duration: float):
+        """
+        Adds one executed statement.
+
+        Args:
+            sql (str): The statement.
+            duration (float): Execution time in ms.
+        """
+        self.queries.append((sql, duration))
+        self.sql_ms += duration
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper that times statements run while a request is being collected.
+
+    It is installed on every connection by api.signals.install_query_recorder.
+    The current metrics live in a context variable, so queries that async views
+    run through sync_to_async threads are attributed to the right request.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record(sql, (time.perf_counter() - started) * 1000)
+
+
+@contextmanager
+def collect():
+    """
+    Makes a fresh RequestMetrics current for the enclosed block.
+
+    Yields:
+        RequestMetrics: The metrics being collected.
+    """
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def track_serializer():
+    """
+    Adds the time spent in the enclosed block to the current request's serializer time.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_ms += (time.perf_counter() - started) * 1000
@@ -0,0 +1,101 @@
+import datetime
+import json
+import tempfile
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from api import benchmark, export
+from api.tasks import shutdown_executor
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks every route in api/urls.py with real Bearer tokens against a throwaway '
+        'test database and prints p50/p95/p99 latency, throughput and query counts as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Number of seeded users.')
+        parser.add_argument('--images', type=int, default=1000, help='Number of seeded images.')
+        parser.add_argument('--plans', type=int, default=10, help='Number of seeded subscription plans.')
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per endpoint.')
+        parser.add_argument('--transport', choices=['inprocess', 'wsgi', 'both'], default='inprocess',
+                            help='Drive requests through the test client, a local WSGI server, or both.')
+        parser.add_argument('--endpoint', action='append', default=[],
+                            help='Only run endpoints whose name contains this text. May be repeated.')
+        parser.add_argument('--output', help='Write the report to this file.')
+        parser.add_argument('--baseline', help='Compare against a saved report and fail on regressions.')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative p95 increase.')
+
+    def handle(self, *args, **options):
+        # Two scenarios delete one image per request on each of up to two transports;
+        # the first three images are kept for the read and update scenarios.
+        required = (options['warmup'] + options['requests']) * 4 + 3
+        if options['images'] < required:
+            raise CommandError(f'--images must be at least {required} so the delete scenarios have rows to delete.')
+
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver', '127.0.0.1'],
+                                      LOGIN_THROTTLE_RATES={}):
+                report = self.run(options)
+                shutdown_executor()
+                export.shutdown_executor()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = []
+            for transport, results in report['transports'].items():
+                regressions += [f'[{transport}] {line}' for line in
+                                benchmark.compare(results, baseline['transports'].get(transport, {}), options['tolerance'])]
+            if regressions:
+                raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+
+    def run(self, options):
+        data = benchmark.seed(users=options['users'], images=options['images'], plans=options['plans'])
+        transports = ['inprocess', 'wsgi'] if options['transport'] == 'both' else [options['transport']]
+
+        report = {
+            'meta': {
+                'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'users': options['users'],
+                'images': options['images'],
+                'plans': options['plans'],
+                'requests': options['requests'],
+            },
+            'transports': {},
+        }
+        # Built once so write scenarios keep generating fresh usernames and ids across transports.
+        scenarios = benchmark.endpoints(data)
+        if options['endpoint']:
+            scenarios = [e for e in scenarios if any(text in e.name for text in options['endpoint'])]
+        else:
+            report['meta']['uncovered_routes'] = benchmark.uncovered_routes(scenarios)
+
+        for name in transports:
+            transport = benchmark.InProcessTransport() if name == 'inprocess' else benchmark.WSGIServerTransport()
+            try:
+                report['transports'][name] = benchmark.run(
+                    scenarios, data['token'], transport, requests=options['requests'], warmup=options['warmup'])
+            finally:
+                transport.close()
+        report['serialization'] = benchmark.compare_serialization(
+            page_size=min(options['images'], 500), repeat=options['requests'])
+        return report
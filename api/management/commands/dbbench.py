@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from api.models import Image
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures database throughput under concurrent writers for the configured '
+        'DATABASE_ENGINE. Each simulated request inserts an image row and reads a page '
+        'of images. Run it once per mode, e.g. DATABASE_ENGINE=postgres python manage.py dbbench. '
+        'It runs against a scratch copy of the schema, created the way the test runner creates '
+        'its database and dropped afterwards, so the configured database is never written to.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Number of concurrent workers.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests issued by each worker.')
+        parser.add_argument('--page-size', type=int, default=50, help='Rows read per request.')
+
+    def handle(self, *args, **options):
+        name = connection.settings_dict['NAME']
+        scratch = None
+        if connection.vendor == 'sqlite':
+            # On disk rather than the test runner's in-memory default, so the journal mode counts.
+            scratch = tempfile.mkdtemp(prefix='dbbench-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(scratch, 'dbbench.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = self.benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(name, verbosity=0)
+            if scratch:
+                shutil.rmtree(scratch, ignore_errors=True)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def benchmark(self, options) -> dict:
+        threads = options['threads']
+        requests = options['requests']
+        page_size = options['page_size']
+        errors = []
+        latencies = []
+        lock = threading.Lock()
+        start_barrier = threading.Barrier(threads + 1)
+
+        def worker():
+            local_errors = 0
+            local_latencies = []
+            start_barrier.wait()
+            try:
+                for _ in range(requests):
+                    started = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            Image.objects.create(description='dbbench')
+                        list(Image.objects.order_by('-id')[:page_size])
+                    except OperationalError:
+                        local_errors += 1
+                        continue
+                    local_latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+                with lock:
+                    errors.append(local_errors)
+                    latencies.extend(local_latencies)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        start_barrier.wait()
+        started = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        completed = len(latencies)
+        database = settings.DATABASES['default']
+        return {
+            'engine': database['ENGINE'].rsplit('.', 1)[-1],
+            'conn_max_age': database.get('CONN_MAX_AGE', 0),
+            'pooled': bool(database.get('OPTIONS', {}).get('pool')),
+            'threads': threads,
+            'requests': threads * requests,
+            'completed': completed,
+            'errors': sum(errors),
+            'elapsed_seconds': round(elapsed, 3),
+            'requests_per_second': round(completed / elapsed, 1) if elapsed else None,
+            'p50_ms': round(latencies[completed // 2] * 1000, 2) if completed else None,
+            'p95_ms': round(latencies[int(completed * 0.95)] * 1000, 2) if completed else None,
+        }
@@ -0,0 +1,111 @@
+import re
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from api import benchmark, export
+from api.tasks import shutdown_executor
+
+EXPLAINABLE = re.compile(r'^\s*(SELECT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?!.*USING (COVERING )?INDEX)')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+# Tables api.catalog loads whole by design.
+CATALOG_TABLES = {'api_role', 'api_subscriptionplan'}
+# api.similarity loads every image hash once per process, and again only when
+# its change journal has gaps.
+SIMILARITY_INDEX_LOAD = re.compile(r'"api_image"\."phash" IS NOT NULL')
+
+
+def sequential_scan(line: str, sql: str, plan: list):
+    """
+    Tells whether a plan line reads a whole table.
+
+    SQLite reports a walk of the rowid in primary key order as 'SCAN <table>';
+    with a LIMIT and no sort step it stops after LIMIT rows, so it is not counted.
+
+    Args:
+        line (str): One line of EXPLAIN output.
+        sql (str): The explained statement.
+        plan (list): Every line of its plan.
+
+    Returns:
+        str: The scanned table, or None.
+    """
+    match = SQLITE_SCAN.match(line.strip())
+    if match:
+        bounded = ' LIMIT ' in sql and not any('TEMP B-TREE' in other for other in plan)
+        return None if bounded else match.group(1)
+    match = POSTGRES_SCAN.search(line)
+    return match.group(1) if match else None
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends one request to every route in api/urls.py against a seeded throwaway test database '
+        'and prints the EXPLAIN plan of every query it issues, marking sequential scans. '
+        'Whole-table loads of the role and plan catalogs are expected and not counted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of seeded users.')
+        parser.add_argument('--images', type=int, default=10000, help='Number of seeded images.')
+        parser.add_argument('--plans', type=int, default=10, help='Number of seeded subscription plans.')
+        parser.add_argument('--endpoint', action='append', default=[],
+                            help='Only explain endpoints whose name contains this text. May be repeated.')
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='Exit with an error if any query reads a whole table.')
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root, LOGIN_THROTTLE_RATES={}):
+                scans = self.explain(options)
+                shutdown_executor()
+                export.shutdown_executor()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if scans and options['fail_on_scan']:
+            raise CommandError('Sequential scans:\n' + '\n'.join(scans))
+
+    def explain(self, options) -> list:
+        data = benchmark.seed(users=options['users'], images=options['images'], plans=options['plans'])
+        scenarios = benchmark.endpoints(data)
+        if options['endpoint']:
+            scenarios = [e for e in scenarios if any(text in e.name for text in options['endpoint'])]
+
+        transport = benchmark.InProcessTransport()
+        prefix = connection.ops.explain_query_prefix()
+        scans = []
+        for endpoint in scenarios:
+            headers = {'Authorization': f'Bearer {data["token"]}'} if endpoint.auth else {}
+            path, body, content_type = endpoint.build()
+            status_code, _ = transport.request(endpoint.method, path, body, content_type, headers)
+            queries = transport.last_queries
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{endpoint.name} -> {status_code}, {len(queries)} queries'))
+
+            for query in queries:
+                sql = query['sql']
+                if not EXPLAINABLE.match(sql):
+                    continue
+                with connection.cursor() as cursor:
+                    cursor.execute(f'{prefix} {sql}')
+                    plan = [str(row[-1]) for row in cursor.fetchall()]
+                self.stdout.write(f'  {sql}')
+                for line in plan:
+                    table = sequential_scan(line, sql, plan)
+                    if table in CATALOG_TABLES:
+                        self.stdout.write(f'    {line}  <- catalog load')
+                    elif table and SIMILARITY_INDEX_LOAD.search(sql):
+                        self.stdout.write(f'    {line}  <- similarity index load')
+                    elif table:
+                        scans.append(f'{endpoint.name}: {line.strip()} in {sql}')
+                        self.stdout.write(self.style.WARNING(f'    {line}  <- sequential scan'))
+                    else:
+                        self.stdout.write(f'    {line}')
+        return scans
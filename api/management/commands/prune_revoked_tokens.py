@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes revoked refresh tokens that have expired. Expired tokens are rejected '
+        'by their signature check anyway, so their rows only take up space. Run it periodically, e.g. daily.'
+    )
+
+    def handle(self, *args, **options):
+        deleted, _ = RevokedToken.objects.filter(expires_at__lt=timezone.now()).delete()
+        self.stdout.write(f'Deleted {deleted} expired revoked tokens.')
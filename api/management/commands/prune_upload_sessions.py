@@ -0,0 +1,21 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.models import UploadSession
+from api.uploads import discard, part_path
+
+
+class Command(BaseCommand):
+    help = 'Aborts resumable uploads opened more than --hours ago and removes their received bytes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Age after which an unfinished upload is aborted.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(hours=options['hours'])
+        sessions = list(UploadSession.objects.filter(created_at__lt=cutoff))
+        for session in sessions:
+            session.delete()
+            discard(part_path(session))
+        self.stdout.write(f'Aborted {len(sessions)} stale uploads.')
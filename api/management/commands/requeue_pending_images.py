@@ -0,0 +1,36 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.models import Image
+from api.tasks import enqueue_image_processing, shutdown_executor
+
+
+class Command(BaseCommand):
+    help = ('Processes again the uploads left pending or processing for more than --minutes, '
+            'e.g. because the worker holding them restarted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=10,
+                            help='Age after which a pending or processing upload is considered lost.')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        cutoff = now - datetime.timedelta(minutes=options['minutes'])
+        stale = (
+            Image.objects.filter(status__in=[Image.Status.PENDING, Image.Status.PROCESSING], status_changed_at__lt=cutoff)
+            .exclude(image_file='')
+            .only('id', 'image_file', 'status', 'status_changed_at')
+        )
+        requeued = 0
+        for image in stale:
+            # Skipped if it was picked up since it was read, e.g. by another run of this command.
+            claimed = Image.objects.filter(
+                id=image.id, status=image.status, status_changed_at=image.status_changed_at
+            ).update(status_changed_at=now)
+            if claimed:
+                enqueue_image_processing(image)
+                requeued += 1
+        # Queued images are lost if this process exits first.
+        shutdown_executor(wait=True)
+        self.stdout.write(f'Requeued {requeued} stale uploads.')
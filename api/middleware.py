@@ -0,0 +1,100 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from api import instrumentation
+
+logger = logging.getLogger('api.requests')
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records SQL and serializer timings for every request.
+
+    Each request gets one JSON log line on the 'api.requests' logger, at
+    INFO, or at WARNING for requests slower than SLOW_REQUEST_THRESHOLD_MS,
+    which also list their statements by fingerprint. With SERVER_TIMING set,
+    responses carry the timings in a Server-Timing header too. Nothing is
+    collected when neither would be emitted.
+
+    The middleware is both sync and async capable, so it does not force
+    async views through a thread when served over ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled():
+            return self.get_response(request)
+        started = time.perf_counter()
+        with instrumentation.collect() as metrics:
+            response = self.get_response(request)
+        self.report(request, response, metrics, started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled():
+            return await self.get_response(request)
+        started = time.perf_counter()
+        with instrumentation.collect() as metrics:
+            response = await self.get_response(request)
+        self.report(request, response, metrics, started)
+        return response
+
+    @staticmethod
+    def enabled() -> bool:
+        """
+        Returns whether anything would be done with the request's metrics.
+        """
+        return getattr(settings, 'SERVER_TIMING', False) or logger.isEnabledFor(logging.WARNING)
+
+    def report(self, request, response, metrics, started: float):
+        """
+        Adds the Server-Timing header if enabled and logs the request's record.
+
+        Args:
+            request: The HTTP request.
+            response: The response being returned.
+            metrics (RequestMetrics): Timings collected for the request.
+            started (float): perf_counter() value taken when the request arrived.
+        """
+        total_ms = (time.perf_counter() - started) * 1000
+
+        if getattr(settings, 'SERVER_TIMING', False):
+            response['Server-Timing'] = (
+                f'db;dur={metrics.sql_ms:.1f};desc="{len(metrics.queries)} queries", '
+                f'serializer;dur={metrics.serializer_ms:.1f}, '
+                f'total;dur={total_ms:.1f}'
+            )
+
+        slow = total_ms >= getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 500)
+        level = logging.WARNING if slow else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+
+        match = getattr(request, 'resolver_match', None)
+        slowest_sql, slowest_ms = metrics.slowest
+        record = {
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 2),
+            'queries': len(metrics.queries),
+            'sql_ms': round(metrics.sql_ms, 2),
+            'serializer_ms': round(metrics.serializer_ms, 2),
+            'slowest_query_ms': round(slowest_ms, 2),
+            'slowest_query': instrumentation.fingerprint(slowest_sql) if slowest_sql else None,
+        }
+        if slow:
+            record['sql'] = metrics.fingerprints()
+        logger.log(level, json.dumps(record))
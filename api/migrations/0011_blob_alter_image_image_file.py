@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:14
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_image_status_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('references', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='image_file',
+            field=models.ImageField(default='', storage=api.storage.select_image_storage, upload_to='./images/'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_description_trigram_index(apps, schema_editor):
+    # Lets PostgreSQL answer the image list's ?search= (ILIKE '%...%') from an index.
+    # Other databases have no equivalent and scan the descriptions.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS image_description_trgm_idx ON api_image USING gin (description gin_trgm_ops)'
+    )
+
+
+def drop_description_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS image_description_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['uploaded_by', 'id'], name='image_uploader_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='uploaded_by',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(create_description_trigram_index, drop_description_trigram_index),
+    ]
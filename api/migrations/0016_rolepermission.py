@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The grants of existing roles while checks were hard-coded. Kept here rather
+# than read from settings.DEFAULT_ROLE_PERMISSIONS, which may change later.
+INITIAL_GRANTS = {
+    'beta_player': {
+        'image': ['create', 'update', 'delete'],
+        'role': ['create', 'update', 'delete'],
+        'subscription_plan': ['create', 'update', 'delete'],
+    },
+}
+
+
+def grant_initial_permissions(apps, schema_editor):
+    Role = apps.get_model('api', 'Role')
+    RolePermission = apps.get_model('api', 'RolePermission')
+    RolePermission.objects.bulk_create([
+        RolePermission(role=role, resource=resource, action=action)
+        for role in Role.objects.filter(role__in=list(INITIAL_GRANTS))
+        for resource, actions in INITIAL_GRANTS[role.role].items()
+        for action in actions
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_image_phash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RolePermission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(choices=[('image', 'Image'), ('role', 'Role'), ('subscription_plan', 'Subscription Plan')], max_length=50)),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=20)),
+                ('role', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='permissions', to='api.role')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('role', 'resource', 'action'), name='role_permission_unique')],
+            },
+        ),
+        migrations.RunPython(grant_initial_permissions, migrations.RunPython.noop),
+    ]
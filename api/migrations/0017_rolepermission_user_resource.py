@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_rolepermission'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rolepermission',
+            name='resource',
+            field=models.CharField(choices=[('image', 'Image'), ('role', 'Role'), ('subscription_plan', 'Subscription Plan'), ('user', 'User')], max_length=50),
+        ),
+    ]
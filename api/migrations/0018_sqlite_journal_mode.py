@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:40
+
+from django.conf import settings
+from django.db import migrations
+
+
+def set_journal_mode(apps, schema_editor):
+    # The journal mode is stored in the database file, so it is set once here
+    # rather than on every connection; see multi_user_app.database.
+    connection = schema_editor.connection
+    mode = getattr(settings, 'SQLITE_JOURNAL_MODE', None)
+    if connection.vendor != 'sqlite' or not mode:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA journal_mode = {mode}')
+
+
+class Migration(migrations.Migration):
+    # SQLite cannot switch to WAL inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('api', '0017_rolepermission_user_resource'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_journal_mode, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:45
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_sqlite_journal_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='status_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
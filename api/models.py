@@ -1,5 +1,9 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+from api.storage import select_image_storage
 
 class Role(models.Model):
     """
@@ -10,6 +14,37 @@ class Role(models.Model):
     """
     role = models.CharField(primary_key=True, max_length=50)
 
+class RolePermission(models.Model):
+    """
+    Model granting a role one action on one resource.
+
+    api.permissions compiles these rows into a bitmask per role and resource.
+
+    Attributes:
+        role (Role): The role granted the action.
+        resource (str): The kind of object, e.g. 'image'.
+        action (str): What the role may do with it.
+    """
+    class Resource(models.TextChoices):
+        IMAGE = 'image'
+        ROLE = 'role'
+        SUBSCRIPTION_PLAN = 'subscription_plan'
+        USER = 'user'
+
+    class Action(models.TextChoices):
+        CREATE = 'create'
+        UPDATE = 'update'
+        DELETE = 'delete'
+
+    role = models.ForeignKey(Role, on_delete=models.CASCADE, related_name='permissions')
+    resource = models.CharField(max_length=50, choices=Resource.choices)
+    action = models.CharField(max_length=20, choices=Action.choices)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['role', 'resource', 'action'], name='role_permission_unique'),
+        ]
+
 class SubscriptionPlan(models.Model):
     """
     Model representing subscription plans.
@@ -48,8 +83,90 @@ class Image(models.Model):
         uploaded_by (User): ForeignKey relationship with the User model.
         image_file (ImageField): Image file field.
         description (str): Image description (optional).
+        status (str): Background processing state of the upload.
+        status_changed_at (datetime): When status was last set; finds uploads whose processing was lost.
+        renditions (dict): Stored thumbnail paths keyed by rendition label.
+        phash (int): Difference hash of the pixels, stored signed; see api.similarity.
     """
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        PROCESSING = 'processing'
+        READY = 'ready'
+        FAILED = 'failed'
+
     id = models.AutoField(primary_key=True)
-    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
-    image_file = models.ImageField(upload_to='./images/', default="")
-    description = models.TextField(blank=True)
\ No newline at end of file
+    # Indexed by the (uploaded_by, id) index below.
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, db_index=False)
+    image_file = models.ImageField(upload_to='./images/', storage=select_image_storage, default="")
+    description = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    status_changed_at = models.DateTimeField(default=timezone.now)
+    renditions = models.JSONField(default=dict, blank=True)
+    phash = models.BigIntegerField(null=True, blank=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored file name as loaded, so api.signals can release it when a save replaces it.
+        instance._loaded_file = instance.__dict__.get('image_file')
+        return instance
+
+    class Meta:
+        indexes = [
+            # Per-user listing pages by id; also serves the foreign key lookups.
+            models.Index(fields=['uploaded_by', 'id'], name='image_uploader_id_idx'),
+        ]
+
+
+class Blob(models.Model):
+    """
+    Model tracking a content-addressed file shared by one or more images.
+
+    Attributes:
+        digest (str): SHA-256 of the stored bytes (primary key).
+        name (str): Storage name of the file.
+        references (int): Number of images using the file.
+    """
+    digest = models.CharField(primary_key=True, max_length=64)
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+
+
+class RevokedToken(models.Model):
+    """
+    Model listing refresh tokens that may no longer be used.
+
+    Rows are only needed until the token would have expired anyway; the
+    prune_revoked_tokens command deletes the rest.
+
+    Attributes:
+        jti (str): The token's unique id (primary key).
+        expires_at (datetime): When the token expires.
+    """
+    jti = models.CharField(primary_key=True, max_length=32)
+    expires_at = models.DateTimeField(db_index=True)
+
+
+class UploadSession(models.Model):
+    """
+    Model tracking a resumable image upload.
+
+    Chunks are appended to a part file next to the stored images; completing
+    the session moves it into place and creates the Image.
+
+    Attributes:
+        id (UUID): Session id used in the upload URLs (primary key).
+        user (User): The uploading user.
+        filename (str): Original file name.
+        size (int): Total size announced by the client, in bytes.
+        offset (int): Number of bytes received so far.
+        description (str): Description given to the created image.
+        created_at (datetime): When the session was opened.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    description = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
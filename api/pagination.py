@@ -0,0 +1,45 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.pagination import CursorPagination
+
+
+class ImageCursorPagination(CursorPagination):
+    """
+    Keyset pagination over Image.id.
+
+    The cursor encodes the last seen id, so every page is a single
+    indexed range scan regardless of how deep the client has paged.
+    """
+    ordering = 'id'
+    page_size = getattr(settings, 'IMAGE_LIST_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'IMAGE_LIST_MAX_PAGE_SIZE', 500)
+
+
+def stream_queryset(queryset, serializer_class, chunk_size: int = None) -> StreamingHttpResponse:
+    """
+    Streams a queryset as a JSON array, one serialized row at a time.
+
+    Args:
+        queryset (QuerySet): The rows to stream.
+        serializer_class: Serializer used to render each row.
+        chunk_size (int): Number of rows fetched from the database per round trip.
+
+    Returns:
+        StreamingHttpResponse: A response producing a JSON array.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'IMAGE_STREAM_CHUNK_SIZE', 500)
+
+    def generate():
+        yield '['
+        separator = ''
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            yield separator + json.dumps(serializer_class(obj).data, cls=DjangoJSONEncoder)
+            separator = ','
+        yield ']'
+
+    return StreamingHttpResponse(generate(), content_type='application/json')
@@ -0,0 +1,178 @@
+"""
+Role-based permissions.
+
+Which role may create, update or delete which resource is declared by
+RolePermission rows. PermissionTable compiles them into one bitmask per
+(role, resource) pair and keeps it per process, tagged with the
+RolePermission version from api.versioning like api.catalog, so checking a
+request is one dict lookup and no query. api.signals bumps the version
+whenever a permission or a role changes.
+
+Reads only need a valid token. Superusers may do everything.
+"""
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import BasePermission
+from api.models import RolePermission
+from api.versioning import aget_version, get_version
+
+ACTION_BITS = {action: 1 << index for index, action in enumerate(RolePermission.Action.values)}
+
+# Action each write method needs; views may override it with a ``permission_actions`` dict.
+METHOD_ACTIONS = {
+    'POST': (RolePermission.Action.CREATE,),
+    'PUT': (RolePermission.Action.UPDATE,),
+    'PATCH': (RolePermission.Action.UPDATE,),
+    'DELETE': (RolePermission.Action.DELETE,),
+}
+
+
+class PermissionTable:
+    """
+    Process-local bitmasks compiled from the RolePermission table.
+    """
+
+    def __init__(self):
+        self._snapshot = (None, {})
+        self._lock = threading.Lock()
+
+    def masks(self) -> dict:
+        """
+        Returns the granted actions keyed by (role, resource).
+
+        Returns:
+            dict: Bitmasks of ACTION_BITS keyed by (role name, resource).
+        """
+        token, _ = get_version(RolePermission)
+        version, masks = self._snapshot
+        if version == token:
+            return masks
+        return self._load(token)
+
+    async def amasks(self) -> dict:
+        """
+        Async version of masks.
+
+        Returns:
+            dict: Bitmasks of ACTION_BITS keyed by (role name, resource).
+        """
+        token, _ = await aget_version(RolePermission)
+        version, masks = self._snapshot
+        if version == token:
+            return masks
+        return await sync_to_async(self._load)(token)
+
+    def _load(self, token) -> dict:
+        with self._lock:
+            version, masks = self._snapshot
+            if version != token:
+                # Compiled once per change by one worker; see api.cache_backends.
+                masks = cache.get_or_set(
+                    f'api:permissions:{token}', self._compile, getattr(settings, 'CACHE_SNAPSHOT_TIMEOUT', 3600))
+                self._snapshot = (token, masks)
+            return masks
+
+    def _compile(self) -> dict:
+        masks = {}
+        for role, resource, action in RolePermission.objects.values_list('role', 'resource', 'action'):
+            masks[role, resource] = masks.get((role, resource), 0) | ACTION_BITS[action]
+        return masks
+
+    def invalidate(self):
+        """
+        Drops the compiled table so the next check reloads it.
+        """
+        self._snapshot = (None, {})
+
+
+table = PermissionTable()
+
+
+def required_mask(actions) -> int:
+    """
+    Combines actions into the bitmask a role needs.
+
+    Args:
+        actions: RolePermission.Action values.
+
+    Returns:
+        int: The bitmask.
+    """
+    mask = 0
+    for action in actions:
+        mask |= ACTION_BITS[action]
+    return mask
+
+
+def has_permission(user, resource: str, *actions, masks: dict = None) -> bool:
+    """
+    Tells whether a user may perform actions on a resource.
+
+    Args:
+        user (User): The authenticated user.
+        resource (str): A RolePermission.Resource value.
+        *actions: RolePermission.Action values, all of which are needed.
+        masks (dict): The compiled table, for callers that already hold it.
+
+    Returns:
+        bool: True if the user's role is granted every action, or the user is a superuser.
+    """
+    if user.is_superuser:
+        return True
+    if masks is None:
+        masks = table.masks()
+    required = required_mask(actions)
+    return masks.get((user.role_id, resource), 0) & required == required
+
+
+async def ahas_permission(user, resource: str, *actions) -> bool:
+    """
+    Async version of has_permission for async views.
+
+    Args:
+        user (User): The authenticated user.
+        resource (str): A RolePermission.Resource value.
+        *actions: RolePermission.Action values, all of which are needed.
+
+    Returns:
+        bool: True if the user's role is granted every action, or the user is a superuser.
+    """
+    masks = None if user.is_superuser else await table.amasks()
+    return has_permission(user, resource, *actions, masks=masks)
+
+
+def default_permissions(role: str) -> list:
+    """
+    Returns the permission rows a newly created role starts with.
+
+    Args:
+        role (str): The role name.
+
+    Returns:
+        list: (resource, action) pairs from DEFAULT_ROLE_PERMISSIONS.
+    """
+    granted = getattr(settings, 'DEFAULT_ROLE_PERMISSIONS', {}).get(role, {})
+    return [(resource, action) for resource, actions in granted.items() for action in actions]
+
+
+class RoleBasedPermission(BasePermission):
+    """
+    DRF permission checking write requests against the permission table.
+
+    Applies to views with a ``resource`` attribute; the actions each method
+    needs come from METHOD_ACTIONS or the view's ``permission_actions``.
+    """
+    message = 'Your role is not allowed to do this.'
+
+    def has_permission(self, request, view):
+        resource = getattr(view, 'resource', None)
+        if resource is None:
+            return True
+        actions = getattr(view, 'permission_actions', {}).get(request.method, METHOD_ACTIONS.get(request.method, ()))
+        if not actions:
+            return True
+        user = request.user
+        return bool(user and user.is_authenticated) and has_permission(user, resource, *actions)
@@ -0,0 +1,172 @@
+"""
+Image processing run inside the upload worker pool.
+
+This module only depends on Pillow so that worker processes can import it
+without setting up Django.
+"""
+import os
+import tempfile
+
+from PIL import Image, ImageOps, JpegImagePlugin
+
+HASH_SIZE = 8
+
+
+def rendition_path(path: str, label: str, ext: str) -> str:
+    """
+    Builds the path of a rendition stored next to the original.
+
+    Args:
+        path (str): Path of the original image.
+        label (str): Rendition label, e.g. 'small'.
+        ext (str): File extension including the dot.
+
+    Returns:
+        str: The rendition path, under a 'thumbnails' directory beside the original.
+    """
+    directory, filename = os.path.split(path)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'thumbnails', f'{stem}_{label}{ext}')
+
+
+def difference_hash(image: Image.Image) -> int:
+    """
+    Computes the 64-bit difference hash (dHash) of an image.
+
+    The image is reduced to a 9x8 grayscale grid and each bit tells whether a
+    pixel is darker than its right neighbour, so re-encoded, resized or
+    slightly edited copies differ in only a few bits.
+
+    Args:
+        image (Image): The decoded image, already rotated upright.
+
+    Returns:
+        int: The hash as an unsigned 64-bit integer.
+    """
+    pixels = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS).tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(offset, offset + HASH_SIZE):
+            value = (value << 1) | (pixels[col] < pixels[col + 1])
+    return value
+
+
+def hash_file(file) -> int:
+    """
+    Computes the difference hash of a stored or uploaded image file.
+
+    Every hash stored or compared by api.similarity comes from here, so they
+    all share one decode path.
+
+    Args:
+        file: A path or a readable binary file object.
+
+    Returns:
+        int: The hash as an unsigned 64-bit integer.
+
+    Raises:
+        OSError: If the file cannot be decoded as an image.
+    """
+    with Image.open(file) as image:
+        # JPEGs are decoded at a reduced scale; the hash only needs a few pixels.
+        image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+        return difference_hash(ImageOps.exif_transpose(image))
+
+
+def process_image(path: str, sizes: dict) -> tuple:
+    """
+    Validates an uploaded image, strips its metadata, writes thumbnails and hashes it.
+
+    The original is never modified, since it is a content-addressed blob that
+    other images and readers may share. When it carries metadata, a copy
+    without it is written to a new file beside it for the caller to store.
+
+    Args:
+        path (str): Absolute path of the stored original.
+        sizes (dict): Maps a rendition label to the maximum edge length in pixels.
+
+    Returns:
+        tuple: (renditions, hash, stripped), where renditions maps each
+        rendition label to the path it was written to, hash is the image's
+        difference hash and stripped is the path of the metadata-free copy,
+        or None if the original has no metadata.
+
+    Raises:
+        OSError: If the file cannot be decoded as an image.
+    """
+    with Image.open(path) as image:
+        image.verify()
+
+    with Image.open(path) as image:
+        image_format = image.format
+        has_metadata = bool(image.getexif()) or 'icc_profile' in image.info
+        save_options = {}
+        if image_format == 'JPEG':
+            # Reuse the original quantization tables so re-encoding keeps its quality.
+            save_options = {'qtables': image.quantization, 'subsampling': JpegImagePlugin.get_sampling(image)}
+        if 'transparency' in image.info:
+            save_options['transparency'] = image.info['transparency']
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    stripped = None
+    if has_metadata:
+        # Re-encode without the info dict, which drops EXIF (GPS, camera serials, ...)
+        # while keeping the pixels and, for palette images, the palette.
+        clean = image.copy()
+        clean.info = {}
+        directory, filename = os.path.split(path)
+        fd, stripped = tempfile.mkstemp(dir=directory, prefix='.stripped-', suffix=os.path.splitext(filename)[1])
+        with os.fdopen(fd, 'wb') as file:
+            clean.save(file, format=image_format, **save_options)
+
+    # Not difference_hash(image): uploads are checked against the index with
+    # hash_file, whose reduced-scale JPEG decode gives slightly different pixels.
+    image_hash = hash_file(path)
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        ext, rendition_format = '.png', 'PNG'
+    else:
+        ext, rendition_format = '.jpg', 'JPEG'
+        image = image.convert('RGB')
+
+    renditions = {}
+    for label, edge in sorted(sizes.items(), key=lambda item: item[1]):
+        target = rendition_path(path, label, ext)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        thumbnail = image.copy()
+        thumbnail.thumbnail((edge, edge))
+        thumbnail.save(target, format=rendition_format)
+        renditions[label] = target
+    return renditions, image_hash, stripped
+
+
+def load_pixels(path: str, size: tuple, mode: str, fit: str = 'crop') -> bytes:
+    """
+    Decodes an image and returns its pixels at a fixed size, for api.export.
+
+    Args:
+        path (str): Absolute path of the stored image.
+        size (tuple): (width, height) of the output.
+        mode (str): Pillow color mode of the output, 'L', 'RGB' or 'RGBA'.
+        fit (str): 'crop' to fill the size and cut the overflow, 'pad' to fit
+            inside it with black borders, 'stretch' to ignore the aspect ratio.
+
+    Returns:
+        bytes: Row-major pixel data, or None if the file cannot be decoded.
+    """
+    try:
+        with Image.open(path) as image:
+            # JPEGs are decoded at the smallest scale that still covers the output.
+            image.draft('L' if mode == 'L' else 'RGB', size)
+            image = ImageOps.exif_transpose(image).convert(mode)
+    except OSError:
+        return None
+    if fit == 'crop':
+        image = ImageOps.fit(image, size)
+    elif fit == 'pad':
+        image = ImageOps.pad(image, size)
+    else:
+        image = image.resize(size)
+    return image.tobytes()
@@ -1,72 +1,116 @@
+import re
+
+from django.conf import settings
+from django.core.files import File
+from django.core.validators import validate_image_file_extension
 from django.forms import ValidationError
 from rest_framework import serializers
-from .models import Role, User, Image, SubscriptionPlan
+from .models import Role, User, Image, SubscriptionPlan, UploadSession
+from . import catalog
+from .instrumentation import track_serializer
 from django.contrib.auth.models import User as User_auth
 from django.contrib.auth import authenticate
 from rest_framework.exceptions import AuthenticationFailed
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError
 
-class UserSerializer(serializers.ModelSerializer):
+class CatalogRelatedField(serializers.PrimaryKeyRelatedField):
     """
-    Serializer for the User model.
+    Primary key related field that resolves values from an api.catalog Catalog instead of querying.
 
     Attributes:
-        role: PrimaryKeyRelatedField for the User's role.
+        catalog (Catalog): The catalog holding the related rows.
     """
-    role = serializers.PrimaryKeyRelatedField(queryset=Role.objects.all())
+    def __init__(self, catalog, **kwargs):
+        self.catalog = catalog
+        kwargs.setdefault('queryset', catalog.model.objects.all())
+        super().__init__(**kwargs)
 
-    class Meta:
-        model = User
-        fields = ['id', 'username', 'role', 'password']
-        extra_kwargs = {
-            'password': {'write_only': True}
-        }
-
-    def validate(self, attrs):
+    def to_internal_value(self, data):
         """
-        Validate the username to ensure it contains only letters and numbers.
+        Look up the related object in the catalog.
 
         Args:
-            attrs (dict): Dictionary of validated data.
+            data: The primary key sent by the client.
 
         Returns:
-            dict: Validated data.
+            Model: The related object.
         """
-        username = attrs.get('username', '')
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        obj = self.catalog.get(str(data))
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+class TimedSerializerMixin:
+    """
+    Adds validation and representation time to the current request's serializer time.
+    """
+    def is_valid(self, *args, **kwargs):
+        with track_serializer():
+            return super().is_valid(*args, **kwargs)
 
-        if not username.isalnum():
-            raise serializers.ValidationError(
-                "Username must contain only letters and numbers.")
+    def to_representation(self, instance):
+        with track_serializer():
+            return super().to_representation(instance)
 
-        return attrs
+class SparseFieldsetMixin:
+    """
+    Lets a serializer be narrowed to some of its fields with the ``fields`` argument.
 
-    def create(self, validated_data):
+    Views read the client's choice from ``?fields=`` or ``?exclude=`` with
+    requested_fields and pass model_fields to QuerySet.only(), so unused
+    columns are neither fetched nor serialized.
+    """
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, params):
         """
-        Create a new User instance.
+        Reads the fieldset requested with ``?fields=a,b`` or ``?exclude=a,b``.
 
         Args:
-            validated_data (dict): Dictionary of validated data.
+            params (QueryDict): The query parameters.
 
         Returns:
-            User: Created User instance.
-        """
-        role = validated_data.pop('role', None)
-        password = validated_data.pop('password', None)
+            list: The selected field names in declaration order, or None for all fields.
 
-        try:
-            role = Role.objects.get(role=role.role)
-        except Role.DoesNotExist:
-            raise ValidationError("Role with provided ID does not exist.")
-
-        instance = self.Meta.model(role=role, **validated_data)
+        Raises:
+            serializers.ValidationError: If a name is not a readable field of the serializer.
+        """
+        if 'fields' not in params and 'exclude' not in params:
+            return None
+        available = [name for name, field in cls().fields.items() if not field.write_only]
+        selected = set(available)
+        for param in ('fields', 'exclude'):
+            if param not in params:
+                continue
+            names = {name.strip() for name in params[param].split(',') if name.strip()}
+            unknown = names - set(available)
+            if unknown:
+                raise serializers.ValidationError({param: f"Unknown fields: {', '.join(sorted(unknown))}."})
+            selected = selected & names if param == 'fields' else selected - names
+        return [name for name in available if name in selected]
+
+    @classmethod
+    def model_fields(cls, fields) -> list:
+        """
+        Returns the model columns needed to serialize a fieldset.
 
-        if password is not None:
-            instance.set_password(password)
+        Args:
+            fields (list): Serializer field names.
 
-        instance.save()
-        return instance
+        Returns:
+            list: Names of concrete model fields; the primary key is always loaded.
+        """
+        model = cls.Meta.model
+        columns = {field.name for field in model._meta.concrete_fields}
+        return [model._meta.pk.name] + [name for name in fields if name in columns and name != model._meta.pk.name]
 
-class RoleSerializer(serializers.ModelSerializer):
+class RoleSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Role model.
 
@@ -79,7 +123,10 @@ class RoleSerializer(serializers.ModelSerializer):
 
     def validate_role(self, value):
         """
-        Validate the 'role' field to ensure it is one of the allowed roles.
+        Validate the 'role' field to ensure it is a slug.
+
+        What a role may do is stored in RolePermission rather than fixed by
+        its name; see api.permissions.
 
         Args:
             value: The value of the 'role' field.
@@ -87,22 +134,21 @@ class RoleSerializer(serializers.ModelSerializer):
         Returns:
             str: Validated 'role' value.
         """
-        allowed_roles = ['beta_player', 'company_user', 'growth_plan_subscriber']
-
-        if value not in allowed_roles:
+        if not re.fullmatch(r'[a-z0-9_]+', value):
             raise serializers.ValidationError(
-                f"Invalid role. Allowed roles are {', '.join(allowed_roles)}")
+                "Invalid role. Roles may only contain lowercase letters, digits and underscores.")
 
         return value
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the User model.
 
     Attributes:
         role: PrimaryKeyRelatedField for the User's role.
     """
-    role = serializers.PrimaryKeyRelatedField(queryset=Role.objects.all())
+    role = CatalogRelatedField(catalog.roles)
+    subscription_plan = CatalogRelatedField(catalog.subscription_plans, allow_null=True, required=False)
 
     class Meta:
         model = User
@@ -143,9 +189,9 @@ class UserSerializer(serializers.ModelSerializer):
             serializers.ValidationError: If the role is 'growth_plan_subscriber' and subscription_plan is empty.
             serializers.ValidationError: If the role is not 'growth_plan_subscriber' and subscription_plan is provided.
         """
-        if self.initial_data['role'] == 'growth_plan_subscriber' and not value:
+        if self.initial_data.get('role') == 'growth_plan_subscriber' and not value:
             raise serializers.ValidationError("Subscription plan is required for 'growth_plan_subscriber'.")
-        if self.initial_data['role'] != 'growth_plan_subscriber' and value:
+        if self.initial_data.get('role') != 'growth_plan_subscriber' and value:
             raise serializers.ValidationError("Subscription plan is only for 'growth_plan_subscriber'.")
         return value
 
@@ -162,11 +208,6 @@ class UserSerializer(serializers.ModelSerializer):
         role = validated_data.pop('role', None)
         password = validated_data.pop('password', None)
 
-        try:
-            role = Role.objects.get(role=role.role)
-        except Role.DoesNotExist:
-            raise ValidationError("Role with provided ID does not exist.")
-
         instance = self.Meta.model(role=role, **validated_data)
 
         if password is not None:
@@ -175,18 +216,140 @@ class UserSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
-class ImageSerializer(serializers.ModelSerializer):
+class ImageSerializer(SparseFieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Image model.
     """
     class Meta:
         model = Image
-        fields = ['id', 'uploaded_by', 'image_file', 'description']
+        fields = ['id', 'uploaded_by', 'image_file', 'description', 'status', 'renditions']
+        read_only_fields = ['status', 'renditions']
 
-class SubscriptionPlanSerializer(serializers.ModelSerializer):
+class SubscriptionPlanSerializer(SparseFieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the SubscriptionPlan model.
     """
     class Meta:
         model = SubscriptionPlan
         fields = '__all__'
+
+class UploadSessionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for the UploadSession model.
+    """
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'offset', 'description']
+        read_only_fields = ['offset']
+
+    def validate_filename(self, value):
+        """
+        Validate that the filename has an image extension.
+
+        The completed file is stored under this name, and files are served
+        with the Content-Type its extension implies.
+
+        Args:
+            value (str): The client's filename.
+
+        Returns:
+            str: Validated filename.
+        """
+        try:
+            validate_image_file_extension(File(None, name=value))
+        except ValidationError as error:
+            raise serializers.ValidationError(error.messages)
+        return value
+
+    def validate_size(self, value):
+        """
+        Validate the announced size against IMAGE_UPLOAD_MAX_SIZE.
+
+        Args:
+            value (int): The announced file size in bytes.
+
+        Returns:
+            int: Validated size.
+        """
+        max_size = getattr(settings, 'IMAGE_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+        if not 0 < value <= max_size:
+            raise serializers.ValidationError(f"Size must be between 1 and {max_size} bytes.")
+        return value
+
+class ImageBatchUpdateSerializer(serializers.Serializer):
+    """
+    Serializer for one update in an image batch.
+    """
+    id = serializers.IntegerField()
+    description = serializers.CharField(allow_blank=True)
+
+class ImageBatchSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    Serializer for a batch of image operations.
+
+    Attributes:
+        delete: Ids of the images to delete.
+        update: New descriptions keyed by image id.
+    """
+    delete = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    update = ImageBatchUpdateSerializer(many=True, required=False, default=list)
+
+    def validate(self, attrs):
+        """
+        Validate the batch size and that no image is both deleted and updated.
+
+        Args:
+            attrs (dict): Dictionary of validated data.
+
+        Returns:
+            dict: Validated data.
+        """
+        updated = [item['id'] for item in attrs['update']]
+        size = len(attrs['delete']) + len(updated)
+        max_size = getattr(settings, 'IMAGE_BATCH_MAX_SIZE', 1000)
+        if not 0 < size <= max_size:
+            raise serializers.ValidationError(f"A batch must hold between 1 and {max_size} operations.")
+        if len(set(updated)) != len(updated):
+            raise serializers.ValidationError("An image can only be updated once per batch.")
+        if set(updated) & set(attrs['delete']):
+            raise serializers.ValidationError("An image cannot be both updated and deleted.")
+        return attrs
+
+class ImageExportSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    Serializer for an image export request.
+
+    Attributes:
+        ids: Ids of the images to export, in array order.
+        width: Output width in pixels.
+        height: Output height in pixels.
+        mode: Color mode of the output.
+        fit: How images with another aspect ratio are fitted; see api.processing.load_pixels.
+        normalize: Return float32 values in [0, 1] instead of uint8.
+        format: 'npy' for the bare array, 'npz' for an archive that also holds the ids.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), min_length=1)
+    width = serializers.IntegerField(min_value=1)
+    height = serializers.IntegerField(min_value=1)
+    mode = serializers.ChoiceField(['L', 'RGB', 'RGBA'], default='RGB')
+    fit = serializers.ChoiceField(['crop', 'pad', 'stretch'], default='crop')
+    normalize = serializers.BooleanField(default=False)
+    format = serializers.ChoiceField(['npy', 'npz'], default='npy')
+
+    def validate(self, attrs):
+        """
+        Validate the number of images and the output size against the export limits.
+
+        Args:
+            attrs (dict): Dictionary of validated data.
+
+        Returns:
+            dict: Validated data.
+        """
+        max_images = getattr(settings, 'IMAGE_EXPORT_MAX_IMAGES', 1000)
+        max_edge = getattr(settings, 'IMAGE_EXPORT_MAX_EDGE', 1024)
+        if len(attrs['ids']) > max_images:
+            raise serializers.ValidationError(f"An export can hold at most {max_images} images.")
+        if max(attrs['width'], attrs['height']) > max_edge:
+            raise serializers.ValidationError(f"Width and height can be at most {max_edge} pixels.")
+        return attrs
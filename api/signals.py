@@ -0,0 +1,198 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from api.authentication import unknown_usernames, user_cache
+from api.instrumentation import record_query
+from api.permissions import default_permissions
+from api.similarity import from_db, index_image, unindex_image
+from api.versioning import bump_version, bump_versions
+from api.models import Image, Role, RolePermission, SubscriptionPlan, User
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drops a saved or deleted user from the user cache and the unknown username cache.
+    """
+    user_cache.delete(instance.username)
+    unknown_usernames.delete(instance.username)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_claims(sender, instance, **kwargs):
+    """
+    Makes the role and plan claims in the user's tokens stale when the user is saved or deleted.
+    """
+    bump_version(User, instance.pk)
+
+
+@receiver(pre_delete, sender=Role)
+@receiver(pre_delete, sender=SubscriptionPlan)
+def invalidate_member_claims(sender, instance, **kwargs):
+    """
+    Makes the token claims of a deleted role's or plan's users stale, since the database nulls them without signals.
+    """
+    field = 'role' if sender is Role else 'subscription_plan'
+    bump_versions(User, User.objects.filter(**{field: instance.pk}).values_list('pk', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Role)
+@receiver([post_save, post_delete], sender=SubscriptionPlan)
+def invalidate_cached_users(sender, **kwargs):
+    """
+    Clears the user cache when a role or plan changes, since cached users hold copies of them.
+    """
+    user_cache.clear()
+
+
+@receiver(post_save, sender=Role)
+def grant_default_permissions(sender, instance, created, raw=False, **kwargs):
+    """
+    Gives a new role the permissions listed for it in settings.DEFAULT_ROLE_PERMISSIONS.
+    """
+    if created and not raw:
+        RolePermission.objects.bulk_create(
+            [RolePermission(role=instance, resource=resource, action=action)
+             for resource, action in default_permissions(instance.role)],
+            ignore_conflicts=True,
+        )
+
+
+@receiver([post_save, post_delete], sender=Role)
+@receiver([post_save, post_delete], sender=RolePermission)
+def invalidate_permissions(sender, **kwargs):
+    """
+    Makes every process recompile its permission table when a role or permission changes.
+    """
+    bump_version(RolePermission)
+
+
+_deferred_image_deletes = contextvars.ContextVar('api_deferred_image_deletes', default=None)
+
+
+@contextmanager
+def defer_image_deletes():
+    """
+    Collects the images deleted in the enclosed block instead of releasing their files one by one.
+
+    Their ETags are not invalidated either; the caller releases the files in
+    bulk and bumps the Image version once.
+
+    Yields:
+        list: The deleted Image instances.
+    """
+    deleted = []
+    token = _deferred_image_deletes.set(deleted)
+    try:
+        yield deleted
+    finally:
+        _deferred_image_deletes.reset(token)
+
+
+@receiver(post_delete, sender=Image)
+def release_image_file(sender, instance, **kwargs):
+    """
+    Releases a deleted image's stored file, removing it and its thumbnails when no other image uses it.
+    """
+    deferred = _deferred_image_deletes.get()
+    if deferred is not None:
+        deferred.append(instance)
+        return
+    storage = instance.image_file.storage
+    if instance.image_file.name and hasattr(storage, 'release'):
+        if storage.release(instance.image_file.name):
+            for name in instance.renditions.values():
+                transaction.on_commit(lambda name=name: storage.delete(name))
+
+
+@receiver(pre_save, sender=Image)
+def remember_replaced_image_file(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Notes the stored file an existing image is about to stop using, e.g. when a PUT uploads a new one.
+    """
+    instance._replaced_file = None
+    if raw or instance._state.adding or (update_fields is not None and 'image_file' not in update_fields):
+        return
+    if getattr(instance, '_loaded_file', None) is not None:
+        previous = instance._loaded_file
+    else:
+        # Loaded with the file deferred, or built by hand.
+        previous = Image.objects.filter(pk=instance.pk).values_list('image_file', flat=True).first()
+    if previous and previous != instance.image_file.name:
+        instance._replaced_file = previous
+
+
+@receiver(post_save, sender=Image)
+def release_replaced_image_file(sender, instance, **kwargs):
+    """
+    Releases the file noted by remember_replaced_image_file once the image is saved without it.
+    """
+    previous, instance._replaced_file = getattr(instance, '_replaced_file', None), None
+    instance._loaded_file = instance.image_file.name
+    storage = instance.image_file.storage
+    if previous and hasattr(storage, 'release'):
+        storage.release(previous)
+
+
+@receiver(post_save, sender=Image)
+def index_saved_image(sender, instance, **kwargs):
+    """
+    Adds an image saved with a hash to the near-duplicate index.
+    """
+    update_fields = kwargs.get('update_fields')
+    if instance.phash is not None and (update_fields is None or 'phash' in update_fields):
+        index_image(instance.pk, from_db(instance.phash))
+
+
+@receiver(post_delete, sender=Image)
+def unindex_deleted_image(sender, instance, **kwargs):
+    """
+    Removes a deleted image from the near-duplicate index.
+    """
+    unindex_image(instance.pk)
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    Applies settings.SQLITE_PRAGMAS to every new SQLite connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    Lets api.middleware.QueryInstrumentationMiddleware time the queries run on every connection.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver([post_save, post_delete], sender=Role)
+@receiver([post_save, post_delete], sender=SubscriptionPlan)
+@receiver([post_save, post_delete], sender=Image)
+def bump_model_version(sender, **kwargs):
+    """
+    Invalidates the ETags of a model whose rows changed.
+    """
+    if sender is Image and _deferred_image_deletes.get() is not None:
+        return
+    bump_version(sender)
+
+
+@receiver(post_delete, sender=User)
+def bump_image_version(sender, **kwargs):
+    """
+    Invalidates image ETags when a user is deleted, since the database nulls uploaded_by without signals.
+    """
+    bump_version(Image)
@@ -0,0 +1,343 @@
+"""
+Near-duplicate search over image difference hashes.
+
+Every processed image stores a 64-bit dHash (api.processing.difference_hash);
+images whose hashes differ in few bits look alike. HammingIndex finds them
+with multi-index hashing: the hash is split into four 16-bit chunks, each
+with its own table. Two hashes within distance r agree to within r // 4 bits
+on at least one chunk, so a search only probes the buckets near each of the
+query's chunks and checks the ids found there, instead of comparing against
+every image.
+
+Each process keeps one index. It is loaded from the database on first use
+and updated as this process hashes and deletes images. Every such change is
+also appended to a journal in the shared cache, and every
+IMAGE_SIMILARITY_INDEX_TTL seconds a background thread replays the entries
+written since the last refresh, so the index picks up changes made by other
+processes without reloading every hash. Only when entries are missing, e.g.
+evicted, is the index rebuilt from the database, also in the background while
+the old one keeps serving. Results are read back from the database, so ids of
+images deleted elsewhere never reach a response.
+"""
+import threading
+import time
+from functools import lru_cache
+from itertools import combinations
+
+from django.conf import settings
+from django.db import connection
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from api.cache_backends import shared_cache
+from api.models import Image
+from api.processing import hash_file
+
+HASH_BITS = 64
+CHUNKS = 4
+MAX_DISTANCE = 16
+
+# Changes older than this are dropped from the journal; a process that has not
+# refreshed for that long rebuilds its index instead.
+JOURNAL_TIMEOUT = 86400
+# Refreshes further behind the journal than this rebuild instead of replaying.
+JOURNAL_MAX_REPLAY = 10000
+_JOURNAL_SEQ_KEY = 'api:similarity:seq'
+
+_index = None
+_index_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+class DuplicateImage(APIException):
+    """
+    Raised when an upload is a near-duplicate of a stored image.
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_code = 'duplicate'
+
+    def __init__(self, image_id: int, distance: int):
+        super().__init__('This image is a near-duplicate of an existing image.')
+        # Kept as numbers; APIException would turn every value into a string.
+        self.detail = {'detail': self.detail, 'duplicate_of': image_id, 'distance': distance}
+
+
+def to_db(value: int) -> int:
+    """
+    Converts an unsigned 64-bit hash to the signed value stored in Image.phash.
+
+    Args:
+        value (int): The unsigned hash.
+
+    Returns:
+        int: The signed 64-bit value.
+    """
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_db(value: int) -> int:
+    """
+    Converts a stored Image.phash back to the unsigned hash.
+
+    Args:
+        value (int): The signed 64-bit value.
+
+    Returns:
+        int: The unsigned hash.
+    """
+    return value & ((1 << HASH_BITS) - 1)
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(bits: int, radius: int) -> tuple:
+    masks = [0]
+    for flipped in range(1, radius + 1):
+        masks += [sum(1 << bit for bit in combo) for combo in combinations(range(bits), flipped)]
+    return tuple(masks)
+
+
+class HammingIndex:
+    """
+    Multi-index hash table over 64-bit hashes, safe to share between threads.
+
+    Attributes:
+        hashes (dict): Maps each indexed id to its hash.
+        seq (int): Position in the change journal the index is up to date with.
+        refreshed_at (float): monotonic() time of the last load or refresh.
+    """
+
+    def __init__(self):
+        self.hashes = {}
+        self.seq = 0
+        self.refreshed_at = time.monotonic()
+        self._chunk_bits = HASH_BITS // CHUNKS
+        self._tables = [{} for _ in range(CHUNKS)]
+        self._lock = threading.Lock()
+
+    def _chunks(self, value: int):
+        mask = (1 << self._chunk_bits) - 1
+        return [(value >> (i * self._chunk_bits)) & mask for i in range(CHUNKS)]
+
+    def add(self, key: int, value: int):
+        """
+        Indexes a hash, replacing the previous hash of the same id.
+
+        Args:
+            key (int): The image id.
+            value (int): The unsigned hash.
+        """
+        with self._lock:
+            self._discard(key)
+            self.hashes[key] = value
+            for table, chunk in zip(self._tables, self._chunks(value)):
+                table.setdefault(chunk, set()).add(key)
+
+    def remove(self, key: int):
+        """
+        Drops an id from the index if it is there.
+
+        Args:
+            key (int): The image id.
+        """
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key: int):
+        value = self.hashes.pop(key, None)
+        if value is None:
+            return
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            bucket = table[chunk]
+            bucket.discard(key)
+            if not bucket:
+                del table[chunk]
+
+    def search(self, value: int, radius: int) -> list:
+        """
+        Finds the indexed hashes within a Hamming distance.
+
+        Args:
+            value (int): The unsigned hash to search for.
+            radius (int): Maximum number of differing bits, at most MAX_DISTANCE.
+
+        Returns:
+            list: (distance, id) pairs, closest first.
+        """
+        masks = _flip_masks(self._chunk_bits, radius // CHUNKS)
+        with self._lock:
+            candidates = set()
+            for table, chunk in zip(self._tables, self._chunks(value)):
+                for mask in masks:
+                    bucket = table.get(chunk ^ mask)
+                    if bucket:
+                        candidates |= bucket
+            matches = []
+            for key in candidates:
+                distance = (self.hashes[key] ^ value).bit_count()
+                if distance <= radius:
+                    matches.append((distance, key))
+        matches.sort()
+        return matches
+
+    def __len__(self):
+        return len(self.hashes)
+
+
+def _change_key(seq: int) -> str:
+    return f'api:similarity:change:{seq}'
+
+
+def _journal_seq() -> int:
+    return shared_cache().get(_JOURNAL_SEQ_KEY, 0)
+
+
+def _journal(image_id: int, value):
+    # incr is atomic on Redis but not on every backend; add is, so a position
+    # another process claimed at the same time is skipped.
+    cache = shared_cache()
+    cache.add(_JOURNAL_SEQ_KEY, 0, None)
+    while True:
+        seq = cache.incr(_JOURNAL_SEQ_KEY)
+        if cache.add(_change_key(seq), (image_id, value), JOURNAL_TIMEOUT):
+            return
+
+
+def _load() -> HammingIndex:
+    index = HammingIndex()
+    # Read first, so changes made while the rows load are replayed next time.
+    index.seq = _journal_seq()
+    rows = Image.objects.filter(phash__isnull=False).values_list('id', 'phash')
+    for image_id, value in rows.iterator(chunk_size=10000):
+        index.add(image_id, from_db(value))
+    return index
+
+
+def _replay(index: HammingIndex) -> bool:
+    seq = _journal_seq()
+    if seq < index.seq or seq - index.seq > JOURNAL_MAX_REPLAY:
+        return False
+    keys = [_change_key(position) for position in range(index.seq + 1, seq + 1)]
+    changes = shared_cache().get_many(keys)
+    if len(changes) != len(keys):
+        return False
+    for key in keys:
+        image_id, value = changes[key]
+        if value is None:
+            index.remove(image_id)
+        else:
+            index.add(image_id, value)
+    index.seq = seq
+    return True
+
+
+def get_index() -> HammingIndex:
+    """
+    Returns this process's index, loading it from the database on first use.
+
+    Once the index is older than IMAGE_SIMILARITY_INDEX_TTL seconds, a
+    background thread refreshes it while the current one keeps being returned.
+
+    Returns:
+        HammingIndex: The index of every hashed image.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = _load()
+            return _index
+        index = _index
+    ttl = getattr(settings, 'IMAGE_SIMILARITY_INDEX_TTL', 300)
+    if ttl is not None and time.monotonic() - index.refreshed_at > ttl and _refresh_lock.acquire(blocking=False):
+        threading.Thread(target=_refresh_in_background, daemon=True).start()
+    return index
+
+
+def _refresh_in_background():
+    try:
+        refresh_index()
+    finally:
+        _refresh_lock.release()
+        # The thread opened its own connection.
+        connection.close()
+
+
+def refresh_index():
+    """
+    Brings this process's index up to date with the change journal.
+
+    The loaded index is updated in place from the journal, or rebuilt from the
+    database and swapped in when the journal no longer covers the gap.
+    Does nothing if the index has not been loaded.
+    """
+    global _index
+    index = _index
+    if index is None:
+        return
+    if not _replay(index):
+        rebuilt = _load()
+        with _index_lock:
+            # Left unloaded if reset_index ran meanwhile.
+            if _index is index:
+                _index = rebuilt
+        index = rebuilt
+    index.refreshed_at = time.monotonic()
+
+
+def index_image(image_id: int, value: int):
+    """
+    Adds a newly hashed image to this process's index and to the change journal.
+
+    Args:
+        image_id (int): The image id.
+        value (int): The unsigned hash.
+    """
+    if _index is not None:
+        _index.add(image_id, value)
+    _journal(image_id, value)
+
+
+def unindex_image(image_id: int):
+    """
+    Removes a deleted image from this process's index and records it in the change journal.
+
+    Args:
+        image_id (int): The image id.
+    """
+    if _index is not None:
+        _index.remove(image_id)
+    _journal(image_id, None)
+
+
+def reset_index():
+    """
+    Drops the index so the next search reloads it.
+    """
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def check_duplicate(file, value: int = None) -> int:
+    """
+    Hashes an upload and rejects it if it is within IMAGE_DUPLICATE_DISTANCE of a stored image.
+
+    Args:
+        file: The uploaded file or a path to it.
+        value (int): The upload's hash from hash_file, if already computed.
+
+    Returns:
+        int: The upload's hash as stored in Image.phash, or None if IMAGE_DUPLICATE_DISTANCE is not set.
+
+    Raises:
+        DuplicateImage: If a stored image is that close.
+    """
+    distance = getattr(settings, 'IMAGE_DUPLICATE_DISTANCE', None)
+    if distance is None:
+        return None
+    if value is None:
+        value = hash_file(file)
+        if hasattr(file, 'seek'):
+            file.seek(0)
+    matches = get_index().search(value, min(distance, MAX_DISTANCE))
+    if matches:
+        raise DuplicateImage(matches[0][1], matches[0][0])
+    return to_db(value)
@@ -0,0 +1,245 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import transaction
+from django.db.models import F
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps one copy of each distinct upload.
+
+    Files are stored under ``<upload dir>/blobs/<aa>/<sha256><ext>``, where
+    the digest is taken over the uploaded bytes. Saving content that is
+    already stored writes nothing and only bumps the blob's reference count
+    in the Blob table; ``release`` removes the file once no rows use it.
+
+    The Blob row of a digest is the lock both paths share: ``_save`` checks
+    for and writes the file while holding it, and ``delete`` only removes a
+    blob's file while holding it and finding no references, so a file being
+    deleted is never handed to a concurrent save of the same content.
+    """
+
+    def _save(self, name, content):
+        from api.models import Blob
+
+        digest = getattr(content, 'content_digest', None)
+        staged = None
+        if digest is None:
+            # Hashed while it is written, so the content is only read once.
+            staged, digest = self._write_temporary(name, content)
+        target = self.blob_name(name, digest)
+
+        try:
+            with transaction.atomic():
+                blob, created = Blob.objects.select_for_update().get_or_create(
+                    digest=digest, defaults={'name': target, 'references': 1}
+                )
+                if not created:
+                    Blob.objects.filter(digest=digest).update(references=F('references') + 1)
+                if not self.exists(blob.name):
+                    if staged is not None:
+                        self._move_into_place(staged, blob.name)
+                        staged = None
+                    else:
+                        saved = super()._save(blob.name, content)
+                        if saved != blob.name:
+                            # Staged by another request meanwhile; keep that copy.
+                            super().delete(saved)
+        finally:
+            if staged is not None:
+                os.remove(staged)
+        return blob.name
+
+    def _write_temporary(self, name: str, content) -> tuple:
+        directory = self.path(os.path.dirname(name))
+        os.makedirs(directory, exist_ok=True)
+        sha256 = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False) as staged:
+            try:
+                for chunk in content.chunks():
+                    sha256.update(chunk)
+                    staged.write(chunk)
+            except BaseException:
+                os.remove(staged.name)
+                raise
+        content.seek(0)
+        return staged.name, sha256.hexdigest()
+
+    def _move_into_place(self, path: str, name: str):
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        os.replace(path, full_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+    def _digest_of(self, name: str):
+        stem = os.path.splitext(os.path.basename(name))[0]
+        in_blobs = os.path.basename(os.path.dirname(os.path.dirname(name))) == 'blobs'
+        return stem if in_blobs and len(stem) == 64 else None
+
+    def blob_name(self, name: str, digest: str) -> str:
+        """
+        Returns where content with a digest is stored.
+
+        Args:
+            name (str): The name the content is saved under.
+            digest (str): Hex SHA-256 of the content.
+
+        Returns:
+            str: The blob name.
+        """
+        ext = os.path.splitext(name)[1].lower()
+        return os.path.join(os.path.dirname(name), 'blobs', digest[:2], f'{digest}{ext}')
+
+    def stage(self, name: str, content) -> str:
+        """
+        Writes content to its blob path ahead of ``save``, without touching the database.
+
+        Lets callers hash and write an upload off the thread that runs the
+        ORM; the ``save`` that follows reuses the digest and, unless the file
+        was deleted meanwhile, finds it already written, so it only records
+        the reference.
+
+        Args:
+            name (str): The name the content will be saved under.
+            content (File): The content.
+
+        Returns:
+            str: The blob name.
+        """
+        staged, content.content_digest = self._write_temporary(name, content)
+        target = self.blob_name(name, content.content_digest)
+        if self.exists(target):
+            os.remove(staged)
+        else:
+            self._move_into_place(staged, target)
+        return target
+
+    def digest(self, content) -> str:
+        """
+        Computes the SHA-256 of a file chunk by chunk.
+
+        Args:
+            content (File): The file to hash.
+
+        Returns:
+            str: The hex digest.
+        """
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+        return sha256.hexdigest()
+
+    def delete(self, name):
+        """
+        Deletes a file, unless it is a blob that is referenced again.
+
+        Args:
+            name (str): The stored file name.
+        """
+        self.delete_many([name])
+
+    def delete_many(self, names: list):
+        """
+        Deletes files, skipping blobs that are referenced again, with a fixed number of queries.
+
+        Blob files are only removed while their Blob rows are held and no
+        image uses them, since a save of the same content may have recorded
+        a new reference after the last one was released.
+
+        Args:
+            names (list): Stored file names.
+        """
+        from api.models import Blob
+
+        blobs = {}
+        for name in names:
+            digest = self._digest_of(name)
+            if digest is None:
+                super().delete(name)
+            else:
+                blobs[digest] = name
+        if not blobs:
+            return
+        with transaction.atomic():
+            # Placeholder rows hold released digests, so a concurrent save waits for the deletion.
+            Blob.objects.bulk_create(
+                [Blob(digest=digest, name=name, references=0) for digest, name in blobs.items()], ignore_conflicts=True
+            )
+            referenced = set(
+                Blob.objects.select_for_update().filter(digest__in=blobs, references__gt=0).values_list('digest', flat=True)
+            )
+            for digest, name in blobs.items():
+                if digest not in referenced:
+                    super().delete(name)
+            Blob.objects.filter(digest__in=blobs, references=0).delete()
+
+    def release(self, name: str) -> bool:
+        """
+        Drops one reference to a stored blob and deletes it when none remain.
+
+        Files not created by this storage are left untouched.
+
+        Args:
+            name (str): The stored file name.
+
+        Returns:
+            bool: True if the blob was released for deletion.
+        """
+        from api.models import Blob
+
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return False
+            if blob.references > 1:
+                Blob.objects.filter(digest=blob.digest).update(references=F('references') - 1)
+                return False
+            blob.delete()
+
+        transaction.on_commit(lambda: self.delete(name))
+        return True
+
+    def release_many(self, names: list) -> list:
+        """
+        Drops one reference per occurrence of each name, with a fixed number of queries.
+
+        Unlike ``release`` no file is deleted; the caller passes the returned
+        names to ``delete_many`` once the transaction commits, which skips any
+        that were stored again meanwhile.
+
+        Args:
+            names (list): Stored file names, repeated once per released reference.
+
+        Returns:
+            list: Names of the blobs that are no longer used.
+        """
+        from api.models import Blob
+
+        counts = {}
+        for name in names:
+            counts[name] = counts.get(name, 0) + 1
+
+        with transaction.atomic():
+            blobs = list(Blob.objects.select_for_update().filter(name__in=counts))
+            unused = [blob for blob in blobs if blob.references <= counts[blob.name]]
+            kept = [blob for blob in blobs if blob.references > counts[blob.name]]
+            for blob in kept:
+                blob.references -= counts[blob.name]
+            Blob.objects.bulk_update(kept, ['references'])
+            Blob.objects.filter(digest__in=[blob.digest for blob in unused]).delete()
+        return [blob.name for blob in unused]
+
+
+def select_image_storage():
+    """
+    Returns the storage configured for uploaded images.
+
+    Returns:
+        Storage: The 'images' entry of settings.STORAGES.
+    """
+    return storages['images']
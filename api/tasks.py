@@ -0,0 +1,166 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+from api.models import Image
+from api.processing import process_image
+from api.similarity import index_image, to_db
+from api.versioning import bump_version
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Returns the shared image processing pool, starting it on first use.
+
+    Returns:
+        ProcessPoolExecutor: The worker pool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def shutdown_executor(wait: bool = True):
+    """
+    Stops the image processing pool if it was started.
+
+    Args:
+        wait (bool): Wait for queued images to finish processing.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+
+
+def enqueue_image_processing(image: Image):
+    """
+    Schedules background processing of a stored image once the current transaction commits.
+
+    With IMAGE_PROCESSING_EAGER enabled the image is processed inline instead.
+
+    Args:
+        image (Image): The image whose file has been saved.
+    """
+    image_id = image.id
+    storage = image.image_file.storage
+    name = image.image_file.name
+    path = storage.path(name)
+    sizes = getattr(settings, 'IMAGE_THUMBNAIL_SIZES', {'small': 128, 'medium': 512})
+
+    def submit():
+        if getattr(settings, 'IMAGE_PROCESSING_EAGER', False):
+            try:
+                result = process_image(path, sizes)
+            except Exception:
+                logger.exception('Processing image %s failed', image_id)
+                _mark_failed(image_id)
+            else:
+                _mark_ready(image_id, storage, name, *result)
+            return
+
+        Image.objects.filter(id=image_id).update(status=Image.Status.PROCESSING, status_changed_at=timezone.now())
+        bump_version(Image)
+        future = get_executor().submit(process_image, path, sizes)
+        future.add_done_callback(lambda done: _on_done(image_id, storage, name, done))
+
+    transaction.on_commit(submit)
+
+
+def _on_done(image_id: int, storage, name: str, future):
+    try:
+        result = future.result()
+    except Exception:
+        logger.exception('Processing image %s failed', image_id)
+        _mark_failed(image_id)
+    else:
+        _mark_ready(image_id, storage, name, *result)
+    finally:
+        # Callbacks run on the pool's management thread, which owns its own connection.
+        connection.close()
+
+
+def _mark_ready(image_id: int, storage, name: str, renditions: dict, image_hash: int, stripped: str = None):
+    names = {label: os.path.relpath(path, storage.location) for label, path in renditions.items()}
+    Image.objects.filter(id=image_id).update(
+        status=Image.Status.READY, status_changed_at=timezone.now(), renditions=names, phash=to_db(image_hash))
+    if stripped is not None:
+        _replace_file(image_id, storage, name, stripped)
+    index_image(image_id, image_hash)
+    bump_version(Image)
+
+
+def _replace_file(image_id: int, storage, name: str, path: str):
+    """
+    Stores the metadata-free copy written by process_image and points the image at it.
+
+    The copy is saved as its own blob and the original blob is released, so
+    the stored files never change after they are written and readers of the
+    original keep seeing a complete file.
+
+    Args:
+        image_id (int): The processed image.
+        storage (Storage): The image storage.
+        name (str): Stored name of the original the copy was made from.
+        path (str): Path of the copy, removed once stored.
+    """
+    try:
+        with open(path, 'rb') as content:
+            upload_name = Image._meta.get_field('image_file').generate_filename(None, os.path.basename(name))
+            stored = storage.save(upload_name, File(content))
+    finally:
+        os.remove(path)
+
+    with transaction.atomic():
+        # The image may have been deleted or given another file meanwhile; keep whichever is current.
+        replaced = Image.objects.filter(id=image_id, image_file=name).update(image_file=stored)
+        unused = name if replaced else stored
+        if hasattr(storage, 'release'):
+            storage.release(unused)
+        else:
+            transaction.on_commit(lambda: storage.delete(unused))
+
+
+def _mark_failed(image_id: int):
+    Image.objects.filter(id=image_id).update(status=Image.Status.FAILED, status_changed_at=timezone.now())
+    bump_version(Image)
+
+
+def _delete_files(storage, names: list):
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.exception('Deleting %s failed', name)
+
+
+def delete_files_later(storage, names: list):
+    """
+    Deletes stored files on a background thread once the current transaction commits.
+
+    Args:
+        storage (Storage): The storage holding the files.
+        names (list): Stored file names.
+    """
+    if not names:
+        return
+    transaction.on_commit(
+        lambda: threading.Thread(target=_delete_files, args=(storage, names), daemon=True).start()
+    )
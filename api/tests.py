@@ -1,16 +1,46 @@
+import datetime
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
 import unittest
+import jwt
+import numpy
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, patch
-from django.test import TestCase
-from api.models import User, Role, SubscriptionPlan, Image as I
-from .utils import check_access, encode_token, get_token, decode_token
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.utils import timezone
+from api.models import User, Role, RolePermission, SubscriptionPlan, Image as I, Blob, UploadSession
+from .utils import check_access, encode_token, encode_refresh_token, get_token, decode_token, token_cache
+from .cache import LRUCache
+from .cache_backends import FileCache, TwoTierCache, counter_cache, shared_cache
+from django.core.cache.backends.locmem import LocMemCache
+from .fastpath import RowSerializer, row_serializer
+from .serializers import ImageSerializer, RoleSerializer, UploadSessionSerializer
+from . import benchmark, catalog, export, hashing, instrumentation, permissions, similarity, uploads
+from .processing import hash_file
+from django.core.cache import cache
+from .authentication import get_user, token_user, unknown_usernames, user_cache
+from multi_user_app.caches import database_prefix, get_caches
+from multi_user_app.database import get_databases, sqlite_journal_mode, sqlite_pragmas
 from rest_framework.exceptions import AuthenticationFailed
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 from rest_framework import status
-from io import BytesIO
+from io import BytesIO, StringIO
+from pathlib import Path
 from PIL import Image
 from django.core.files.uploadedfile import SimpleUploadedFile
 
+
 class UtilsTestCase(TestCase):
     def setUp(self):
         self.user = User.objects.create(username='test_user')
@@ -65,6 +95,7 @@ class UtilsTestCase(TestCase):
 User = get_user_model()
 
 
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
 class ViewsTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -100,7 +131,7 @@ class ViewsTestCase(TestCase):
 
         # Test image creation
         response = self.client.post('/images/', data=image_data, format='multipart')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
 
         # Test getting the list of images
         response = self.client.get('/images/')
@@ -150,13 +181,13 @@ class ViewsTestCase(TestCase):
         # Authenticate the client
         client = APIClient()
         token = 'mocked_token'
-        client.force_authenticate(user=self.user, token=self.token)
+        client.force_authenticate(user=user, token=self.token)
 
         # Attempt to make a POST request to the image upload view
         response = client.post('/images/', {'uploaded_by': user.id, 'image_file': self.fake_image_file, 'description': 'Test image upload'}, format='multipart')
 
         # Assert the response status and expectations
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
         
 
@@ -254,5 +285,1480 @@ class ViewsTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
 
+class ImagePaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='test_user', password='test_password')
+        for i in range(5):
+            I.objects.create(uploaded_by=self.user, image_file=f'images/{i}.png', description=f'Image {i}')
+
+    @patch('api.views.check_access', return_value='test_user')
+    def test_image_list_follows_cursor(self, mock_check_access):
+        response = self.client.get('/images/', {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['results']), 2)
+
+        seen = [image['id'] for image in response.json()['results']]
+        while response.json()['next']:
+            response = self.client.get(response.json()['next'])
+            seen += [image['id'] for image in response.json()['results']]
+
+        self.assertEqual(seen, list(I.objects.order_by('id').values_list('id', flat=True)))
+
+    @patch('api.views.check_access', return_value='test_user')
+    def test_image_list_stream(self, mock_check_access):
+        response = self.client.get('/images/', {'stream': '1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data[0]['description'], 'Image 0')
+
+
+class TokenCacheTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_user')
+        token_cache.clear()
+
+    def test_decode_token_uses_cache(self):
+        token = encode_token(self.user)
+        with patch('api.utils.jwt.decode', wraps=jwt.decode) as mock_decode:
+            first = decode_token(token)
+            second = decode_token(token)
+
+        self.assertEqual(first, second)
+        self.assertEqual(mock_decode.call_count, 1)
+        self.assertEqual(token_cache.hits, 1)
+        self.assertEqual(token_cache.misses, 1)
+
+    def test_invalid_token_not_cached(self):
+        with self.assertRaises(AuthenticationFailed):
+            decode_token('not-a-token')
+        self.assertEqual(len(token_cache), 0)
+
+    def test_entry_not_returned_after_expiry(self):
+        cache = LRUCache(maxsize=10, ttl=60)
+        cache.set('key', 'value', expires_at=time.time() - 1)
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.misses, 1)
+
+    def test_least_recently_used_entry_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+
+@override_settings(JWT_EMBED_CLAIMS=False)
+class UserResolutionTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.role = Role.objects.create(role='beta_player')
+        self.user = User.objects.create_user(username='test_user', password='test_password', role=self.role)
+        self.image = I.objects.create(uploaded_by=self.user, image_file='images/a.png', description='Test image')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {encode_token(self.user)}')
+        permissions.table.masks()
+        user_cache.clear()
+
+    def test_update_resolves_user_with_one_query(self):
+        with self.assertNumQueries(3):
+            # user lookup, image lookup, image update
+            response = self.client.put(f'/images/{self.image.id}/', {'description': 'Updated'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(2):
+            response = self.client.put(f'/images/{self.image.id}/', {'description': 'Again'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_user_cache_invalidated_on_save(self):
+        get_user('test_user')
+        self.user.role = Role.objects.create(role='company_user')
+        self.user.save()
+        self.assertEqual(get_user('test_user').role_id, 'company_user')
+
+    def test_unknown_user_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {encode_token(User(username="unknown_user"))}')
+        response = self.client.delete(f'/images/{self.image.id}/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_PROCESSING_EAGER=True, IMAGE_THUMBNAIL_SIZES={'small': 16, 'medium': 32})
+class ImageProcessingTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.role = Role.objects.create(role='beta_player')
+        self.user = User.objects.create_user(username='test_user', password='test_password', role=self.role)
+        self.client.force_authenticate(user=self.user)
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def upload(self, content):
+        upload = SimpleUploadedFile('processing_test.jpg', content)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/images/', {'uploaded_by': self.user.id, 'image_file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        image = I.objects.get(id=response.data['id'])
+        self.paths.append(image.image_file.path)
+        self.paths += [image.image_file.storage.path(name) for name in image.renditions.values()]
+        return image
+
+    @patch('api.views.check_access', return_value='test_user')
+    def test_upload_generates_renditions(self, mock_check_access):
+        data = BytesIO()
+        Image.new('RGB', (100, 50)).save(data, format='JPEG')
+        image = self.upload(data.getvalue())
+
+        self.assertEqual(image.status, I.Status.READY)
+        self.assertEqual(set(image.renditions), {'small', 'medium'})
+        with Image.open(image.image_file.storage.path(image.renditions['small'])) as thumbnail:
+            self.assertEqual(thumbnail.size, (16, 8))
+
+    @patch('api.views.check_access', return_value='test_user')
+    def test_upload_strips_exif(self, mock_check_access):
+        source = Image.new('RGB', (40, 40))
+        exif = source.getexif()
+        exif[0x010F] = 'Camera Maker'
+        data = BytesIO()
+        source.save(data, format='JPEG', exif=exif)
+
+        image = self.upload(data.getvalue())
+        with Image.open(image.image_file.path) as stored:
+            self.assertFalse(stored.getexif())
+
+    @patch('api.views.check_access', return_value='test_user')
+    def test_stored_hash_matches_upload_check(self, mock_check_access):
+        # Smooth noise whose hash changes when the JPEG is decoded at full scale.
+        rng = random.Random(3)
+        noise = Image.new('L', (64, 48))
+        noise.putdata([rng.randrange(256) for _ in range(64 * 48)])
+        data = BytesIO()
+        noise.resize((640, 480), Image.Resampling.BICUBIC).convert('RGB').save(data, format='JPEG', quality=90)
+        image = self.upload(data.getvalue())
+        self.assertEqual(similarity.from_db(image.phash), hash_file(BytesIO(data.getvalue())))
+
+    @patch('api.views.check_access', return_value='test_user')
+    def test_stripping_keeps_palette_and_quality(self, mock_check_access):
+        source = Image.new('P', (40, 40))
+        source.putpalette([value for index in range(256) for value in (index, 255 - index, index // 2)])
+        exif = source.getexif()
+        exif[0x010F] = 'Camera Maker'
+        data = BytesIO()
+        source.save(data, format='PNG', exif=exif)
+        image = self.upload(data.getvalue())
+        with Image.open(image.image_file.path) as stored:
+            self.assertEqual(stored.mode, 'P')
+            self.assertEqual(stored.getpalette(), source.getpalette())
+
+        data = BytesIO()
+        Image.new('RGB', (40, 40), color='teal').save(data, format='JPEG', quality=95, exif=exif)
+        image = self.upload(data.getvalue())
+        with Image.open(BytesIO(data.getvalue())) as original, Image.open(image.image_file.path) as stored:
+            self.assertEqual(stored.quantization, original.quantization)
+
+    @patch('api.views.check_access', return_value='test_user')
+    def test_stripped_copy_is_stored_as_a_new_blob(self, mock_check_access):
+        source = Image.new('RGB', (40, 40))
+        exif = source.getexif()
+        exif[0x010F] = 'Camera Maker'
+        data = BytesIO()
+        source.save(data, format='JPEG', exif=exif)
+        original_digest = hashlib.sha256(data.getvalue()).hexdigest()
+
+        image = self.upload(data.getvalue())
+        with open(image.image_file.path, 'rb') as stored:
+            digest = hashlib.sha256(stored.read()).hexdigest()
+        self.assertNotEqual(digest, original_digest)
+        self.assertIn(digest, image.image_file.name)
+        self.assertEqual(list(Blob.objects.values_list('digest', flat=True)), [digest])
+
+    def test_stale_uploads_requeued(self):
+        data = BytesIO()
+        Image.new('RGB', (100, 50)).save(data, format='JPEG')
+        long_ago = timezone.now() - datetime.timedelta(hours=1)
+        lost = I.objects.create(uploaded_by=self.user, image_file=SimpleUploadedFile('lost.jpg', data.getvalue()),
+                                status=I.Status.PROCESSING, status_changed_at=long_ago)
+        recent = I.objects.create(uploaded_by=self.user, image_file=SimpleUploadedFile('recent.jpg', data.getvalue()),
+                                  status=I.Status.PROCESSING)
+        without_file = I.objects.create(uploaded_by=self.user, status_changed_at=long_ago)
+        self.paths.append(lost.image_file.path)
+
+        output = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('requeue_pending_images', stdout=output)
+
+        self.assertIn('Requeued 1 stale uploads.', output.getvalue())
+        lost.refresh_from_db()
+        self.assertEqual(lost.status, I.Status.READY)
+        self.assertGreater(lost.status_changed_at, long_ago)
+        self.paths += [lost.image_file.path] + [lost.image_file.storage.path(name) for name in lost.renditions.values()]
+        self.assertEqual(I.objects.get(id=recent.id).status, I.Status.PROCESSING)
+        self.assertEqual(I.objects.get(id=without_file.id).status, I.Status.PENDING)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedStorageTestCase(TestCase):
+    def setUp(self):
+        data = BytesIO()
+        Image.new('RGB', (10, 10), color='red').save(data, format='PNG')
+        self.content = data.getvalue()
+
+    def create_image(self, filename):
+        return I.objects.create(image_file=SimpleUploadedFile(filename, self.content))
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.create_image('first.png')
+        second = self.create_image('second.png')
+
+        self.assertEqual(first.image_file.name, second.image_file.name)
+        self.assertIn('/blobs/', first.image_file.name)
+        self.assertEqual(Blob.objects.get(name=first.image_file.name).references, 2)
+
+        path = first.image_file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(Blob.objects.get(name=second.image_file.name).references, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_released_blob_kept_when_stored_again(self):
+        first = self.create_image('first.png')
+        path = first.image_file.path
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.delete()
+        # The same content is saved before the release's deletion runs.
+        second = self.create_image('second.png')
+        for callback in callbacks:
+            callback()
+
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(Blob.objects.get(name=second.image_file.name).references, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_content_read_once_while_saving(self):
+        content = SimpleUploadedFile('once.png', self.content)
+        with patch.object(SimpleUploadedFile, 'chunks', side_effect=content.chunks) as chunks:
+            image = I.objects.create(image_file=content)
+        chunks.assert_called_once()
+        with image.image_file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(os.path.basename(image.image_file.name), hashlib.sha256(self.content).hexdigest() + '.png')
+
+    def test_replacing_file_releases_previous_blob(self):
+        image = self.create_image('first.png')
+        path = image.image_file.path
+        data = BytesIO()
+        Image.new('RGB', (10, 10), color='blue').save(data, format='PNG')
+
+        image = I.objects.get(id=image.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.image_file = SimpleUploadedFile('second.png', data.getvalue())
+            image.save()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(list(Blob.objects.values_list('name', flat=True)), [image.image_file.name])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.description = 'Only the description changed'
+            image.save()
+        self.assertTrue(os.path.exists(image.image_file.path))
+
+
+class DatabaseSettingsTestCase(unittest.TestCase):
+    def test_sqlite_is_default(self):
+        databases = get_databases(Path('/srv/app'), env={})
+        self.assertEqual(databases['default']['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(databases['default']['NAME'], Path('/srv/app/db.sqlite3'))
+        self.assertEqual(sqlite_journal_mode(env={}), 'WAL')
+        self.assertNotIn('journal_mode', sqlite_pragmas(env={}))
+
+    def test_postgres_pool(self):
+        databases = get_databases(Path('/srv/app'), env={'DATABASE_ENGINE': 'postgres', 'DATABASE_POOL': '1'})
+        self.assertEqual(databases['default']['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(databases['default']['CONN_MAX_AGE'], 0)
+        self.assertIn('pool', databases['default']['OPTIONS'])
+
+    def test_unknown_engine_rejected(self):
+        with self.assertRaises(ValueError):
+            get_databases(Path('/srv/app'), env={'DATABASE_ENGINE': 'oracle'})
+
+
+class CacheSettingsTestCase(unittest.TestCase):
+    def test_locmem_is_default(self):
+        caches = get_caches(Path('/srv/app'), env={})
+        self.assertEqual(caches['default']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+        self.assertNotIn('shared', caches)
+
+    def test_redis_and_file(self):
+        caches = get_caches(Path('/srv/app'), env={'CACHE_BACKEND': 'redis', 'CACHE_REDIS_URL': 'redis://cache:6379/1'})
+        self.assertEqual(caches['default']['BACKEND'], 'api.cache_backends.TwoTierCache')
+        self.assertEqual(caches['shared']['BACKEND'], 'django.core.cache.backends.redis.RedisCache')
+        self.assertEqual(caches['shared']['LOCATION'], 'redis://cache:6379/1')
+        self.assertEqual(caches['counters'], caches['shared'])
+
+        caches = get_caches(Path('/srv/app'), env={'CACHE_BACKEND': 'file'})
+        self.assertEqual(caches['shared']['LOCATION'], Path('/srv/app/cache'))
+        # Rate limit counters stay off the disk.
+        self.assertEqual(caches['counters']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+
+    def test_unknown_backend_rejected(self):
+        with self.assertRaises(ValueError):
+            get_caches(Path('/srv/app'), env={'CACHE_BACKEND': 'memcached'})
+
+    def test_key_prefix_identifies_database(self):
+        database = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': '/srv/app/db.sqlite3'}
+        caches = get_caches(Path('/srv/app'), database, env={'CACHE_BACKEND': 'file'})
+        self.assertEqual(caches['shared']['KEY_PREFIX'], database_prefix(database))
+        self.assertNotEqual(database_prefix(database), database_prefix({**database, 'NAME': '/srv/other/db.sqlite3'}))
+        overridden = get_caches(Path('/srv/app'), database, env={'CACHE_BACKEND': 'file', 'CACHE_KEY_PREFIX': 'staging'})
+        self.assertEqual(overridden['shared']['KEY_PREFIX'], 'staging')
+
+    def test_tests_use_their_own_cache_directory(self):
+        self.assertNotEqual(Path(cache.shared._dir), Path(__file__).resolve().parent.parent / 'cache')
+
+
+class FileCacheTestCase(unittest.TestCase):
+    def test_add_succeeds_once_across_instances(self):
+        with tempfile.TemporaryDirectory() as directory:
+            workers = [FileCache(directory, {}) for _ in range(8)]
+            results = []
+            barrier = threading.Barrier(len(workers))
+
+            def add(worker):
+                barrier.wait()
+                results.append(worker.add('marker', True))
+
+            threads = [threading.Thread(target=add, args=(worker,)) for worker in workers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(results.count(True), 1)
+
+    def test_cull_scans_every_interval(self):
+        with tempfile.TemporaryDirectory() as directory:
+            worker = FileCache(directory, {'OPTIONS': {'MAX_ENTRIES': 5, 'CULL_INTERVAL': 4}})
+            with patch.object(worker, '_list_cache_files', wraps=worker._list_cache_files) as listing:
+                for index in range(8):
+                    worker.set(f'key-{index}', index)
+            self.assertEqual(listing.call_count, 2)
+            self.assertLessEqual(len(worker._list_cache_files()), 8)
+
+
+class TwoTierCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.shared = LocMemCache('two-tier-test', {})
+        self.shared.clear()
+        self.caches = [TwoTierCache('shared', {'OPTIONS': {'LOCAL_TTL': 60, 'FLIGHT_TIMEOUT': 5}}) for _ in range(2)]
+        for worker in self.caches:
+            worker.__dict__['shared'] = self.shared
+
+    def test_local_tier_serves_reads_until_ttl(self):
+        first, second = self.caches
+        first.set('key', 1)
+        self.assertEqual(second.get('key'), 1)
+        first.set('key', 2)
+        self.assertEqual(first.get('key'), 2)
+        # The second worker still serves its local copy.
+        self.assertEqual(second.get('key'), 1)
+        second.local.clear()
+        self.assertEqual(second.get('key'), 2)
+
+    def test_writes_go_through(self):
+        first, second = self.caches
+        self.assertTrue(first.add('key', 'a'))
+        self.assertFalse(second.add('key', 'b'))
+        self.assertEqual(second.get_many(['key', 'missing']), {'key': 'a'})
+        first.delete('key')
+        self.assertIsNone(self.shared.get('key'))
+        self.assertIsNone(first.get('key'))
+
+    def test_get_or_set_computes_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda c=c: results.append(c.get_or_set('cold', compute, 60)))
+                   for c in self.caches * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_computation_is_retried(self):
+        def fail():
+            raise RuntimeError('down')
+
+        with self.assertRaises(RuntimeError):
+            self.caches[0].get_or_set('cold', fail)
+        self.assertEqual(self.caches[1].get_or_set('cold', lambda: 'value'), 'value')
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.plan = SubscriptionPlan.objects.create(subscription_plan='Gold', features='Feature', benefits='Benefit')
+        Role.objects.create(role='beta_player')
+
+    @patch('api.views.check_access', return_value='test_user')
+    def test_matching_etag_returns_304_without_queries(self, mock_check_access):
+        response = self.client.get('/subscription-plans/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/subscription-plans/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @patch('api.views.check_access', return_value='test_user')
+    def test_change_invalidates_etag(self, mock_check_access):
+        etag = self.client.get('/subscription-plans/Gold/')['ETag']
+
+        self.plan.features = 'Updated feature'
+        self.plan.save()
+
+        response = self.client.get('/subscription-plans/Gold/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['features'], 'Updated feature')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_role_list_etag(self):
+        etag = self.client.get('/roles/')['ETag']
+        response = self.client.get('/roles/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Role.objects.create(role='company_user')
+        response = self.client.get('/roles/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(response.json()), 2)
+
+    @patch('api.views.check_access', return_value='test_user')
+    def test_missing_image_returns_404(self, mock_check_access):
+        response = self.client.get('/images/999/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('ETag', response)
+
+
+class CatalogTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        Role.objects.create(role='company_user')
+        SubscriptionPlan.objects.create(subscription_plan='Gold', features='Feature', benefits='Benefit')
+
+    def test_register_needs_no_catalog_queries(self):
+        catalog.roles.all()
+        catalog.subscription_plans.all()
+
+        # username uniqueness check and the insert
+        with self.assertNumQueries(2):
+            response = self.client.post('/register/', {'username': 'newuser', 'password': 'pw', 'role': 'company_user'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(User.objects.get(username='newuser').role_id, 'company_user')
+
+    def test_register_rejects_unknown_role(self):
+        response = self.client.post('/register/', {'username': 'newuser', 'password': 'pw', 'role': 'unknown'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('role', response.data)
+
+    @patch('api.views.check_access', return_value='test_user')
+    def test_catalog_reloads_after_change(self, mock_check_access):
+        with self.assertNumQueries(1):
+            self.client.get('/roles/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/roles/company_user/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        Role.objects.create(role='beta_player')
+        response = self.client.get('/roles/beta_player/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class PermissionTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.role = Role.objects.create(role='beta_player')
+        self.user = User.objects.create_user(username='test_user', password='test_password', role=self.role)
+        self.image = I.objects.create(uploaded_by=self.user, description='Test image')
+        self.client.force_authenticate(user=self.user)
+
+    def test_new_role_gets_default_permissions(self):
+        self.assertEqual(self.role.permissions.count(), 9)
+        self.assertFalse(Role.objects.create(role='company_user').permissions.exists())
+
+    def test_warm_check_runs_no_queries(self):
+        permissions.table.masks()
+        with self.assertNumQueries(0):
+            self.assertTrue(permissions.has_permission(self.user, 'image', 'update', 'delete'))
+            self.assertFalse(permissions.has_permission(User(role_id='company_user'), 'image', 'update'))
+
+    def test_revoked_permission_applies_to_next_request(self):
+        response = self.client.put(f'/images/{self.image.id}/', {'description': 'Updated'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        RolePermission.objects.filter(role=self.role, resource='image', action='update').delete()
+        response = self.client.put(f'/images/{self.image.id}/', {'description': 'Again'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.delete(f'/images/{self.image.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @patch('api.views.check_access', return_value='reader')
+    def test_reads_need_no_permission(self, mock_check_access):
+        reader = User.objects.create_user(username='reader', password='pw', role=Role.objects.create(role='company_user'))
+        self.client.force_authenticate(user=reader)
+        self.assertEqual(self.client.get('/subscription-plans/').status_code, status.HTTP_200_OK)
+        plan = {'subscription_plan': 'Gold', 'features': 'F', 'benefits': 'B'}
+        response = self.client.post('/subscription-plans/', plan, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        RolePermission.objects.create(role_id='company_user', resource='subscription_plan', action='create')
+        response = self.client.post('/subscription-plans/', plan, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_superuser_needs_no_permission(self):
+        self.client.force_authenticate(user=User.objects.create_superuser(username='admin', password='pw'))
+        response = self.client.delete(f'/roles/{self.role.role}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(RolePermission.objects.exists())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BulkRegisterTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.role = Role.objects.create(role='company_user')
+        User.objects.create_user(username='existing', password='test_password')
+        self.admin = User.objects.create_superuser(username='admin', password='test_password')
+        self.client.force_authenticate(user=self.admin)
+
+    def test_bulk_register_requires_user_create_permission(self):
+        rows = [{'username': 'user0', 'password': 'pw', 'role': 'company_user'}]
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.post('/register/bulk/', rows, format='json').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        member = User.objects.create_user(username='member', password='test_password', role=self.role)
+        self.client.force_authenticate(user=member)
+        self.assertEqual(self.client.post('/register/bulk/', rows, format='json').status_code, status.HTTP_403_FORBIDDEN)
+
+        RolePermission.objects.create(role=self.role, resource=RolePermission.Resource.USER, action=RolePermission.Action.CREATE)
+        permissions.table.invalidate()
+        self.assertEqual(self.client.post('/register/bulk/', rows, format='json').status_code, status.HTTP_200_OK)
+        self.assertTrue(User.objects.filter(username='user0').exists())
+
+    def test_bulk_register_clears_unknown_usernames(self):
+        unknown_usernames.set('user0')
+        self.client.post('/register/bulk/', [{'username': 'user0', 'password': 'pw', 'role': 'company_user'}], format='json')
+        self.assertFalse(unknown_usernames.get('user0'))
+
+    def test_bulk_register_reports_per_row_results(self):
+        rows = [{'username': f'user{i}', 'password': f'password{i}', 'role': 'company_user'} for i in range(5)]
+        rows += [
+            {'username': 'existing', 'password': 'pw', 'role': 'company_user'},
+            {'username': 'user0', 'password': 'pw', 'role': 'company_user'},
+            {'username': 'bad name', 'password': 'pw', 'role': 'company_user'},
+        ]
+
+        response = self.client.post('/register/bulk/', rows, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual(response.data['failed'], 3)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created'] * 5 + ['error'] * 3)
+        user = User.objects.get(username='user3')
+        self.assertEqual(response.data['results'][3]['id'], user.id)
+        self.assertTrue(user.check_password('password3'))
+        self.assertEqual(user.role_id, 'company_user')
+
+    def test_bulk_register_accepts_ndjson(self):
+        body = '\n'.join(json.dumps({'username': f'user{i}', 'password': 'pw', 'role': 'company_user'}) for i in range(2))
+        response = self.client.post('/register/bulk/', body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 2)
+
+    def test_bulk_register_rejects_object(self):
+        response = self.client.post('/register/bulk/', {'username': 'user'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BearerTokenTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.role = Role.objects.create(role='beta_player')
+        self.user = User.objects.create_user(username='test_user', password='test_password', role=self.role)
+
+    def test_real_token_reaches_protected_views(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {encode_token(self.user)}')
+        response = self.client.get('/images/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalid_token_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer invalid')
+        response = self.client.get('/images/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(LOGIN_VERIFY_WORKERS=0)
+    def test_public_endpoints_accept_stale_header(self):
+        with override_settings(JWT_ACCESS_TOKEN_LIFETIME=-1):
+            expired = encode_token(self.user)
+        for header in (f'Bearer {expired}', 'Bearer invalid'):
+            self.client.credentials(HTTP_AUTHORIZATION=header)
+            response = self.client.post('/register/', {'username': f'new{len(header)}', 'password': 'pw', 'role': 'beta_player'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK, header)
+            response = self.client.post('/login/', {'username': 'test_user', 'password': 'test_password'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK, header)
+            response = self.client.post('/token/refresh/', {'refresh': encode_refresh_token(self.user)}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK, header)
+            self.assertEqual(self.client.get('/roles/').status_code, status.HTTP_200_OK, header)
+            self.assertEqual(self.client.get('/images/').status_code, status.HTTP_401_UNAUTHORIZED, header)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BenchmarkTestCase(TestCase):
+    def test_benchmark_covers_every_route(self):
+        data = benchmark.seed(users=3, images=10, plans=2)
+        scenarios = benchmark.endpoints(data)
+        self.assertEqual(benchmark.uncovered_routes(scenarios), [])
+
+        reads = [endpoint for endpoint in scenarios if endpoint.method == 'GET']
+        report = benchmark.run(reads, data['token'], benchmark.InProcessTransport(), requests=2, warmup=0)
+
+        for name, result in report.items():
+            self.assertEqual(result['statuses'], {'200': 2}, name)
+            self.assertIsNotNone(result['queries_max'])
+
+    def test_compare_serialization(self):
+        benchmark.seed(users=3, images=10, plans=2)
+        report = benchmark.compare_serialization(page_size=10, repeat=2)
+        self.assertEqual(set(report), {'ImageSerializer', 'RoleSerializer'})
+
+    def test_compare_flags_regressions(self):
+        baseline = {'GET roles/': {'p95_ms': 10.0, 'queries_max': 1}}
+        self.assertEqual(benchmark.compare({'GET roles/': {'p95_ms': 11.0, 'queries_max': 1}}, baseline), [])
+        regressions = benchmark.compare({'GET roles/': {'p95_ms': 20.0, 'queries_max': 3}}, baseline)
+        self.assertEqual(len(regressions), 2)
+
+
+class QueryInstrumentationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        Role.objects.create(role='company_user')
+        catalog.roles.all()
+        catalog.subscription_plans.all()
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=60000, SERVER_TIMING=True)
+    def test_server_timing_reports_queries(self):
+        # username uniqueness check and the insert
+        with self.assertLogs('api.requests', level='INFO') as logs:
+            response = self.client.post('/register/', {'username': 'newuser', 'password': 'pw', 'role': 'company_user'}, format='json')
+
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertIn('serializer;dur=', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'register')
+        self.assertEqual(record['queries'], 2)
+        self.assertIsNotNone(record['slowest_query'])
+        self.assertNotIn('sql', record)
+
+    def test_server_timing_off_by_default(self):
+        response = self.client.post('/register/', {'username': 'newuser', 'password': 'pw', 'role': 'company_user'}, format='json')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_request_logs_fingerprints(self):
+        with self.assertLogs('api.requests', level='WARNING') as logs:
+            self.client.post('/register/', {'username': 'newuser', 'password': 'pw', 'role': 'company_user'}, format='json')
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(sum(query['count'] for query in record['sql']), 2)
+        self.assertTrue(any('INSERT' in query['fingerprint'] for query in record['sql']))
+        self.assertNotIn('newuser', logs.output[0])
+
+    def test_fingerprint_drops_values(self):
+        self.assertEqual(
+            instrumentation.fingerprint("SELECT * FROM t WHERE a = 'x''y' AND b = 12 AND c IN (%s, %s, %s)"),
+            "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)",
+        )
+
+    def test_nothing_collected_when_log_is_off(self):
+        with patch('api.instrumentation.collect') as collect:
+            self.client.get('/roles/')
+        collect.assert_not_called()
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    LOGIN_VERIFY_WORKERS=0,
+    LOGIN_THROTTLE_RATES={'ip': '100/min', 'username': '3/min'},
+)
+class LoginThrottlingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        counter_cache().clear()
+        self.client = APIClient()
+        User.objects.create_user(username='test_user', password='test_password')
+
+    def login(self, username, password='test_password'):
+        return self.client.post('/login/', {'username': username, 'password': password}, format='json')
+
+    def test_username_bucket_rejects_before_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login('test_user', 'wrong').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        with patch('api.views.submit_password_check') as mock_check, self.assertNumQueries(0):
+            response = self.login('test_user')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        mock_check.assert_not_called()
+
+        self.assertEqual(self.login('Other').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_ip_bucket_ignores_forwarded_for(self):
+        with override_settings(LOGIN_THROTTLE_RATES={'ip': '2/min'}):
+            for index in range(2):
+                self.client.post('/login/', {'username': 'test_user', 'password': 'wrong'}, format='json',
+                                 HTTP_X_FORWARDED_FOR=f'10.0.0.{index}')
+            response = self.client.post('/login/', {'username': 'test_user', 'password': 'wrong'}, format='json',
+                                        HTTP_X_FORWARDED_FOR='10.0.0.9')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_unknown_username_answered_from_cache(self):
+        self.assertEqual(self.login('ghost').status_code, status.HTTP_401_UNAUTHORIZED)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.login('ghost').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        User.objects.create_user(username='ghost', password='test_password')
+        self.assertEqual(self.login('ghost').status_code, status.HTTP_200_OK)
+
+    def test_verify_pool_defaults_without_setting(self):
+        with override_settings():
+            del settings.LOGIN_VERIFY_WORKERS
+            with patch.object(hashing, '_verify_executor', None), patch.object(hashing, '_verify_slots', None), \
+                    patch('api.hashing.ProcessPoolExecutor') as pool:
+                executor, slots = hashing.get_verify_executor()
+        self.assertIs(executor, pool.return_value)
+        self.assertEqual(pool.call_args.kwargs['max_workers'], 2)
+
+    def test_full_verification_queue_rejected(self):
+        slots = MagicMock()
+        slots.acquire.return_value = False
+        with override_settings(LOGIN_VERIFY_WORKERS=1), \
+                patch('api.hashing.get_verify_executor', return_value=(MagicMock(), slots)):
+            response = self.login('test_user')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], LOGIN_VERIFY_WORKERS=0)
+class RefreshTokenTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        counter_cache().clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='test_user', password='test_password')
+
+    def test_refresh_token_rotates(self):
+        response = self.client.post('/login/', {'username': 'test_user', 'password': 'test_password'}, format='json')
+        refresh = response.data['refresh']
+
+        with patch('api.views.submit_password_check') as mock_check:
+            response = self.client.post('/token/refresh/', {'refresh': refresh}, format='json')
+        mock_check.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(decode_token(response.data['jwt'])['username'], 'test_user')
+        self.assertNotEqual(response.data['refresh'], refresh)
+
+        response = self.client.post('/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_with_expired_access_token_header(self):
+        with patch('api.utils.datetime') as mock_datetime:
+            mock_datetime.datetime.utcnow.return_value = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+            mock_datetime.timedelta = datetime.timedelta
+            expired = encode_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {expired}')
+
+        response = self.client.post('/token/refresh/', {'refresh': encode_refresh_token(self.user)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post('/login/', {'username': 'test_user', 'password': 'test_password'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_token_types_not_interchangeable(self):
+        response = self.client.post('/token/refresh/', {'refresh': encode_token(self.user)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {encode_refresh_token(self.user)}')
+        response = self.client.get('/images/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TokenClaimsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        counter_cache().clear()
+        self.client = APIClient()
+        self.role = Role.objects.create(role='beta_player')
+        self.user = User.objects.create_user(username='test_user', password='test_password', role=self.role)
+        self.image = I.objects.create(uploaded_by=self.user, description='Test image')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {encode_token(self.user)}')
+        permissions.table.masks()
+        user_cache.clear()
+
+    def test_claims_authorize_without_user_query(self):
+        with self.assertNumQueries(2):
+            # image lookup, image update
+            response = self.client.put(f'/images/{self.image.id}/', {'description': 'Updated'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_changed_user_is_loaded_from_database(self):
+        self.user.role = Role.objects.create(role='company_user')
+        self.user.save()
+        response = self.client.put(f'/images/{self.image.id}/', {'description': 'Updated'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_deleted_role_makes_claims_stale(self):
+        claims = decode_token(encode_token(self.user))
+        self.assertEqual(token_user(claims).role_id, 'beta_player')
+        self.role.delete()
+        self.assertIsNone(token_user(claims))
+
+    def test_refresh_reloads_user(self):
+        refresh = encode_refresh_token(self.user)
+        self.user.role = Role.objects.create(role='company_user')
+        self.user.save()
+        tokens = self.client.post('/token/refresh/', {'refresh': refresh}, format='json').data
+        self.assertEqual(token_user(decode_token(tokens['jwt'])).role_id, 'company_user')
+
+        refresh = tokens['refresh']
+        self.user.delete()
+        response = self.client.post('/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageContentTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.content = bytes(range(256)) * 40
+        self.image = I.objects.create(image_file=SimpleUploadedFile('content.png', self.content))
+
+    def get(self, **headers):
+        with patch('api.views.check_access', return_value='test_user'):
+            return self.client.get(f'/images/{self.image.id}/content/', **headers)
+
+    def test_full_content(self):
+        response = self.get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('max-age=', response['Cache-Control'])
+
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_byte_ranges(self):
+        response = self.get(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+
+        response = self.get(HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+
+        response = self.get(HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(IMAGE_SENDFILE_BACKEND='x-accel-redirect')
+    def test_proxy_handoff(self):
+        response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + self.image.image_file.name)
+        self.assertEqual(response.content, b'')
+
+    def test_missing_rendition(self):
+        with patch('api.views.check_access', return_value='test_user'):
+            response = self.client.get(f'/images/{self.image.id}/content/', {'rendition': 'small'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_PROCESSING_EAGER=True)
+class ResumableUploadTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.role = Role.objects.create(role='beta_player')
+        self.user = User.objects.create_user(username='test_user', password='test_password', role=self.role)
+        data = BytesIO()
+        Image.new('RGB', (64, 64), color='green').save(data, format='PNG')
+        self.content = data.getvalue()
+        self.client.force_authenticate(user=self.user)
+
+    def open_session(self):
+        response = self.client.post('/images/uploads/', {'filename': 'large.png', 'size': len(self.content), 'description': 'Large'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def put_chunk(self, session_id, offset, chunk):
+        return self.client.put(f'/images/uploads/{session_id}/?offset={offset}', chunk, content_type='application/octet-stream')
+
+    def test_chunked_upload_resumes_and_completes(self):
+        session_id = self.open_session()
+        half = len(self.content) // 2
+
+        self.assertEqual(self.put_chunk(session_id, 0, self.content[:half]).data['offset'], half)
+        response = self.put_chunk(session_id, 0, self.content[:half])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.client.get(f'/images/uploads/{session_id}/').data['offset'], half)
+        self.put_chunk(session_id, half, self.content[half:])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/images/uploads/{session_id}/complete/', {'sha256': hashlib.sha256(self.content).hexdigest()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        image = I.objects.get(id=response.data['id'])
+        self.assertEqual(image.description, 'Large')
+        self.assertEqual(image.status, I.Status.READY)
+        with image.image_file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_chunk_read_before_session_is_locked(self):
+        session_id = self.open_session()
+        session = UploadSession.objects.get(id=session_id)
+
+        class Racing(BytesIO):
+            # Another request appends the same range while this chunk is still arriving.
+            def read(self, size=-1):
+                UploadSession.objects.filter(id=session_id).update(offset=10)
+                return super().read(size)
+
+        with self.assertRaises(uploads.Conflict) as raised:
+            uploads.append_chunk(session_id, 0, 10, Racing(self.content[:10]))
+        self.assertEqual(raised.exception.offset, 10)
+        self.assertFalse(os.path.exists(uploads.part_path(session)))
+
+    def test_checksum_mismatch_rejected(self):
+        session_id = self.open_session()
+        self.put_chunk(session_id, 0, self.content)
+
+        response = self.client.post(f'/images/uploads/{session_id}/complete/', {'sha256': '0' * 64}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(I.objects.exists())
+
+    def test_non_image_extension_rejected(self):
+        for filename in ('x.html', 'x.svg', 'x'):
+            response = self.client.post('/images/uploads/', {'filename': filename, 'size': len(self.content)}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('filename', response.data)
+
+    def test_extension_must_match_format(self):
+        data = BytesIO()
+        Image.new('RGB', (64, 64), color='green').save(data, format='GIF')
+        self.content = data.getvalue()
+        session_id = self.open_session()
+        self.put_chunk(session_id, 0, self.content)
+
+        response = self.client.post(f'/images/uploads/{session_id}/complete/', {'sha256': hashlib.sha256(self.content).hexdigest()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(I.objects.exists())
+
+    def test_complete_without_part_file_is_not_found(self):
+        session_id = self.open_session()
+        self.put_chunk(session_id, 0, self.content)
+        # A concurrent complete already moved the part file into place.
+        os.remove(uploads.part_path(UploadSession.objects.get(id=session_id)))
+
+        response = self.client.post(f'/images/uploads/{session_id}/complete/', {'sha256': hashlib.sha256(self.content).hexdigest()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_incomplete_upload_rejected(self):
+        session_id = self.open_session()
+        self.put_chunk(session_id, 0, self.content[:10])
+
+        response = self.client.post(f'/images/uploads/{session_id}/complete/', {'sha256': hashlib.sha256(self.content).hexdigest()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImageFilterTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='test_user', password='test_password')
+        self.other = User.objects.create_user(username='other_user', password='test_password')
+        I.objects.create(uploaded_by=self.user, description='Sunset at the beach')
+        I.objects.create(uploaded_by=self.other, description='Mountain sunrise')
+        I.objects.create(uploaded_by=self.user, description='City at night')
+
+    def descriptions(self, **params):
+        with patch('api.views.check_access', return_value='test_user'):
+            response = self.client.get('/images/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [image['description'] for image in response.json()['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.descriptions(mine='1'), ['Sunset at the beach', 'City at night'])
+        self.assertEqual(self.descriptions(uploaded_by=self.other.id), ['Mountain sunrise'])
+        self.assertEqual(self.descriptions(search='SUN'), ['Sunset at the beach', 'Mountain sunrise'])
+        self.assertEqual(self.descriptions(mine='1', search='city'), ['City at night'])
+
+    @patch('api.views.check_access', return_value='test_user')
+    def test_invalid_uploader_rejected(self, mock_check_access):
+        response = self.client.get('/images/', {'uploaded_by': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_uploader_listing_uses_index(self):
+        plan = I.objects.filter(uploaded_by=self.user, id__gt=1).order_by('id')[:50].explain()
+        self.assertIn('image_uploader_id_idx', plan)
+
+
+@patch('api.views.check_access', return_value='test_user')
+class SparseFieldsetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='test_user', password='test_password')
+        self.image = I.objects.create(uploaded_by=self.user, description='A long description')
+        SubscriptionPlan.objects.create(subscription_plan='Plan1', features='Many features', benefits='Many benefits')
+        catalog.subscription_plans.invalidate()
+
+    def test_image_list_fields(self, mock_check_access):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/images/', {'fields': 'id,status'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'], [{'id': self.image.id, 'status': 'pending'}])
+        self.assertNotIn('description', queries[-1]['sql'])
+
+    def test_image_detail_exclude(self, mock_check_access):
+        response = self.client.get(f'/images/{self.image.id}/', {'exclude': 'description,renditions'})
+        self.assertEqual(set(response.data), {'id', 'uploaded_by', 'image_file', 'status'})
+        full = self.client.get(f'/images/{self.image.id}/')
+        self.assertNotEqual(response['ETag'], full['ETag'])
+
+    def test_plan_fields(self, mock_check_access):
+        response = self.client.get('/subscription-plans/', {'fields': 'subscription_plan'})
+        self.assertEqual(response.data, [{'subscription_plan': 'Plan1'}])
+        response = self.client.get('/subscription-plans/Plan1/', {'exclude': 'features'})
+        self.assertEqual(response.data, {'subscription_plan': 'Plan1', 'benefits': 'Many benefits'})
+
+    def test_unknown_field_rejected(self, mock_check_access):
+        response = self.client.get('/images/', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.data)
+
+
+@patch('api.views.check_access', return_value='test_user')
+class FastPathTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='test_user', password='test_password')
+        for role in ['beta_player', 'company_user']:
+            Role.objects.create(role=role)
+        I.objects.create(uploaded_by=self.user, image_file='images/a.png', description='Line\u2028break \u00e9', renditions={'small': 'x.png'})
+        I.objects.create(uploaded_by=None, description='', status=I.Status.READY)
+        catalog.roles.invalidate()
+
+    def test_rows_match_serializer(self, mock_check_access):
+        images = I.objects.order_by('id')
+        for fields in [None, ('id', 'image_file')]:
+            rows = row_serializer(ImageSerializer, fields)
+            self.assertEqual(rows.serialize(rows.values_list(images)), ImageSerializer(images, many=True, fields=fields).data)
+        roles = catalog.roles.all().values()
+        self.assertEqual(row_serializer(RoleSerializer).serialize_objects(roles), RoleSerializer(roles, many=True).data)
+
+    def test_responses_match_serializer(self, mock_check_access):
+        for path, params in [('/images/', {'page_size': 1}), ('/images/', {'fields': 'id,status'}), ('/roles/', {})]:
+            with override_settings(FAST_LIST_SERIALIZATION=False):
+                expected = self.client.get(path, params)
+            actual = self.client.get(path, params)
+            self.assertEqual(actual.status_code, status.HTTP_200_OK)
+            self.assertEqual(actual.content, expected.content, path)
+            self.assertEqual(actual['Content-Type'], expected['Content-Type'])
+
+    def test_next_page(self, mock_check_access):
+        first = self.client.get('/images/', {'page_size': 1}).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual([image['id'] for image in second['results']], [I.objects.order_by('id').last().id])
+
+    def test_unsupported_field_rejected(self, mock_check_access):
+        self.assertRaises(TypeError, RowSerializer, UploadSessionSerializer)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_PROCESSING_EAGER=True)
+class SimilarityTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.role = Role.objects.create(role='beta_player')
+        self.user = User.objects.create_user(username='test_user', password='test_password', role=self.role)
+        similarity.reset_index()
+
+    def tearDown(self):
+        similarity.reset_index()
+
+    def jpeg(self, path, scale=1.0, quality=75):
+        with Image.open(path) as image:
+            image = image.convert('RGB')
+            image = image.resize((int(image.width * scale), int(image.height * scale)))
+            data = BytesIO()
+            image.save(data, format='JPEG', quality=quality)
+        return SimpleUploadedFile('upload.jpg', data.getvalue(), content_type='image/jpeg')
+
+    def upload(self, file):
+        self.client.force_authenticate(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/images/', {'image_file': file}, format='multipart')
+
+    def test_index_matches_brute_force(self):
+        rng = random.Random(0)
+        hashes = {i: rng.getrandbits(64) for i in range(2000)}
+        # Near copies of the first hashes.
+        hashes.update({2000 + i: hashes[i] ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for i in range(50)})
+        index = similarity.HammingIndex()
+        for key, value in hashes.items():
+            index.add(key, value)
+        index.remove(1999)
+        del hashes[1999]
+
+        for query in [hashes[0], hashes[7], rng.getrandbits(64)]:
+            for radius in (0, 3, 8, 12):
+                expected = sorted(((value ^ query).bit_count(), key) for key, value in hashes.items()
+                                  if (value ^ query).bit_count() <= radius)
+                self.assertEqual(index.search(query, radius), expected)
+
+    def test_hash_survives_reencoding(self):
+        original = hash_file('images/641999.jpg')
+        copy = hash_file(self.jpeg('images/641999.jpg', scale=0.5, quality=40))
+        other = hash_file('images/Wallpaper_Lucu_Aesthetic_Laptop.jpg')
+        self.assertLessEqual((original ^ copy).bit_count(), 6)
+        self.assertGreater((original ^ other).bit_count(), 16)
+
+    def test_similar_images(self):
+        first = self.upload(self.jpeg('images/641999.jpg')).data['id']
+        second = self.upload(self.jpeg('images/641999.jpg', scale=0.5, quality=40)).data['id']
+        self.upload(self.jpeg('images/Wallpaper_Lucu_Aesthetic_Laptop.jpg'))
+        self.assertIsNotNone(I.objects.get(id=first).phash)
+
+        with patch('api.views.check_access', return_value='test_user'):
+            response = self.client.get(f'/images/{first}/similar/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([image['id'] for image in response.data], [second])
+            self.assertIn('distance', response.data[0])
+
+            pending = I.objects.create(uploaded_by=self.user)
+            self.assertEqual(self.client.get(f'/images/{pending.id}/similar/').status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(self.client.get('/images/999/similar/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deleted_images_leave_index(self):
+        first = self.upload(self.jpeg('images/641999.jpg')).data['id']
+        second = self.upload(self.jpeg('images/641999.jpg', quality=50)).data['id']
+        self.assertEqual(len(similarity.get_index()), 2)
+        I.objects.get(id=second).delete()
+        self.assertEqual(len(similarity.get_index()), 1)
+        with patch('api.views.check_access', return_value='test_user'):
+            self.assertEqual(self.client.get(f'/images/{first}/similar/').data, [])
+
+    def test_refresh_replays_changes_from_other_processes(self):
+        kept = I.objects.create(uploaded_by=self.user, phash=similarity.to_db(0b1011))
+        deleted = I.objects.create(uploaded_by=self.user, phash=similarity.to_db(0b1111))
+        index = similarity.get_index()
+        added = I.objects.create(uploaded_by=self.user)
+        # What index_image and unindex_image journal in another process.
+        similarity._journal(added.id, 0b0011)
+        similarity._journal(deleted.id, None)
+
+        with self.assertNumQueries(0):
+            similarity.refresh_index()
+        self.assertIs(similarity.get_index(), index)
+        self.assertEqual(index.hashes, {kept.id: 0b1011, added.id: 0b0011})
+
+    def test_refresh_rebuilds_when_journal_is_incomplete(self):
+        index = similarity.get_index()
+        image = I.objects.create(uploaded_by=self.user)
+        I.objects.filter(id=image.id).update(phash=similarity.to_db(0b1))
+        # An entry evicted before this process read it.
+        shared_cache().set(similarity._JOURNAL_SEQ_KEY, index.seq + 1, None)
+
+        similarity.refresh_index()
+        self.assertIsNot(similarity.get_index(), index)
+        self.assertEqual(similarity.get_index().hashes, {image.id: 0b1})
+
+    @override_settings(IMAGE_SIMILARITY_INDEX_TTL=0)
+    def test_expired_index_served_while_refreshing(self):
+        index = similarity.get_index()
+        try:
+            with patch('api.similarity.threading.Thread') as thread, self.assertNumQueries(0):
+                self.assertIs(similarity.get_index(), index)
+                self.assertIs(similarity.get_index(), index)
+            # One refresh at a time.
+            thread.assert_called_once()
+            thread.return_value.start.assert_called_once()
+        finally:
+            similarity._refresh_lock.release()
+
+    @override_settings(IMAGE_DUPLICATE_DISTANCE=8)
+    def test_near_duplicate_upload_rejected(self):
+        first = self.upload(self.jpeg('images/641999.jpg')).data['id']
+        response = self.upload(self.jpeg('images/641999.jpg', scale=0.5, quality=40))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['duplicate_of'], first)
+        self.assertEqual(I.objects.count(), 1)
+        response = self.upload(self.jpeg('images/Wallpaper_Lucu_Aesthetic_Laptop.jpg'))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_EXPORT_WORKERS=0, IMAGE_EXPORT_BATCH_SIZE=2)
+class ImageExportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='test_user', password='test_password')
+        self.images = []
+        for color in ['red', 'green', 'blue']:
+            data = BytesIO()
+            Image.new('RGB', (40, 20), color=color).save(data, format='PNG')
+            self.images.append(I.objects.create(uploaded_by=self.user, image_file=SimpleUploadedFile(f'{color}.png', data.getvalue())))
+        self.empty = I.objects.create(uploaded_by=self.user)
+
+    def export(self, **body):
+        with patch('api.views.check_access', return_value='test_user'):
+            return self.client.post('/images/export/', body, format='json')
+
+    def test_npy_export(self):
+        ids = [self.images[2].id, self.images[0].id, self.empty.id, 999, self.images[1].id]
+        response = self.export(ids=ids, width=8, height=4)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(content))
+        self.assertEqual(response['X-Image-Ids'], f'{self.images[2].id},{self.images[0].id},{self.images[1].id}')
+        self.assertEqual(response['X-Missing-Ids'], f'{self.empty.id},999')
+
+        with override_settings(IMAGE_EXPORT_HEADER_MAX_IDS=4):
+            response = self.export(ids=ids, width=8, height=4)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Image-Ids', response)
+        self.assertNotIn('X-Missing-Ids', response)
+
+        array = numpy.load(BytesIO(content))
+        self.assertEqual(array.shape, (3, 4, 8, 3))
+        self.assertEqual(array.dtype, numpy.uint8)
+        self.assertEqual(array[:, 0, 0].tolist(), [[0, 0, 255], [255, 0, 0], [0, 128, 0]])
+
+    def test_npz_export_normalized(self):
+        ids = [self.images[0].id, self.images[1].id]
+        os.remove(self.images[1].image_file.path)
+        response = self.export(ids=ids, width=5, height=5, mode='L', normalize=True, format='npz')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        archive = numpy.load(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive['images'].shape, (2, 5, 5, 1))
+        self.assertEqual(archive['images'].dtype, numpy.float32)
+        self.assertAlmostEqual(float(archive['images'][0].max()), 76 / 255, places=5)
+        self.assertEqual(float(archive['images'][1].max()), 0.0)
+        self.assertEqual(archive['ids'].tolist(), ids)
+        self.assertEqual(archive['failed'].tolist(), [self.images[1].id])
+
+    @override_settings(IMAGE_EXPORT_WORKERS=1)
+    def test_pool_decodes_in_bounded_windows(self):
+        submitted = []
+        pool = ThreadPoolExecutor(max_workers=1)
+        real_submit = pool.submit
+        pool.submit = lambda *args: submitted.append(args[1]) or real_submit(*args)
+        paths = [image.image_file.path for image in self.images] * 3
+        exporter = export.ArrayExport(list(range(len(paths))), paths, (4, 4), 'RGB')
+        with patch('api.export.get_executor', return_value=pool):
+            batches = exporter.batches()
+            self.assertEqual(len(next(batches)), 2)
+            # The first batch plus one refill per image taken from the window.
+            self.assertEqual(len(submitted), 4)
+            self.assertEqual(sum(len(batch) for batch in batches), len(paths) - 2)
+        pool.shutdown()
+        self.assertEqual(submitted, paths)
+
+    def test_limits(self):
+        with override_settings(IMAGE_EXPORT_MAX_IMAGES=2):
+            response = self.export(ids=[image.id for image in self.images], width=8, height=8)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.export(ids=[self.images[0].id], width=4096, height=8)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageBatchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.role = Role.objects.create(role='beta_player')
+        self.user = User.objects.create_user(username='test_user', password='test_password', role=self.role)
+        data = BytesIO()
+        Image.new('RGB', (10, 10), color='blue').save(data, format='PNG')
+        self.shared = [I.objects.create(uploaded_by=self.user, image_file=SimpleUploadedFile('shared.png', data.getvalue())) for _ in range(2)]
+        self.plain = [I.objects.create(uploaded_by=self.user, description=f'Image {i}') for i in range(3)]
+        self.client.force_authenticate(user=self.user)
+
+    def batch(self, payload):
+        return self.client.post('/images/batch/', payload, format='json')
+
+    def test_batch_deletes_and_updates_in_one_request(self):
+        path = self.shared[0].image_file.path
+        ids = [image.id for image in self.shared + self.plain[:1]]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.batch({'delete': ids + [999], 'update': [{'id': self.plain[1].id, 'description': 'Renamed'}]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'deleted': 3, 'updated': 1, 'missing': [999]})
+        self.assertEqual(set(I.objects.values_list('id', flat=True)), {self.plain[1].id, self.plain[2].id})
+        self.assertEqual(I.objects.get(id=self.plain[1].id).description, 'Renamed')
+        self.assertFalse(Blob.objects.exists())
+        for _ in range(50):
+            if not os.path.exists(path):
+                break
+            time.sleep(0.1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_shared_file_kept_while_referenced(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch({'delete': [self.shared[0].id]})
+        self.assertEqual(Blob.objects.get().references, 1)
+        self.assertTrue(os.path.exists(self.shared[1].image_file.path))
+
+    def test_conflicting_operations_rejected(self):
+        response = self.batch({'delete': [self.plain[0].id], 'update': [{'id': self.plain[0].id, 'description': 'x'}]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(I.objects.filter(id=self.plain[0].id).exists())
+
+    def test_permission_checked(self):
+        self.user.role = None
+        self.user.save()
+        response = self.batch({'delete': [self.plain[0].id]})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_only_actions_in_the_batch_required(self):
+        RolePermission.objects.filter(role=self.role, action=RolePermission.Action.DELETE).delete()
+        response = self.batch({'update': [{'id': self.plain[0].id, 'description': 'Renamed'}]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.batch({'delete': [self.plain[1].id]})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(I.objects.filter(id=self.plain[1].id).exists())
+
+        RolePermission.objects.create(role=self.role, resource=RolePermission.Resource.IMAGE, action=RolePermission.Action.DELETE)
+        RolePermission.objects.filter(role=self.role, action=RolePermission.Action.UPDATE).delete()
+        response = self.batch({'delete': [self.plain[1].id]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_anonymous_batch_rejected(self):
+        self.client.force_authenticate(user=None)
+        response = self.batch({'delete': [self.plain[0].id]})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(ROOT_URLCONF='multi_user_app.asgi_urls', PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], LOGIN_VERIFY_WORKERS=0)
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        self.client = AsyncClient()
+        self.role = Role.objects.create(role='beta_player')
+        self.user = User.objects.create_user(username='test_user', password='test_password', role=self.role)
+        for i in range(3):
+            I.objects.create(uploaded_by=self.user, description=f'Image {i}')
+
+    async def test_login(self):
+        response = await self.client.post('/login/', {'username': 'test_user', 'password': 'test_password'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('jwt', response.json())
+
+        response = await self.client.post('/login/', {'username': 'test_user', 'password': 'wrong'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @patch('api.async_views.check_access', return_value='test_user')
+    async def test_image_list_follows_next_link(self, mock_check_access):
+        response = await self.client.get('/images/', {'page_size': 2})
+        self.assertEqual(len(response.json()['results']), 2)
+
+        response = await self.client.get(response.json()['next'])
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertIsNone(response.json()['next'])
+
+        response = await self.client.get(response.json()['previous'])
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertIsNone(response.json()['previous'])
+
+    @patch('api.async_views.check_access', return_value='test_user')
+    @patch('api.views.check_access', return_value='test_user')
+    async def test_image_list_pages_match_sync_view(self, mock_check_access, mock_async_check_access):
+        response = await self.client.get('/images/', {'page_size': 2})
+        async_page = response.json()
+        with override_settings(ROOT_URLCONF='multi_user_app.urls'):
+            sync_page = (await self.client.get('/images/', {'page_size': 2})).json()
+        self.assertEqual(async_page, sync_page)
+        self.assertIn('cursor=', async_page['next'])
+
+        for params in ({'fields': 'id,description'}, {'exclude': 'renditions'}):
+            with self.subTest(params=params):
+                for fast in (True, False):
+                    with override_settings(FAST_LIST_SERIALIZATION=fast):
+                        async_page = (await self.client.get('/images/', params)).json()
+                        with override_settings(ROOT_URLCONF='multi_user_app.urls'):
+                            sync_page = (await self.client.get('/images/', params)).json()
+                    self.assertEqual(async_page, sync_page)
+
+    async def test_image_upload(self):
+        data = BytesIO()
+        Image.new('RGB', (8, 8), color='blue').save(data, format='PNG')
+        upload = SimpleUploadedFile('async.png', data.getvalue(), content_type='image/png')
+        token = await sync_to_async(encode_token)(self.user)
+        with self.settings(MEDIA_ROOT=tempfile.mkdtemp()), patch('api.async_views.enqueue_image_processing'):
+            response = await self.client.post('/images/', {'uploaded_by': self.user.id, 'image_file': upload},
+                                              headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            image = await I.objects.aget(id=response.json()['id'])
+            self.assertEqual(await Blob.objects.filter(name=image.image_file.name).acount(), 1)
+            self.assertEqual(hashlib.sha256(data.getvalue()).hexdigest(), (await Blob.objects.aget()).digest)
+
+    @patch('api.async_views.check_access', return_value='test_user')
+    async def test_image_list_stream(self, mock_check_access):
+        response = await self.client.get('/images/', {'stream': '1'})
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(json.loads(body)), 3)
+
+    @patch('api.async_views.access_claims', return_value={'username': 'test_user'})
+    @patch('api.async_views.check_access', return_value='test_user')
+    async def test_image_detail_update_and_delete(self, mock_check_access, mock_access_claims):
+        image = await I.objects.afirst()
+        response = await self.client.get(f'/images/{image.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', response)
+
+        response = await self.client.put(f'/images/{image.id}/', {'uploaded_by': self.user.id, 'description': 'Updated'}, content_type='application/json')
+        self.assertEqual(response.json()['description'], 'Updated')
+
+        # Form bodies are accepted as by the sync view.
+        response = await self.client.put(f'/images/{image.id}/', f'uploaded_by={self.user.id}&description=Form',
+                                         content_type='application/x-www-form-urlencoded')
+        self.assertEqual(response.json()['description'], 'Form')
+
+        response = await self.client.delete(f'/images/{image.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(await I.objects.filter(id=image.id).aexists())
+
+    async def test_missing_token_rejected(self):
+        response = await self.client.get('/images/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,86 @@
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+from api.cache_backends import counter_cache
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate: str) -> tuple:
+    """
+    Parses a rate such as '10/min' into a bucket capacity and refill speed.
+
+    Args:
+        rate (str): '<requests>/<period>', where the period starts with s, m, h or d.
+
+    Returns:
+        tuple: (capacity, tokens added per second).
+    """
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / DURATIONS[period[0]]
+
+
+class TokenBucket:
+    """
+    Token bucket kept in Django's cache, so every worker sharing the counters cache shares the buckets.
+
+    A full bucket allows a burst of ``capacity`` requests, after which requests
+    are allowed at the refill rate. Updates are not atomic, so concurrent
+    requests may occasionally both take the last token.
+
+    Attributes:
+        scope (str): Namespace of the bucket keys.
+        capacity (int): Maximum number of tokens.
+        refill (float): Tokens added per second.
+    """
+
+    def __init__(self, scope: str, rate: str):
+        self.scope = scope
+        self.capacity, self.refill = parse_rate(rate)
+
+    def consume(self, key: str) -> float:
+        """
+        Takes one token for a key.
+
+        Args:
+            key (str): The client identity, e.g. an IP address or username.
+
+        Returns:
+            float: 0 if the request is allowed, otherwise the seconds until a token is available.
+        """
+        cache_key = f'api:throttle:{self.scope}:{key}'
+        now = time.time()
+        # Read past the local tier, which could hide other workers' requests.
+        cache = counter_cache()
+        tokens, updated = cache.get(cache_key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.refill)
+        if tokens < 1:
+            return (1 - tokens) / self.refill
+        cache.set(cache_key, (tokens - 1, now), int(self.capacity / self.refill) + 1)
+        return 0
+
+
+def check_login_rate(request, username: str):
+    """
+    Applies the per-IP and per-username login buckets from settings.LOGIN_THROTTLE_RATES.
+
+    Runs before the user is looked up or any password is hashed, so rejected
+    attempts cost one cache round trip each.
+
+    Args:
+        request: The HTTP request.
+        username (str): The username being logged into.
+
+    Raises:
+        Throttled: If either bucket is empty.
+    """
+    rates = getattr(settings, 'LOGIN_THROTTLE_RATES', {})
+    keys = {'ip': BaseThrottle().get_ident(request), 'username': str(username).lower()}
+    for scope, key in keys.items():
+        if rates.get(scope):
+            wait = TokenBucket(f'login-{scope}', rates[scope]).consume(key)
+            if wait:
+                raise Throttled(wait=wait)
@@ -0,0 +1,192 @@
+"""
+Resumable image uploads.
+
+A client opens an UploadSession, appends the file in chunks at explicit
+offsets and completes the session with the file's SHA-256. Chunks are
+written to a part file inside the images storage, read from the request in
+blocks, so memory use does not depend on the chunk or file size. A retry
+after a dropped connection asks for the session's offset and resends only
+what is missing. Completing verifies the size and checksum and moves the
+part file into place before the Image row is created.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import storages
+from django.db import transaction
+from PIL import Image as PILImage
+from rest_framework.exceptions import ValidationError
+from api.models import Image, UploadSession
+from api.similarity import check_duplicate
+
+BLOCK_SIZE = 64 * 1024
+# Pillow reports multi-picture JPEGs from cameras as MPO.
+FORMAT_ALIASES = {'MPO': 'JPEG'}
+
+
+class Conflict(Exception):
+    """
+    Raised when a chunk does not start at the session's current offset.
+
+    Attributes:
+        offset (int): The offset the client should resume from.
+    """
+
+    def __init__(self, offset: int):
+        super().__init__(f'Expected offset {offset}')
+        self.offset = offset
+
+
+class _PartFile(File):
+    # FileSystemStorage moves files that report a temporary path instead of copying them.
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(session: UploadSession) -> str:
+    """
+    Returns where a session's received bytes are kept.
+
+    Args:
+        session (UploadSession): The upload session.
+
+    Returns:
+        str: Absolute path of the part file.
+    """
+    return storages['images'].path(os.path.join('images', 'uploads', f'{session.id}.part'))
+
+
+def append_chunk(session_id, offset: int, length: int, stream) -> UploadSession:
+    """
+    Appends one chunk to a session's part file.
+
+    The chunk is first read from the client into a temporary file, so the
+    session row is only locked while the offset is checked, the received
+    bytes are copied on local disk and the offset is advanced, not while a
+    slow client sends them.
+
+    Args:
+        session_id: The session id.
+        offset (int): Position of the chunk in the file.
+        length (int): Chunk size in bytes.
+        stream: Readable source of the chunk, e.g. the request.
+
+    Returns:
+        UploadSession: The updated session.
+
+    Raises:
+        UploadSession.DoesNotExist: If there is no such session.
+        Conflict: If offset is not the number of bytes received so far.
+        ValidationError: If the chunk is truncated or runs past the announced size.
+    """
+    session = UploadSession.objects.get(id=session_id)
+    _check_chunk(session, offset, length)
+
+    path = part_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.TemporaryFile(dir=os.path.dirname(path)) as chunk:
+        remaining = length
+        while remaining:
+            block = stream.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            chunk.write(block)
+            remaining -= len(block)
+        if remaining:
+            raise ValidationError('Chunk is shorter than its Content-Length')
+        chunk.seek(0)
+
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(id=session_id)
+            # Another request may have appended this range while the chunk was read.
+            _check_chunk(session, offset, length)
+            with open(path, 'ab') as part:
+                # Drop the tail of an earlier attempt that failed after writing.
+                part.truncate(offset)
+                shutil.copyfileobj(chunk, part, BLOCK_SIZE)
+            session.offset += length
+            session.save(update_fields=['offset'])
+    return session
+
+
+def _check_chunk(session: UploadSession, offset: int, length: int):
+    if offset != session.offset:
+        raise Conflict(session.offset)
+    if offset + length > session.size:
+        raise ValidationError(f'Chunk runs past the announced size of {session.size} bytes')
+
+
+def _file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def complete(session_id, sha256: str) -> Image:
+    """
+    Verifies a fully received upload and stores it as a new Image.
+
+    The session row is locked for the whole check, so of two concurrent
+    completes only one finds the part file; the other sees the session gone.
+
+    Args:
+        session_id: The session id.
+        sha256 (str): Hex SHA-256 of the whole file, as computed by the client.
+
+    Returns:
+        Image: The created image, not yet processed.
+
+    Raises:
+        UploadSession.DoesNotExist: If there is no such session, e.g. it was just completed.
+        ValidationError: If bytes are missing, the checksum differs, the file is not an image
+            or the filename's extension does not match its format.
+        DuplicateImage: If IMAGE_DUPLICATE_DISTANCE is set and a stored image is that close.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().select_related('user').get(id=session_id)
+        if session.offset != session.size:
+            raise ValidationError(f'Received {session.offset} of {session.size} bytes')
+        path = part_path(session)
+        try:
+            if _file_sha256(path) != str(sha256).lower():
+                raise ValidationError('Checksum mismatch')
+        except FileNotFoundError:
+            raise UploadSession.DoesNotExist('Upload session has no received bytes')
+        try:
+            with PILImage.open(path) as image:
+                image_format = image.format
+                image.verify()
+        except Exception:
+            raise ValidationError('Upload a valid image.')
+        # The stored name decides the Content-Type the file is served with.
+        extension = os.path.splitext(session.filename)[1].lower()
+        if PILImage.registered_extensions().get(extension) != FORMAT_ALIASES.get(image_format, image_format):
+            raise ValidationError(f'The file is a {image_format} image, not {extension or "extensionless"}.')
+        phash = check_duplicate(path)
+
+        image = Image(uploaded_by=session.user, description=session.description, phash=phash)
+        with open(path, 'rb') as part:
+            image.image_file.save(session.filename, _PartFile(part, name=session.filename), save=False)
+        image.save()
+        session.delete()
+    # Left behind when the content was already stored.
+    discard(path)
+    return image
+
+
+def discard(path: str):
+    """
+    Removes a part file if it exists.
+
+    Args:
+        path (str): Absolute path of the part file.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
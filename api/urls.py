@@ -2,8 +2,17 @@ from django.urls import path
 from api.views import (
     ImageListView,
     RegisterView,
+    BulkRegisterView,
     LoginAPIView,
+    RefreshTokenView,
     ImageDetailsView,
+    ImageContentView,
+    SimilarImagesView,
+    ImageBatchView,
+    ImageExportView,
+    UploadSessionListView,
+    UploadSessionDetailsView,
+    UploadSessionCompleteView,
     RoleDetailsView,
     RoleListView,
     SubscriptionPlanListView,
@@ -12,10 +21,19 @@ from api.views import (
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name="register"),
+    path('register/bulk/', BulkRegisterView.as_view(), name="register-bulk"),
     path('login/', LoginAPIView.as_view(), name="login"),
+    path('token/refresh/', RefreshTokenView.as_view(), name="token-refresh"),
     path('images/<int:id>/', ImageDetailsView.as_view(), name='image-details'),
+    path('images/<int:id>/content/', ImageContentView.as_view(), name='image-content'),
+    path('images/<int:id>/similar/', SimilarImagesView.as_view(), name='image-similar'),
     path('roles/<str:id>/', RoleDetailsView.as_view(), name='role-details'),
     path('images/', ImageListView.as_view(), name='image-list'),
+    path('images/batch/', ImageBatchView.as_view(), name='image-batch'),
+    path('images/export/', ImageExportView.as_view(), name='image-export'),
+    path('images/uploads/', UploadSessionListView.as_view(), name='upload-session-list'),
+    path('images/uploads/<uuid:id>/', UploadSessionDetailsView.as_view(), name='upload-session-details'),
+    path('images/uploads/<uuid:id>/complete/', UploadSessionCompleteView.as_view(), name='upload-session-complete'),
     path('roles/', RoleListView.as_view(), name='role-list'),
     path('subscription-plans/', SubscriptionPlanListView.as_view(), name='subscription-plan-list'),
     path('subscription-plans/<str:subscription_plan>/', SubscriptionPlanDetailsView.as_view(), name='subscription-plan-details'),
@@ -1,14 +1,68 @@
 import jwt
 import datetime
-from api.models import User
+import hashlib
+import uuid
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from api.cache import LRUCache
+from api.models import RevokedToken, User
+from api.versioning import get_version
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.response import Response
 from rest_framework import status
 
+# Verified token claims keyed by the SHA-256 of the raw token. Entries never
+# outlive the token's own 'exp' claim.
+token_cache = LRUCache(
+    maxsize=getattr(settings, 'TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 300),
+)
+
+def _signing_key() -> str:
+    return getattr(settings, 'JWT_SIGNING_KEY', settings.SECRET_KEY)
+
+
+def _encode(username: str, token_type: str, lifetime: int, **claims) -> str:
+    payload = {
+        'username': username,
+        'type': token_type,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=lifetime),
+        'iat': datetime.datetime.utcnow(),
+        **claims,
+    }
+    return jwt.encode(payload, _signing_key(), algorithm='HS256').decode('utf-8')
+
+
+def user_claims(user: User) -> dict:
+    """
+    Returns the claims embedding a user's id, role, plan and superuser flag.
+
+    Access tokens carry them so requests can be authorized without loading
+    the user; see api.authentication.token_user.
+
+    ``ver`` is the user's version from api.versioning at issue time; saving
+    the user changes it, which makes the other claims stale.
+
+    Args:
+        user (User): A user loaded from the database.
+
+    Returns:
+        dict: The claims, or an empty dict when JWT_EMBED_CLAIMS is off.
+    """
+    if not getattr(settings, 'JWT_EMBED_CLAIMS', True) or user.pk is None:
+        return {}
+    return {
+        'uid': user.pk,
+        'role': user.role_id,
+        'plan': user.subscription_plan_id,
+        'su': user.is_superuser,
+        'ver': get_version(User, user.pk)[0],
+    }
+
 
 def encode_token(user: User) -> str:
     """
-    Encodes a JWT token with user information.
+    Encodes a short-lived JWT access token with user information.
 
     Args:
         user (User): The user for whom the token is being generated.
@@ -16,13 +70,21 @@ def encode_token(user: User) -> str:
     Returns:
         str: The encoded JWT token.
     """
-    payload = {
-        'username': user.username,
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=180),
-        'iat': datetime.datetime.utcnow()
-    }
+    return _encode(user.username, 'access', getattr(settings, 'JWT_ACCESS_TOKEN_LIFETIME', 15), **user_claims(user))
+
 
-    return jwt.encode(payload, 'secret', algorithm='HS256').decode('utf-8')
+def encode_refresh_token(user: User) -> str:
+    """
+    Encodes a long-lived refresh token, exchanged for new tokens by rotate_refresh_token.
+
+    Args:
+        user (User): The user for whom the token is being generated.
+
+    Returns:
+        str: The encoded JWT token.
+    """
+    return _encode(user.username, 'refresh', getattr(settings, 'JWT_REFRESH_TOKEN_LIFETIME', 7 * 24 * 60),
+                   jti=uuid.uuid4().hex)
 
 
 def get_token(auth_header: str) -> Response:
@@ -43,40 +105,103 @@ def get_token(auth_header: str) -> Response:
         return Response({'error': 'Invalid Authorization header'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-def decode_token(token: str) -> dict:
+def decode_token(token: str, token_type: str = 'access') -> dict:
     """
     Decodes a JWT token.
 
+    Successfully verified tokens are cached until their expiry, so repeated
+    requests with the same token skip signature verification.
+
     Args:
         token (str): The JWT token to decode.
+        token_type (str): 'access' or 'refresh'; tokens of the other type are rejected.
 
     Returns:
         dict: Decoded token data.
     """
+    key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    decoded_data = token_cache.get(key)
+    if decoded_data is not None:
+        decoded_data = dict(decoded_data)
+    else:
+        try:
+            decoded_data = jwt.decode(token, _signing_key(), algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            raise AuthenticationFailed('Token has expired')
+        except jwt.InvalidTokenError:
+            raise AuthenticationFailed('Invalid token')
+
+        if 'exp' in decoded_data:
+            token_cache.set(key, dict(decoded_data), expires_at=decoded_data['exp'])
+
+    if decoded_data.get('type', 'access') != token_type:
+        raise AuthenticationFailed('Invalid token type')
+    return decoded_data
+
+
+def rotate_refresh_token(token: str) -> dict:
+    """
+    Exchanges a refresh token for a new access token and a new refresh token.
+
+    The used token is revoked by inserting its id into the RevokedToken table,
+    so each refresh token works once and presenting it again is rejected. No
+    password is hashed. The user is read again, so the new access token
+    carries their current role and plan and deleted users cannot refresh.
+
+    Args:
+        token (str): The refresh token.
+
+    Returns:
+        dict: The new tokens under 'jwt' and 'refresh'.
+
+    Raises:
+        AuthenticationFailed: If the token is invalid, expired or already used, or the user no longer exists.
+    """
+    claims = decode_token(token, token_type='refresh')
+    expires_at = datetime.datetime.fromtimestamp(claims['exp'], tz=datetime.timezone.utc)
     try:
-        decoded_data = jwt.decode(token, 'secret', algorithms=['HS256'])
-        return decoded_data
-    except jwt.ExpiredSignatureError:
-        raise AuthenticationFailed('Token has expired')
-    except jwt.InvalidTokenError:
-        raise AuthenticationFailed('Invalid token')
+        with transaction.atomic():
+            RevokedToken.objects.create(jti=claims['jti'], expires_at=expires_at)
+    except IntegrityError:
+        raise AuthenticationFailed('Refresh token has already been used')
 
+    user = User.objects.filter(username=claims['username']).first()
+    if user is None:
+        raise AuthenticationFailed('User not found!')
+    return {'jwt': encode_token(user), 'refresh': encode_refresh_token(user)}
 
-def check_access(header: dict) -> str:
+
+def access_claims(header: dict) -> dict:
     """
-    Validates and retrieves the username from the Authorization header.
+    Validates the access token in the Authorization header and returns its claims.
 
     Args:
         header (dict): The HTTP header containing the Authorization information.
 
     Returns:
-        str: The username extracted from the token.
+        dict: The decoded token claims.
 
     Raises:
         AuthenticationFailed: If the token is invalid.
     """
     try:
         token = get_token(header.get('Authorization', ''))
-        return decode_token(token.data['token'])['username']
+        return decode_token(token.data['token'])
     except:
         raise AuthenticationFailed()
+
+
+def check_access(header: dict) -> str:
+    """
+    Validates and retrieves the username from the Authorization header.
+
+    Args:
+        header (dict): The HTTP header containing the Authorization information.
+
+    Returns:
+        str: The username extracted from the token.
+
+    Raises:
+        AuthenticationFailed: If the token is invalid.
+    """
+    return access_claims(header)['username']
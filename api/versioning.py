@@ -0,0 +1,139 @@
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def _version_key(model, pk=None) -> str:
+    key = f'api:version:{model._meta.label_lower}'
+    return key if pk is None else f'{key}:{pk}'
+
+
+def bump_version(model, pk=None):
+    """
+    Marks every row of a model, or one row, as changed.
+
+    The version is a random token rather than an incrementing number, so a
+    version lost to cache eviction can never be reissued and match an old ETag.
+
+    Args:
+        model: The model class that changed.
+        pk: The primary key of the row that changed, to version it apart from the table.
+    """
+    cache.set(_version_key(model, pk), (uuid.uuid4().hex, int(time.time())), None)
+
+
+def bump_versions(model, pks):
+    """
+    Marks many rows of a model as changed in one cache round trip.
+
+    Args:
+        model: The model class that changed.
+        pks: The primary keys of the rows that changed.
+    """
+    now = int(time.time())
+    cache.set_many({_version_key(model, pk): (uuid.uuid4().hex, now) for pk in pks}, None)
+
+
+def get_version(model, pk=None) -> tuple:
+    """
+    Returns the current version token and last modification time of a model, or of one row.
+
+    Args:
+        model: The model class.
+        pk: The primary key of a row versioned with bump_version(model, pk).
+
+    Returns:
+        tuple: (token, Unix timestamp of the last change).
+    """
+    key = _version_key(model, pk)
+    version = cache.get(key)
+    if version is None:
+        version = (uuid.uuid4().hex, int(time.time()))
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+async def aget_version(model, pk=None) -> tuple:
+    """
+    Async version of get_version.
+
+    Args:
+        model: The model class.
+        pk: The primary key of a row versioned with bump_version(model, pk).
+
+    Returns:
+        tuple: (token, Unix timestamp of the last change).
+    """
+    key = _version_key(model, pk)
+    version = await cache.aget(key)
+    if version is None:
+        version = (uuid.uuid4().hex, int(time.time()))
+        if not await cache.aadd(key, version, None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def _etag(token: str, key) -> str:
+    return '"%s"' % hashlib.md5(f'{token}:{key}'.encode('utf-8')).hexdigest()
+
+
+def conditional_get(request, model, build_response, key='') -> object:
+    """
+    Answers a GET with 304 when the client already holds the current representation.
+
+    The ETag is derived from the model's version and the resource key, so the
+    table and serializer are only touched when the client's copy is stale.
+
+    Args:
+        request: The HTTP request.
+        model: The model class the response is built from.
+        build_response (callable): Builds the full response when needed.
+        key: Identifies the resource within the model, e.g. the primary key for detail views.
+
+    Returns:
+        Response: A 304 response, or the built response with ETag and Last-Modified headers.
+    """
+    token, last_modified = get_version(model)
+    etag = _etag(token, key)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build_response()
+        if response.status_code != 200:
+            return response
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+async def aconditional_get(request, model, build_response, key=''):
+    """
+    Async version of conditional_get for async views.
+
+    Args:
+        request: The HTTP request.
+        model: The model class the response is built from.
+        build_response (callable): Coroutine function building the full response when needed.
+        key: Identifies the resource within the model.
+
+    Returns:
+        HttpResponse: A 304 response, or the built response with ETag and Last-Modified headers.
+    """
+    token, last_modified = await aget_version(model)
+    etag = _etag(token, key)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = await build_response()
+        if response.status_code != 200:
+            return response
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -1,10 +1,157 @@
+from functools import partial
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from api.utils import check_access, encode_token
-from .models import Role, SubscriptionPlan, User, Image
+from api.utils import check_access, encode_refresh_token, encode_token, rotate_refresh_token
+from .models import Role, RolePermission, SubscriptionPlan, User, Image, UploadSession
 from rest_framework import generics, status
-from .serializers import RoleSerializer, SubscriptionPlanSerializer, UserSerializer, ImageSerializer
-from rest_framework.exceptions import AuthenticationFailed
+from .serializers import (
+    RoleSerializer, SubscriptionPlanSerializer, UserSerializer, ImageSerializer, UploadSessionSerializer, ImageBatchSerializer,
+    ImageExportSerializer,
+)
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied, ValidationError
+from rest_framework.parsers import JSONParser
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.db import IntegrityError, transaction
+from .parsers import NDJSONParser
+from .hashing import hash_passwords, password_needs_upgrade, submit_password_check
+from .throttling import check_login_rate
+from .pagination import ImageCursorPagination, stream_queryset
+from .authentication import get_user, unknown_usernames
+from .permissions import RoleBasedPermission, has_permission
+from .tasks import delete_files_later, enqueue_image_processing
+from .versioning import bump_version, conditional_get
+from .files import serve_file
+from .fastpath import json_response, row_serializer
+from . import export, uploads
+from .signals import defer_image_deletes
+from . import similarity
+from . import catalog
+
+
+def get_request_user(request) -> User:
+    """
+    Authenticates the request and attaches the resolved user to it.
+
+    Reuses the user DRF authenticated, e.g. for RoleBasedPermission, rather
+    than resolving the token twice.
+
+    Args:
+        request: The HTTP request.
+
+    Returns:
+        User: The authenticated user, with role and subscription plan loaded.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        user = get_user(check_access(request.headers))
+        request.user = user
+    return user
+
+
+def use_fast_path(request) -> bool:
+    """
+    Tells whether a list response may be built by api.fastpath.
+
+    Args:
+        request: The DRF request, after content negotiation.
+
+    Returns:
+        bool: True if FAST_LIST_SERIALIZATION is on and JSON was negotiated.
+    """
+    return getattr(settings, 'FAST_LIST_SERIALIZATION', False) and request.accepted_renderer.format == 'json'
+
+
+def image_list_query(params, user: User = None) -> tuple:
+    """
+    Builds the queryset of the image list from its query parameters.
+
+    Shared by ImageListView and api.async_views.AsyncImageListView.
+
+    Args:
+        params (QueryDict): The query parameters; see filter_images and SparseFieldsetMixin.
+        user (User): The requesting user, needed for ``?mine=``.
+
+    Returns:
+        tuple: (queryset ordered by id, selected field names or None for all fields).
+    """
+    fields = ImageSerializer.requested_fields(params)
+    images = filter_images(Image.objects.order_by('id'), params, user)
+    if fields is not None:
+        images = images.only(*ImageSerializer.model_fields(fields))
+    return images, fields
+
+
+def image_list_page(request, images, fields, fast: bool, view=None) -> dict:
+    """
+    Fetches and serializes one page of the image list.
+
+    Shared by ImageListView and api.async_views.AsyncImageListView, so both
+    deployments answer with the same cursors and body.
+
+    Args:
+        request: The DRF request.
+        images (QuerySet): The rows, from image_list_query.
+        fields (list): The selected field names, or None for all fields.
+        fast (bool): Serialize with api.fastpath instead of ImageSerializer.
+        view: The view, if any.
+
+    Returns:
+        dict: The page as ``{next, previous, results}``.
+    """
+    paginator = ImageCursorPagination()
+    if fast:
+        rows = row_serializer(ImageSerializer, None if fields is None else tuple(fields))
+        page = paginator.paginate_queryset(rows.values_list(images, 'id'), request, view=view)
+        return paginator.get_paginated_response(rows.serialize(page)).data
+    page = paginator.paginate_queryset(images, request, view=view)
+    return paginator.get_paginated_response(ImageSerializer(page, many=True, fields=fields).data).data
+
+
+def fieldset_key(key, fields) -> str:
+    """
+    Extends a conditional_get key with the requested fieldset, so each fieldset has its own ETag.
+
+    Args:
+        key: The resource key.
+        fields (list): The selected field names, or None for all fields.
+
+    Returns:
+        str: The key to pass to conditional_get.
+    """
+    return f'{key}' if fields is None else f'{key}:{",".join(fields)}'
+
+
+def filter_images(images, params, user: User = None):
+    """
+    Applies the image list filters.
+
+    ``?mine=1`` keeps the requesting user's images and ``?uploaded_by=<id>``
+    another user's; both page through the (uploaded_by, id) index.
+    ``?search=`` matches descriptions case-insensitively.
+
+    Args:
+        images (QuerySet): The images to filter.
+        params (QueryDict): The query parameters.
+        user (User): The requesting user, required for ``?mine=1``.
+
+    Returns:
+        QuerySet: The filtered images.
+
+    Raises:
+        ValidationError: If uploaded_by is not a user id.
+    """
+    if params.get('mine') in ('1', 'true'):
+        images = images.filter(uploaded_by=user)
+    elif 'uploaded_by' in params:
+        try:
+            images = images.filter(uploaded_by=int(params['uploaded_by']))
+        except ValueError:
+            raise ValidationError({'uploaded_by': ['A valid integer is required.']})
+    if params.get('search'):
+        images = images.filter(description__icontains=params['search'])
+    return images
 
 
 class RegisterView(generics.GenericAPIView):
@@ -24,52 +171,189 @@ class RegisterView(generics.GenericAPIView):
         return Response(serializer.data)
 
 
+class BulkRegisterView(generics.GenericAPIView):
+    parser_classes = [JSONParser, NDJSONParser]
+    resource = RolePermission.Resource.USER
+
+    def post(self, request):
+        """
+        Handles registration of many users at once.
+
+        The body is a JSON array or an NDJSON stream of user objects. Each row
+        is validated with UserSerializer; passwords of the valid rows are
+        hashed in parallel and the users are inserted in batches. Only
+        superusers and roles granted the user create permission may call it.
+
+        Args:
+            request: The HTTP request.
+
+        Returns:
+            Response: A Response object with per-row results, or error message.
+        """
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response("Expected a list of users", status=status.HTTP_400_BAD_REQUEST)
+        max_rows = getattr(settings, 'BULK_REGISTER_MAX_ROWS', 10000)
+        if len(rows) > max_rows:
+            return Response(f"At most {max_rows} users can be registered at once", status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(rows)
+        pending = []
+        usernames = set()
+        for index, row in enumerate(rows):
+            serializer = UserSerializer(data=row)
+            if not serializer.is_valid():
+                results[index] = {'index': index, 'status': 'error', 'errors': serializer.errors}
+                continue
+            username = serializer.validated_data['username']
+            if username in usernames:
+                results[index] = {'index': index, 'status': 'error', 'errors': {'username': ['Duplicate username in request.']}}
+                continue
+            usernames.add(username)
+            pending.append((index, serializer.validated_data))
+
+        passwords = hash_passwords([data.pop('password') for _, data in pending])
+        users = []
+        for (index, data), password in zip(pending, passwords):
+            user = User(**data)
+            user.password = password
+            users.append((index, user))
+
+        batch_size = getattr(settings, 'BULK_REGISTER_BATCH_SIZE', 500)
+        for start in range(0, len(users), batch_size):
+            for index, user, error in self.insert_batch(users[start:start + batch_size]):
+                if error is None:
+                    # bulk_create sends no post_save, so drop the username from the negative cache here.
+                    unknown_usernames.delete(user.username)
+                    results[index] = {'index': index, 'status': 'created', 'id': user.id, 'username': user.username}
+                else:
+                    results[index] = {'index': index, 'status': 'error', 'errors': error}
+
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response({'created': created, 'failed': len(results) - created, 'results': results})
+
+    def insert_batch(self, batch):
+        """
+        Inserts a batch of users with one statement, falling back to row by row on a conflict.
+
+        Args:
+            batch (list): (index, unsaved User) pairs.
+
+        Returns:
+            list: (index, user, error) triples; error is None for inserted users.
+        """
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([user for _, user in batch])
+            return [(index, user, None) for index, user in batch]
+        except IntegrityError:
+            pass
+
+        outcome = []
+        for index, user in batch:
+            try:
+                with transaction.atomic():
+                    user.save()
+                outcome.append((index, user, None))
+            except IntegrityError:
+                outcome.append((index, user, {'username': ['user with this username already exists.']}))
+        return outcome
+
+
 class LoginAPIView(generics.GenericAPIView):
     def post(self, request):
         """
         Handles user login.
 
+        Attempts are rate limited per IP and per username before any lookup,
+        usernames recently found missing are rejected without a query, and the
+        password is verified in the bounded login pool of api.hashing, or
+        inline when LOGIN_VERIFY_WORKERS is 0. The pool caps concurrent
+        hashing rather than freeing this thread, which waits for the result.
+
         Args:
             request: The HTTP request.
 
         Returns:
-            Response: A Response object with JWT token.
+            Response: A Response object with JWT access and refresh tokens.
         """
         username = request.data['username']
         password = request.data['password']
 
+        check_login_rate(request, username)
+
+        if unknown_usernames.get(username):
+            raise AuthenticationFailed('User not found!')
+
         user = User.objects.filter(username=username).first()
 
         if user is None:
+            unknown_usernames.set(username)
             raise AuthenticationFailed('User not found!')
 
-        if not user.check_password(password):
+        if not submit_password_check(password, user.password).result():
             raise AuthenticationFailed('Incorrect password!')
 
+        if password_needs_upgrade(user.password):
+            user.set_password(password)
+            user.save(update_fields=['password'])
+
         token = encode_token(user)
 
         response = Response()
         response.set_cookie(key='jwt', value=token, httponly=True)
         response.data = {
-            'jwt': token
+            'jwt': token,
+            'refresh': encode_refresh_token(user),
         }
         return Response(response.data, status=status.HTTP_200_OK)
 
 
+class RefreshTokenView(generics.GenericAPIView):
+    def post(self, request):
+        """
+        Exchanges a refresh token for new access and refresh tokens.
+
+        Each refresh token can be used once; the response carries its replacement.
+
+        Args:
+            request: The HTTP request.
+
+        Returns:
+            Response: A Response object with the new JWT access and refresh tokens.
+        """
+        refresh = request.data.get('refresh')
+        if not isinstance(refresh, str):
+            raise AuthenticationFailed('Refresh token required')
+        return Response(rotate_refresh_token(refresh), status=status.HTTP_200_OK)
+
+
 class RoleListView(APIView):
+    resource = RolePermission.Resource.ROLE
+
     def get(self, request):
         """
         Retrieves a list of roles.
 
+        With FAST_LIST_SERIALIZATION, JSON responses are built by api.fastpath.
+
         Args:
             request: The HTTP request.
 
         Returns:
-            Response: A Response object with role data.
-        """
-        roles = Role.objects.all()
-        serializer = RoleSerializer(roles, many=True)
-        return Response(serializer.data)
+            Response: A Response object with role data, or 304 if the client's copy is current.
+        """
+        if use_fast_path(request):
+            return conditional_get(
+                request,
+                Role,
+                lambda: json_response(row_serializer(RoleSerializer).serialize_objects(catalog.roles.all().values())),
+            )
+        return conditional_get(
+            request,
+            Role,
+            lambda: Response(RoleSerializer(catalog.roles.all().values(), many=True).data),
+        )
 
     def post(self, request):
         """
@@ -89,6 +373,7 @@ class RoleListView(APIView):
 
 
 class RoleDetailsView(APIView):
+    resource = RolePermission.Resource.ROLE
 
     def get(self, request, id=str):
         """
@@ -102,12 +387,11 @@ class RoleDetailsView(APIView):
             Response: A Response object with role data or error message.
         """
         check_access(request.headers)
-        try:
-            role = Role.objects.get(role=id)
-            serializer = RoleSerializer(role)
-            return Response(serializer.data)
-        except Role.DoesNotExist:
+        role = catalog.roles.get(id)
+        if role is None:
             return Response(status=status.HTTP_404_NOT_FOUND)
+        serializer = RoleSerializer(role)
+        return Response(serializer.data)
 
     def put(self, request, id=str):
         """
@@ -120,7 +404,6 @@ class RoleDetailsView(APIView):
         Returns:
             Response: A Response object with updated role data or error message.
         """
-        check_access(request.headers)
         try:
             role = Role.objects.get(role=id)
             serializer = RoleSerializer(role, data=request.data)
@@ -142,7 +425,6 @@ class RoleDetailsView(APIView):
         Returns:
             Response: A Response object indicating success or failure.
         """
-        check_access(request.headers)
         try:
             role = Role.objects.get(role=id)
             operator = role.delete()
@@ -155,62 +437,93 @@ class RoleDetailsView(APIView):
 
 
 class ImageListView(APIView):
+    resource = RolePermission.Resource.IMAGE
+
     def get(self, request):
         """
-        Retrieves a list of images.
+        Retrieves a page of images ordered by id.
+
+        Pass ``?cursor=`` to fetch the next page and ``?page_size=`` to change
+        the page size. ``?stream=1`` streams every image as one JSON array
+        instead of paginating. See filter_images for the filters.
+        ``?fields=`` or ``?exclude=`` (comma separated) narrow the returned
+        fields and the selected columns. With FAST_LIST_SERIALIZATION, JSON
+        pages are built by api.fastpath instead of ImageSerializer.
 
         Args:
             request: The HTTP request.
 
         Returns:
-            Response: A Response object with image data.
-        """
-        check_access(request.headers)
-        images = Image.objects.all()
-        serializer = ImageSerializer(images, many=True)
-        return Response(serializer.data)
+            Response: A Response object with a page of image data, or a
+            StreamingHttpResponse when streaming.
+        """
+        if request.query_params.get('mine') in ('1', 'true'):
+            user = get_request_user(request)
+        else:
+            user = None
+            check_access(request.headers)
+        images, fields = image_list_query(request.query_params, user)
+        if request.query_params.get('stream') in ('1', 'true'):
+            return stream_queryset(images, partial(ImageSerializer, fields=fields))
+        fast = use_fast_path(request)
+        data = image_list_page(request, images, fields, fast, view=self)
+        return json_response(data) if fast else Response(data)
 
     def post(self, request):
         """
-        Handles the creation of a new image.
+        Handles the upload of a new image.
+
+        The file is stored right away; decoding, metadata stripping and
+        thumbnail generation happen in the background, so the response is
+        returned before the image is ready. With IMAGE_DUPLICATE_DISTANCE
+        set, near-duplicates of stored images are rejected with 409.
 
         Args:
             request: The HTTP request.
 
         Returns:
-            Response: A Response object indicating success or failure.
+            Response: A Response object with the image id and processing status, or an error message.
         """
-        username = check_access(request.headers)
-        user = User.objects.get(username=username)
-        if user.role.role != 'beta_player':
-            return Response("User not allowed to add the image", status=status.HTTP_401_UNAUTHORIZED)
         serializer = ImageSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response("Image uploaded successfully", status=status.HTTP_201_CREATED)
+            image_file = serializer.validated_data.get('image_file')
+            image = serializer.save(phash=similarity.check_duplicate(image_file) if image_file else None)
+            enqueue_image_processing(image)
+            return Response({'id': image.id, 'status': image.status}, status=status.HTTP_202_ACCEPTED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class ImageDetailsView(APIView):
+    resource = RolePermission.Resource.IMAGE
 
     def get(self, request, id: int):
         """
         Retrieves details of a specific image.
 
+        ``?fields=`` or ``?exclude=`` narrow the returned fields as for the list.
+
         Args:
             request: The HTTP request.
             id: The ID of the image.
 
         Returns:
-            Response: A Response object with image data or error message.
+            Response: A Response object with image data, 304 if the client's copy is current, or error message.
         """
         check_access(request.headers)
-        try:
-            image = Image.objects.get(id=id)
-            serializer = ImageSerializer(image)
-            return Response(serializer.data)
-        except Image.DoesNotExist:
-            return Response(serializer.errors, status=status.HTTP_404_NOT_FOUND)
+        fields = ImageSerializer.requested_fields(request.query_params)
+
+        def retrieve():
+            images = Image.objects.all()
+            if fields is not None:
+                images = images.only(*ImageSerializer.model_fields(fields))
+            try:
+                image = images.get(id=id)
+                serializer = ImageSerializer(image, fields=fields)
+                return Response(serializer.data)
+            except Image.DoesNotExist:
+                return Response("Image does not exist", status=status.HTTP_404_NOT_FOUND)
+
+        return conditional_get(request, Image, retrieve, key=fieldset_key(id, fields))
 
     def put(self, request, id: int):
         """
@@ -223,11 +536,6 @@ class ImageDetailsView(APIView):
         Returns:
             Response: A Response object with updated image data or error message.
         """
-        username = check_access(request.headers)
-        user = User.objects.get(username=username)
-        if user.role.role != 'beta_player':
-            return Response("User not allowed to update the image", status=status.HTTP_401_UNAUTHORIZED)
-
         try:
             image = Image.objects.get(id=id)
             serializer = ImageSerializer(image, data=request.data)
@@ -249,11 +557,6 @@ class ImageDetailsView(APIView):
         Returns:
             Response: A Response object indicating success or failure.
         """
-        username = check_access(request.headers)
-        user = User.objects.get(username=username)
-        if user.role.role != 'beta_player':
-            return Response("User not allowed to delete the image", status=status.HTTP_401_UNAUTHORIZED)
-
         try:
             image = Image.objects.get(id=id)
             operator = image.delete()
@@ -264,21 +567,353 @@ class ImageDetailsView(APIView):
         except Image.DoesNotExist:
             return Response("Image does not exist", status=status.HTTP_404_NOT_FOUND)
 
+class ImageBatchView(APIView):
+    resource = RolePermission.Resource.IMAGE
+    # Which actions a batch needs depends on its body; see post.
+    permission_actions = {'POST': ()}
+
+    def post(self, request):
+        """
+        Deletes and re-describes many images in one transaction.
+
+        The body holds ``delete``, a list of image ids, and ``update``, a list
+        of ``{"id", "description"}`` objects. The user's role needs the
+        update permission when ``update`` is not empty and the delete
+        permission when ``delete`` is not empty. Unknown ids are skipped and
+        reported. Stored files that are no longer used are removed on a
+        background thread after the transaction commits.
+
+        Args:
+            request: The HTTP request.
+
+        Returns:
+            Response: A Response object with the number of deleted and updated images and the missing ids, or error message.
+        """
+        user = get_request_user(request)
+        serializer = ImageBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        delete_ids = serializer.validated_data['delete']
+        descriptions = {item['id']: item['description'] for item in serializer.validated_data['update']}
+        actions = []
+        if descriptions:
+            actions.append(RolePermission.Action.UPDATE)
+        if delete_ids:
+            actions.append(RolePermission.Action.DELETE)
+        if not has_permission(user, self.resource, *actions):
+            raise PermissionDenied(RoleBasedPermission.message)
+
+        with transaction.atomic():
+            images = Image.objects.only('id', 'description').in_bulk(list(descriptions))
+            for image_id, image in images.items():
+                image.description = descriptions[image_id]
+            Image.objects.bulk_update(images.values(), ['description'])
+
+            # Deleted instances lose their pk, so the ids are read up front.
+            found = set(Image.objects.select_for_update().filter(id__in=delete_ids).values_list('id', flat=True))
+            with defer_image_deletes() as deleted:
+                Image.objects.filter(id__in=found).delete()
+            self.release_files(deleted)
+            bump_version(Image)
+
+        found |= set(images)
+        return Response({
+            'deleted': len(deleted),
+            'updated': len(images),
+            'missing': sorted((set(delete_ids) - found) | (set(descriptions) - found)),
+        })
+
+    def release_files(self, images):
+        """
+        Releases the stored files of deleted images in bulk.
+
+        Args:
+            images (list): The deleted Image instances.
+        """
+        storage = Image._meta.get_field('image_file').storage
+        names = [image.image_file.name for image in images if image.image_file.name]
+        if hasattr(storage, 'release_many'):
+            unused = set(storage.release_many(names))
+            # Checks the Blob table, so it runs here rather than on the background thread.
+            transaction.on_commit(lambda: storage.delete_many(sorted(unused)))
+            later = []
+        else:
+            unused = set(names)
+            later = sorted(unused)
+        # Thumbnails belong to the stored file, so they go with it.
+        renditions = [name for image in images if image.image_file.name in unused for name in image.renditions.values()]
+        delete_files_later(storage, later + renditions)
+
+
+class ImageContentView(APIView):
+    def get(self, request, id: int):
+        """
+        Serves the stored bytes of an image, or of one of its thumbnails with ``?rendition=<label>``.
+
+        Supports single byte ranges, ETag/Last-Modified revalidation and
+        handing the copy to a front proxy; see api.files.
+
+        Args:
+            request: The HTTP request.
+            id: The ID of the image.
+
+        Returns:
+            HttpResponse: The file or part of it, 304, or error message.
+        """
+        check_access(request.headers)
+        try:
+            image = Image.objects.only('image_file', 'renditions').get(id=id)
+        except Image.DoesNotExist:
+            return Response("Image does not exist", status=status.HTTP_404_NOT_FOUND)
+
+        label = request.query_params.get('rendition')
+        name = image.renditions.get(label) if label else image.image_file.name
+        if not name:
+            return Response("Image file does not exist", status=status.HTTP_404_NOT_FOUND)
+        try:
+            return serve_file(request, image.image_file.storage, name)
+        except FileNotFoundError:
+            return Response("Image file does not exist", status=status.HTTP_404_NOT_FOUND)
+
+
+class ImageExportView(APIView):
+    def post(self, request):
+        """
+        Exports many images as one NumPy array.
+
+        The body holds ``ids``, ``width`` and ``height`` and optionally
+        ``mode``, ``fit``, ``normalize`` and ``format``; see
+        ImageExportSerializer. Images are decoded and resized in the export
+        pool and streamed as a (n, height, width, channels) array. Ids without
+        a stored file are left out. For up to IMAGE_EXPORT_HEADER_MAX_IDS
+        requested ids, the ``X-Image-Ids`` header lists the ids in array order
+        and ``X-Missing-Ids`` the ones left out; longer lists would overflow
+        proxy header buffers, so larger exports should use the .npz format,
+        whose ``ids`` array holds them. Images that fail to decode are
+        zero-filled, and listed in the ``failed`` array of .npz exports.
+
+        Args:
+            request: The HTTP request.
+
+        Returns:
+            StreamingHttpResponse: The .npy or .npz payload, or error message.
+        """
+        check_access(request.headers)
+        if export.np is None:
+            return Response("Exports require NumPy", status=status.HTTP_501_NOT_IMPLEMENTED)
+        serializer = ImageExportSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+
+        requested = list(dict.fromkeys(data['ids']))
+        images = Image.objects.exclude(image_file='').only('id', 'image_file').in_bulk(requested)
+        ids = [image_id for image_id in requested if image_id in images]
+        paths = [images[image_id].image_file.path for image_id in ids]
+        arrays = export.ArrayExport(
+            ids, paths, (data['width'], data['height']), data['mode'], data['fit'], data['normalize'])
+
+        if data['format'] == 'npz':
+            response = StreamingHttpResponse(arrays.npz(), content_type='application/zip')
+        else:
+            response = StreamingHttpResponse(arrays.npy(), content_type='application/octet-stream')
+            response['Content-Length'] = str(arrays.npy_size())
+        response['Content-Disposition'] = f'attachment; filename="images.{data["format"]}"'
+        if len(requested) <= getattr(settings, 'IMAGE_EXPORT_HEADER_MAX_IDS', 100):
+            response['X-Image-Ids'] = ','.join(map(str, ids))
+            response['X-Missing-Ids'] = ','.join(str(image_id) for image_id in requested if image_id not in images)
+        return response
+
+
+class SimilarImagesView(APIView):
+    def get(self, request, id: int):
+        """
+        Lists images that look like a specific image, closest first.
+
+        ``?distance=`` sets how many of the 64 hash bits may differ (default
+        IMAGE_SIMILAR_DISTANCE, at most 16) and ``?limit=`` the number of
+        results. Each result is the image data with its ``distance``.
+
+        Args:
+            request: The HTTP request.
+            id: The ID of the image.
+
+        Returns:
+            Response: A Response object with the similar images, or error message.
+        """
+        check_access(request.headers)
+        try:
+            distance = int(request.query_params.get('distance', getattr(settings, 'IMAGE_SIMILAR_DISTANCE', 10)))
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            raise ValidationError('distance and limit must be integers')
+        if not 0 <= distance <= similarity.MAX_DISTANCE or limit < 1:
+            raise ValidationError(f'distance must be between 0 and {similarity.MAX_DISTANCE} and limit positive')
+
+        phash = Image.objects.filter(id=id).values_list('phash', flat=True).first()
+        if phash is None:
+            if not Image.objects.filter(id=id).exists():
+                return Response("Image does not exist", status=status.HTTP_404_NOT_FOUND)
+            return Response("Image has not been processed yet", status=status.HTTP_409_CONFLICT)
+
+        matches = [match for match in similarity.get_index().search(similarity.from_db(phash), distance) if match[1] != id]
+        # Fetch some spare rows, since images deleted by other processes may still be indexed.
+        images = Image.objects.in_bulk([key for _, key in matches[:limit * 2]])
+        found = [(d, images[key]) for d, key in matches[:limit * 2] if key in images][:limit]
+        return Response([{**ImageSerializer(image).data, 'distance': d} for d, image in found])
+
+
+class UploadSessionListView(APIView):
+    resource = RolePermission.Resource.IMAGE
+
+    def post(self, request):
+        """
+        Opens a resumable upload; see api.uploads for the protocol.
+
+        Args:
+            request: The HTTP request.
+
+        Returns:
+            Response: A Response object with the session id and offset, or error message.
+        """
+        user = get_request_user(request)
+        serializer = UploadSessionSerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save(user=user)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UploadSessionDetailsView(APIView):
+    resource = RolePermission.Resource.IMAGE
+    # Sending and aborting chunks are part of creating an image.
+    permission_actions = {'PUT': (RolePermission.Action.CREATE,), 'DELETE': (RolePermission.Action.CREATE,)}
+    # PUT bodies are raw chunk bytes, read from the request stream by api.uploads.
+    parser_classes = []
+
+    def get(self, request, id):
+        """
+        Retrieves an upload session, so a client can resume from its offset.
+
+        Args:
+            request: The HTTP request.
+            id: The ID of the upload session.
+
+        Returns:
+            Response: A Response object with session data or error message.
+        """
+        user = get_request_user(request)
+        try:
+            session = UploadSession.objects.get(id=id, user=user)
+        except UploadSession.DoesNotExist:
+            return Response("Upload session does not exist", status=status.HTTP_404_NOT_FOUND)
+        return Response(UploadSessionSerializer(session).data)
+
+    def put(self, request, id):
+        """
+        Appends a chunk to an upload session.
+
+        The body holds the raw bytes and ``?offset=`` their position in the
+        file, which must equal the session's current offset.
+
+        Args:
+            request: The HTTP request.
+            id: The ID of the upload session.
+
+        Returns:
+            Response: A Response object with the new offset, 409 with the expected offset, or error message.
+        """
+        user = get_request_user(request)
+        try:
+            offset = int(request.query_params['offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response("offset and Content-Length are required", status=status.HTTP_400_BAD_REQUEST)
+        max_chunk = getattr(settings, 'IMAGE_UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 * 1024)
+        if not 0 < length <= max_chunk:
+            return Response(f"Chunks must be between 1 and {max_chunk} bytes", status=status.HTTP_400_BAD_REQUEST)
+        if not UploadSession.objects.filter(id=id, user=user).exists():
+            return Response("Upload session does not exist", status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            session = uploads.append_chunk(id, offset, length, request)
+        except uploads.Conflict as conflict:
+            return Response({'offset': conflict.offset}, status=status.HTTP_409_CONFLICT)
+        return Response({'id': session.id, 'offset': session.offset, 'size': session.size})
+
+    def delete(self, request, id):
+        """
+        Aborts an upload session and removes the received bytes.
+
+        Args:
+            request: The HTTP request.
+            id: The ID of the upload session.
+
+        Returns:
+            Response: A Response object indicating success or failure.
+        """
+        user = get_request_user(request)
+        try:
+            session = UploadSession.objects.get(id=id, user=user)
+        except UploadSession.DoesNotExist:
+            return Response("Upload session does not exist", status=status.HTTP_404_NOT_FOUND)
+        session.delete()
+        uploads.discard(uploads.part_path(session))
+        return Response(data={'data': 'deleted successfully'})
+
+
+class UploadSessionCompleteView(APIView):
+    resource = RolePermission.Resource.IMAGE
+
+    def post(self, request, id):
+        """
+        Completes an upload session and creates the image.
+
+        The body holds the ``sha256`` of the whole file. As for a regular
+        upload, thumbnails are generated in the background.
+
+        Args:
+            request: The HTTP request.
+            id: The ID of the upload session.
+
+        Returns:
+            Response: A Response object with the image id and processing status, or error message.
+        """
+        user = get_request_user(request)
+        if not UploadSession.objects.filter(id=id, user=user).exists():
+            return Response("Upload session does not exist", status=status.HTTP_404_NOT_FOUND)
+        try:
+            image = uploads.complete(id, request.data.get('sha256', ''))
+        except UploadSession.DoesNotExist:
+            return Response("Upload session does not exist", status=status.HTTP_404_NOT_FOUND)
+        enqueue_image_processing(image)
+        return Response({'id': image.id, 'status': image.status}, status=status.HTTP_202_ACCEPTED)
+
+
 class SubscriptionPlanListView(APIView):
+    resource = RolePermission.Resource.SUBSCRIPTION_PLAN
+
     def get(self, request):
         """
         Retrieves a list of subscription plans.
 
+        ``?fields=`` or ``?exclude=`` (comma separated) narrow the returned fields.
+
         Args:
             request: The HTTP request.
 
         Returns:
-            Response: A Response object with subscription plan data.
+            Response: A Response object with subscription plan data, or 304 if the client's copy is current.
         """
         check_access(request.headers)
-        subscription_plans = SubscriptionPlan.objects.all()
-        serializer = SubscriptionPlanSerializer(subscription_plans, many=True)
-        return Response(serializer.data)
+        fields = SubscriptionPlanSerializer.requested_fields(request.query_params)
+        return conditional_get(
+            request,
+            SubscriptionPlan,
+            lambda: Response(SubscriptionPlanSerializer(
+                catalog.subscription_plans.all().values(), many=True, fields=fields).data),
+            key=fieldset_key('', fields),
+        )
 
     def post(self, request):
         """
@@ -290,7 +925,6 @@ class SubscriptionPlanListView(APIView):
         Returns:
             Response: A Response object indicating success or failure.
         """
-        check_access(request.headers)
         serializer = SubscriptionPlanSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
@@ -298,6 +932,8 @@ class SubscriptionPlanListView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class SubscriptionPlanDetailsView(APIView):
+    resource = RolePermission.Resource.SUBSCRIPTION_PLAN
+
     def get(self, request, subscription_plan: str):
         """
         Retrieves details of a specific subscription plan.
@@ -307,15 +943,19 @@ class SubscriptionPlanDetailsView(APIView):
             subscription_plan: The subscription_plan of the subscription plan.
 
         Returns:
-            Response: A Response object with subscription plan data or error message.
+            Response: A Response object with subscription plan data, 304 if the client's copy is current, or error message.
         """
         check_access(request.headers)
-        try:
-            subscription_plan = SubscriptionPlan.objects.get(subscription_plan=subscription_plan)
-            serializer = SubscriptionPlanSerializer(subscription_plan)
+        fields = SubscriptionPlanSerializer.requested_fields(request.query_params)
+
+        def retrieve():
+            plan = catalog.subscription_plans.get(subscription_plan)
+            if plan is None:
+                return Response("Subscription plan does not exist", status=status.HTTP_404_NOT_FOUND)
+            serializer = SubscriptionPlanSerializer(plan, fields=fields)
             return Response(serializer.data)
-        except SubscriptionPlan.DoesNotExist:
-            return Response(serializer.errors, status=status.HTTP_404_NOT_FOUND)
+
+        return conditional_get(request, SubscriptionPlan, retrieve, key=fieldset_key(subscription_plan, fields))
 
     def put(self, request, subscription_plan: str):
         """
@@ -328,7 +968,6 @@ class SubscriptionPlanDetailsView(APIView):
         Returns:
             Response: A Response object with updated subscription plan data or error message.
         """
-        check_access(request.headers)
         try:
             subscription_plan = SubscriptionPlan.objects.get(subscription_plan=subscription_plan)
             serializer = SubscriptionPlanSerializer(subscription_plan, data=request.data)
@@ -350,7 +989,6 @@ class SubscriptionPlanDetailsView(APIView):
         Returns:
             Response: A Response object indicating success or failure.
         """
-        check_access(request.headers)
         try:
             subscription_plan = SubscriptionPlan.objects.get(subscription_plan=subscription_plan)
             operator = subscription_plan.delete()
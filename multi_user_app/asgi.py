@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'multi_user_app.settings')
+# Serve the image and login routes with the async views in api.async_views.
+os.environ.setdefault('DJANGO_ROOT_URLCONF', 'multi_user_app.asgi_urls')
 
 application = get_asgi_application()
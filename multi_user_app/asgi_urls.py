@@ -0,0 +1,17 @@
+"""
+URL configuration used by the ASGI deployment (see multi_user_app.asgi).
+
+The image and login routes are served by the async views in api.async_views;
+every other route is the same as in multi_user_app.urls.
+"""
+from django.contrib import admin
+from django.urls import path, include
+from api.async_views import AsyncImageDetailsView, AsyncImageListView, AsyncLoginView
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('login/', AsyncLoginView.as_view(), name="login"),
+    path('images/<int:id>/', AsyncImageDetailsView.as_view(), name='image-details'),
+    path('images/', AsyncImageListView.as_view(), name='image-list'),
+    path('', include('api.urls')),
+]
@@ -0,0 +1,92 @@
+"""
+Cache configuration driven by environment variables.
+
+The ``default`` cache is api.cache_backends.TwoTierCache: each worker keeps
+recently read entries for CACHE_LOCAL_TTL seconds in front of the ``shared``
+cache, which every worker of the deployment uses. CACHE_BACKEND selects the
+shared cache:
+
+- ``locmem`` (default): no shared tier; ``default`` is a per-process memory
+  cache. Fine for a single process; run several workers with ``redis``.
+- ``redis``: Redis (or any server speaking its protocol) at CACHE_REDIS_URL,
+  shared by every host. Needs the ``redis`` package.
+- ``file``: files in CACHE_DIR (api.cache_backends.FileCache), shared by the
+  workers of one host without running a server. Every write touches the
+  disk, so it suits low traffic only.
+
+Rate limit counters are written on every limited request and live in the
+``counters`` cache: Redis with the ``redis`` backend, otherwise memory, in
+which case each worker keeps its own counters.
+
+Keys are prefixed with a digest of the default database, so a cache shared by
+deployments, or by the test runner, never serves one database's snapshots to
+another. CACHE_KEY_PREFIX overrides it.
+"""
+import hashlib
+import os
+
+
+def database_prefix(database: dict) -> str:
+    """
+    Derives a cache key prefix identifying a database.
+
+    Args:
+        database (dict): A DATABASES entry.
+
+    Returns:
+        str: A short digest of its engine, host, port and name.
+    """
+    identity = ':'.join(str(database.get(name, '')) for name in ('ENGINE', 'HOST', 'PORT', 'NAME'))
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()[:12]
+
+
+def get_caches(base_dir, database: dict = None, env=os.environ) -> dict:
+    """
+    Builds the CACHES setting.
+
+    Args:
+        base_dir (Path): Project directory, used for the default cache directory.
+        database (dict): The default DATABASES entry, used for the key prefix.
+        env (dict): Environment to read from.
+
+    Returns:
+        dict: The CACHES setting.
+    """
+    backend = env.get('CACHE_BACKEND', 'locmem').lower()
+    prefix = env.get('CACHE_KEY_PREFIX', database_prefix(database) if database else '')
+    memory = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
+    if backend == 'locmem':
+        return {'default': memory}
+
+    if backend == 'redis':
+        shared = {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': env.get('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/0'),
+            'KEY_PREFIX': prefix,
+        }
+        counters = shared
+    elif backend == 'file':
+        shared = {
+            'BACKEND': 'api.cache_backends.FileCache',
+            'LOCATION': env.get('CACHE_DIR', base_dir / 'cache'),
+            'KEY_PREFIX': prefix,
+            # Versions are kept per user, so keep well above Django's default of 300.
+            'OPTIONS': {'MAX_ENTRIES': int(env.get('CACHE_MAX_ENTRIES', 100000))},
+        }
+        counters = {**memory, 'LOCATION': 'counters'}
+    else:
+        raise ValueError(f"Unsupported CACHE_BACKEND '{backend}'. Use 'locmem', 'redis' or 'file'.")
+
+    return {
+        'default': {
+            'BACKEND': 'api.cache_backends.TwoTierCache',
+            'LOCATION': 'shared',
+            'OPTIONS': {
+                'LOCAL_TTL': float(env.get('CACHE_LOCAL_TTL', 1)),
+                'LOCAL_MAX_ENTRIES': int(env.get('CACHE_LOCAL_MAX_ENTRIES', 10000)),
+            },
+        },
+        'shared': shared,
+        'counters': counters,
+    }
@@ -0,0 +1,103 @@
+"""
+Database configuration driven by environment variables.
+
+DATABASE_ENGINE selects the backend:
+
+- ``sqlite`` (default): a single file, tuned for concurrent workers with WAL
+  journaling. The journal mode is stored in the file, so migration
+  ``api.0018_sqlite_journal_mode`` sets it once; the pragmas returned by
+  ``sqlite_pragmas`` are per connection and applied to every new one by
+  ``api.signals.apply_sqlite_pragmas``.
+- ``postgres``: PostgreSQL with persistent connections, or a psycopg 3
+  connection pool when DATABASE_POOL is set.
+"""
+import os
+
+import django
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def get_databases(base_dir, env=os.environ) -> dict:
+    """
+    Builds the DATABASES setting.
+
+    Args:
+        base_dir (Path): Project directory, used for the default SQLite file.
+        env (dict): Environment to read from.
+
+    Returns:
+        dict: The DATABASES setting.
+    """
+    engine = env.get('DATABASE_ENGINE', 'sqlite').lower()
+
+    if engine in ('postgres', 'postgresql'):
+        database = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': env.get('DATABASE_NAME', 'multi_user_app'),
+            'USER': env.get('DATABASE_USER', ''),
+            'PASSWORD': env.get('DATABASE_PASSWORD', ''),
+            'HOST': env.get('DATABASE_HOST', 'localhost'),
+            'PORT': env.get('DATABASE_PORT', '5432'),
+            'CONN_MAX_AGE': int(env.get('DATABASE_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+        if env.get('DATABASE_POOL', '').lower() in TRUE_VALUES:
+            # Pooled connections are returned to the pool after each request,
+            # which Django requires to be combined with CONN_MAX_AGE = 0.
+            database['CONN_MAX_AGE'] = 0
+            database['OPTIONS']['pool'] = {
+                'min_size': int(env.get('DATABASE_POOL_MIN_SIZE', 2)),
+                'max_size': int(env.get('DATABASE_POOL_MAX_SIZE', 10)),
+            }
+        return {'default': database}
+
+    if engine != 'sqlite':
+        raise ValueError(f"Unsupported DATABASE_ENGINE '{engine}'. Use 'sqlite' or 'postgres'.")
+
+    database = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': env.get('DATABASE_NAME', base_dir / 'db.sqlite3'),
+        'CONN_MAX_AGE': int(env.get('DATABASE_CONN_MAX_AGE', 0)),
+        'OPTIONS': {
+            # Seconds a connection waits on a locked database before failing.
+            'timeout': float(env.get('SQLITE_TIMEOUT', 20)),
+        },
+    }
+    if django.VERSION >= (5, 1):
+        # Take the write lock when the transaction starts, so the busy timeout
+        # applies instead of failing when a read transaction upgrades to a write.
+        database['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+    return {'default': database}
+
+
+def sqlite_journal_mode(env=os.environ) -> str:
+    """
+    Returns the journal mode the SQLite database file is switched to when migrated.
+
+    Args:
+        env (dict): Environment to read from.
+
+    Returns:
+        str: A journal_mode pragma value.
+    """
+    return env.get('SQLITE_JOURNAL_MODE', 'WAL')
+
+
+def sqlite_pragmas(env=os.environ) -> dict:
+    """
+    Returns the pragmas applied to every SQLite connection.
+
+    Args:
+        env (dict): Environment to read from.
+
+    Returns:
+        dict: Pragma names mapped to values.
+    """
+    return {
+        'synchronous': env.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(float(env.get('SQLITE_TIMEOUT', 20)) * 1000),
+        'mmap_size': int(env.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'foreign_keys': 'ON',
+    }
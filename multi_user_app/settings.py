@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from multi_user_app.caches import get_caches
+from multi_user_app.database import get_databases, sqlite_journal_mode, sqlite_pragmas
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -49,13 +53,26 @@ AUTHENTICATION_BACKENDS = [
 AUTH_USER_MODEL = 'api.User'
 
 
+# Requests are authenticated with the tokens issued by api.utils (see
+# api.authentication.BearerTokenAuthentication). A missing, invalid or expired
+# token leaves the request anonymous, so public endpoints still answer a
+# client sending a stale one.
+# NUM_PROXIES is the number of reverse proxies in front of the app. Client IPs
+# for throttling are read from X-Forwarded-For only that many hops deep; with
+# the default of 0 the header is ignored, since clients can set it themselves.
+
 REST_FRAMEWORK = {
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.BearerTokenAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': [
+        'api.permissions.RoleBasedPermission',
     ],
 }
 
 MIDDLEWARE = [
+    'api.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,7 +83,9 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'multi_user_app.urls'
+# multi_user_app.asgi switches to multi_user_app.asgi_urls, which routes the
+# image and login endpoints to async views.
+ROOT_URLCONF = os.environ.get('DJANGO_ROOT_URLCONF', 'multi_user_app.urls')
 
 TEMPLATES = [
     {
@@ -90,12 +109,31 @@ WSGI_APPLICATION = 'multi_user_app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# DATABASE_ENGINE=sqlite (default) or postgres; see multi_user_app/database.py
+# for the other environment variables.
+
+DATABASES = get_databases(BASE_DIR)
+
+SQLITE_JOURNAL_MODE = sqlite_journal_mode()
+
+SQLITE_PRAGMAS = sqlite_pragmas()
+
+
+# Caches
+# CACHE_BACKEND=locmem (default), redis or file; see multi_user_app/caches.py
+# for the other environment variables. Use redis when running several workers:
+# they share ETag versions, login rate limits and the role, plan and
+# permission snapshots through the shared tier. CACHE_SNAPSHOT_TIMEOUT is how
+# long a snapshot is kept there.
+
+CACHES = get_caches(BASE_DIR, DATABASES['default'])
+
+CACHE_SNAPSHOT_TIMEOUT = 3600
+
+# Tests run against their own cache directory instead of the application's,
+# with the per-request log silenced.
+
+TEST_RUNNER = 'multi_user_app.test_runner.IsolatedTestRunner'
 
 
 # Password validation
@@ -134,10 +172,203 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded images are deduplicated by content hash (see api.storage).
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'images': {
+        'BACKEND': 'api.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# JWTs issued by api.utils. Lifetimes are in minutes; refresh tokens are
+# rotated on every use (token/refresh/). With JWT_EMBED_CLAIMS, tokens carry
+# the user's id, role, plan and version, so requests are authorized without
+# loading the user until the user changes.
+
+JWT_SIGNING_KEY = SECRET_KEY
+
+JWT_ACCESS_TOKEN_LIFETIME = 15
+
+JWT_REFRESH_TOKEN_LIFETIME = 7 * 24 * 60
+
+JWT_EMBED_CLAIMS = True
+
+# Verified JWT cache used by api.utils.decode_token
+
+TOKEN_CACHE_SIZE = 10000
+
+TOKEN_CACHE_TTL = 300
+
+# Resolved-user cache used by api.authentication.get_user (0 disables it)
+
+USER_CACHE_SIZE = 1000
+
+USER_CACHE_TTL = 30
+
+# Image listing
+# Keyset pagination page sizes and the row batch used by ?stream=1.
+
+IMAGE_LIST_PAGE_SIZE = 50
+
+IMAGE_LIST_MAX_PAGE_SIZE = 500
+
+IMAGE_STREAM_CHUNK_SIZE = 500
+
+# Bulk registration (register/bulk/)
+# Passwords are hashed in a process pool once a request has at least
+# PASSWORD_HASHING_POOL_THRESHOLD of them; None uses one worker per CPU.
+
+BULK_REGISTER_MAX_ROWS = 10000
+
+BULK_REGISTER_BATCH_SIZE = 500
+
+PASSWORD_HASHING_WORKERS = None
+
+PASSWORD_HASHING_POOL_THRESHOLD = 4
+
+# Login
+# Passwords are verified in a pool of LOGIN_VERIFY_WORKERS processes, which
+# caps how many hashes run at once; logins beyond LOGIN_VERIFY_QUEUE_LIMIT
+# pending checks get 429. The request thread still waits for its check, so
+# without the need for that cap 0 is cheaper: it checks inline, skipping IPC.
+# Token bucket rates are applied per client IP and per username before any
+# hashing; None disables a bucket. Unknown usernames are remembered in the
+# shared cache for LOGIN_NEGATIVE_CACHE_TTL seconds (0 disables it).
+
+LOGIN_VERIFY_WORKERS = 2
+
+LOGIN_VERIFY_QUEUE_LIMIT = 32
+
+LOGIN_THROTTLE_RATES = {
+    'ip': '30/min',
+    'username': '10/min',
+}
+
+LOGIN_NEGATIVE_CACHE_TTL = 60
+
+# Image upload processing
+# Thumbnails are generated by a process pool after the upload is stored.
+# IMAGE_PROCESSING_EAGER processes uploads inline instead (useful in tests).
+
+IMAGE_PROCESSING_WORKERS = 2
+
+IMAGE_PROCESSING_EAGER = False
+
+IMAGE_THUMBNAIL_SIZES = {
+    'small': 128,
+    'medium': 512,
+}
+
+# Role permissions (api.permissions)
+# Which actions each role may perform on images, roles and subscription plans
+# is stored in the RolePermission table. Roles created later, and the
+# existing roles when the table was added, start with the grants below.
+
+DEFAULT_ROLE_PERMISSIONS = {
+    'beta_player': {
+        'image': ['create', 'update', 'delete'],
+        'role': ['create', 'update', 'delete'],
+        'subscription_plan': ['create', 'update', 'delete'],
+    },
+}
+
+# Fast list serialization (api.fastpath)
+# Image and role list pages are serialized from values_list() rows and
+# rendered with orjson when installed; the output matches the DRF serializers.
+
+FAST_LIST_SERIALIZATION = True
+
+# Near-duplicate detection (api.similarity)
+# Processed images get a 64-bit difference hash. images/<id>/similar/ lists
+# images within IMAGE_SIMILAR_DISTANCE differing bits by default. Uploads
+# within IMAGE_DUPLICATE_DISTANCE bits of a stored image are rejected with
+# 409; None accepts them. Every IMAGE_SIMILARITY_INDEX_TTL seconds each
+# process updates its hash index in the background from a journal of changes
+# kept in the shared cache, to see images hashed or deleted by other processes.
+
+IMAGE_SIMILAR_DISTANCE = 10
+
+IMAGE_DUPLICATE_DISTANCE = None
+
+IMAGE_SIMILARITY_INDEX_TTL = 300
+
+# Image exports (images/export/)
+# Images are decoded in a pool of IMAGE_EXPORT_WORKERS processes (0 decodes
+# them inline) and streamed in batches of IMAGE_EXPORT_BATCH_SIZE images; at
+# most one batch of decodes is queued ahead of the client.
+
+IMAGE_EXPORT_WORKERS = 2
+
+IMAGE_EXPORT_BATCH_SIZE = 32
+
+IMAGE_EXPORT_MAX_IMAGES = 1000
+
+IMAGE_EXPORT_MAX_EDGE = 1024
+
+# Exports of up to this many ids list them in the X-Image-Ids and
+# X-Missing-Ids headers; larger lists would not fit in proxy header buffers.
+
+IMAGE_EXPORT_HEADER_MAX_IDS = 100
+
+# Batch image operations (images/batch/)
+
+IMAGE_BATCH_MAX_SIZE = 1000
+
+# Resumable uploads (images/uploads/)
+
+IMAGE_UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+
+IMAGE_UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+
+# Image content (images/<id>/content/)
+# Set IMAGE_SENDFILE_BACKEND to 'x-accel-redirect' (nginx, with an internal
+# location at IMAGE_SENDFILE_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile'
+# to let the front proxy send the bytes.
+
+IMAGE_CONTENT_MAX_AGE = 86400
+
+IMAGE_SENDFILE_BACKEND = None
+
+IMAGE_SENDFILE_PREFIX = '/protected/'
+
+# Request instrumentation (api.middleware.QueryInstrumentationMiddleware)
+# Every request logs one JSON line on the 'api.requests' logger; requests
+# slower than SLOW_REQUEST_THRESHOLD_MS are logged as warnings with their
+# statements grouped by fingerprint, without their values. SERVER_TIMING adds
+# the timings to responses as a Server-Timing header, which any client can
+# read, so it is off by default.
+
+SLOW_REQUEST_THRESHOLD_MS = 500
+
+SERVER_TIMING = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTALS = True
\ No newline at end of file
@@ -0,0 +1,41 @@
+"""
+Test runner isolating the test suite from the running application.
+
+The shared cache lives outside the database, so without this the test suite
+would read and clear the application's cache. Tests get the file-based shared
+cache in a temporary directory instead, removed when the run ends. The
+'api.requests' log is silenced too, as the password hashing in register and
+login makes those requests slow enough to be logged; tests that check the log
+capture it with assertLogs.
+"""
+import logging
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from multi_user_app.caches import get_caches
+
+
+class IsolatedTestRunner(DiscoverRunner):
+    """
+    DiscoverRunner giving the run its own cache directory and a quiet request log.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.mkdtemp(prefix='test-cache-')
+        self._cache_override = override_settings(
+            CACHES=get_caches(settings.BASE_DIR, settings.DATABASES['default'],
+                              env={'CACHE_BACKEND': 'file', 'CACHE_DIR': self._cache_dir}))
+        self._cache_override.enable()
+        self._request_logger = logging.getLogger('api.requests')
+        self._request_log_level = self._request_logger.level
+        self._request_logger.setLevel(logging.CRITICAL)
+
+    def teardown_test_environment(self, **kwargs):
+        self._request_logger.setLevel(self._request_log_level)
+        self._cache_override.disable()
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)